@@ -1,3 +1,83 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from orders.models import Order, OrderItem, OrderStatusHistory
+from products.models import Category, Product, ProductVariant
+
+ORDER_FIELDS = {
+    'subtotal': Decimal('100.00'),
+    'total': Decimal('100.00'),
+    'shipping_full_name': 'Test Buyer',
+    'shipping_phone': '0300',
+    'shipping_address_line1': 'Street 1',
+    'shipping_city': 'Lahore',
+    'shipping_state': 'Punjab',
+    'shipping_country': 'Pakistan',
+    'shipping_postal_code': '54000',
+}
+
+
+class OrderHistoryTests(TestCase):
+    """Order pages cost a fixed number of queries however many orders and items there are"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='x')
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.product = Product.objects.create(name='Runner', slug='runner', sku='RUN', description='',
+                                             category=category, price=100, stock=5)
+        cls.variant = ProductVariant.objects.create(product=cls.product, name='Size', value='42', sku='RUN-42')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Session and header badge lookups that only the first request pays for
+        self.client.get(reverse('accounts:order_history'))
+
+    def add_orders(self, count, items=1):
+        orders = [
+            Order.objects.create(user=self.user, items_count=items, first_item_name='Runner', **ORDER_FIELDS)
+            for _ in range(count)
+        ]
+        for order in orders:
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=self.product, variant=self.variant, product_name='Runner',
+                          product_sku='RUN', variant_name='Size', quantity=1, unit_price=100, total_price=100)
+                for _ in range(items)
+            ])
+            OrderStatusHistory.objects.bulk_create([
+                OrderStatusHistory(order=order, status=status) for status in ('pending', 'shipped')
+            ])
+        return orders
+
+    def page_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in captured]
+
+    def test_history_is_paginated_without_items(self):
+        self.add_orders(25, items=3)
+        response, queries = self.page_queries(reverse('accounts:order_history'))
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 10)
+        self.assertTrue(page.has_next())
+        self.assertFalse([sql for sql in queries if 'FROM "orders_orderitem"' in sql])
+
+        seen = {order.pk for order in page}
+        while page.has_next():
+            response, more = self.page_queries(reverse('accounts:order_history') + f'?cursor={page.next_cursor}')
+            page = response.context['page_obj']
+            self.assertEqual(len(more), len(queries), more)
+            seen |= {order.pk for order in page}
+        self.assertEqual(len(seen), 25)
 
-# Create your tests here.
+    def test_detail_queries_do_not_grow_with_items(self):
+        small, large = self.add_orders(1, items=1)[0], self.add_orders(1, items=20)[0]
+        _, expected = self.page_queries(reverse('accounts:order_detail', args=[small.order_number]))
+        response, queries = self.page_queries(reverse('accounts:order_detail', args=[large.order_number]))
+        self.assertEqual(len(queries), len(expected), queries)
+        self.assertContains(response, 'Size: 42', count=20)
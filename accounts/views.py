@@ -3,9 +3,12 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.views import PasswordResetView, PasswordResetConfirmView
+from django.db.models import Prefetch
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, UserProfileForm, AddressForm
 from .models import Address
-from orders.models import Order
+from orders.models import Order, OrderItem
+from products.images import prefetch_manifests
+from products.pagination import KeysetPaginator
 
 
 def register(request):
@@ -73,15 +76,24 @@ def profile(request):
 
 @login_required
 def order_history(request):
-    """User order history"""
-    orders = Order.objects.filter(user=request.user).prefetch_related('items')
-    return render(request, 'accounts/order_history.html', {'orders': orders})
+    """User order history, newest first; rows carry their own item summary"""
+    orders = Order.objects.filter(user=request.user)
+    paginator = KeysetPaginator(orders, ('-created_at', '-id'), per_page=10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    prefetch_manifests(order.first_item_image for order in page_obj)
+    return render(request, 'accounts/order_history.html', {'orders': page_obj, 'page_obj': page_obj})
 
 
 @login_required
 def order_detail(request, order_number):
     """Order detail view"""
-    order = get_object_or_404(Order, order_number=order_number, user=request.user)
+    orders = Order.objects.prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product', 'variant')),
+        'status_history',
+    )
+    order = get_object_or_404(orders, order_number=order_number, user=request.user)
+    prefetch_manifests(item.variant.image if item.variant and item.variant.image else item.product.main_image
+                       for item in order.items.all())
     return render(request, 'accounts/order_detail.html', {'order': order})
 
 
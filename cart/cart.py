@@ -1,15 +1,148 @@
+from django.db.models import Sum
+from django.utils.functional import cached_property
 from products.models import Product, ProductVariant
+from .models import Cart as CartRecord, CartItem
 
+# Item count of a database cart, cached in the session for header badges
+COUNT_SESSION_KEY = 'cart_count'
 
-class Cart:
-    """Shopping cart class for session-based cart"""
+
+def cart_key(product_id, variant_id=None):
+    key = str(product_id)
+    if variant_id:
+        key += f"-{variant_id}"
+    return key
+
+
+class SessionCartStorage:
+    """Cart entries in the session, for anonymous visitors"""
+    
+    def __init__(self, request):
+        self.session = request.session
+    
+    def load(self):
+        # Stored in the session only once something is added, so reading an empty cart writes nothing
+        return self.session.get('cart') or {}
+    
+    def count(self, load):
+        return sum(item['quantity'] for item in load().values())
+    
+    def write(self, cart, keys):
+        self.session['cart'] = cart
+    
+    def delete(self, cart, keys):
+        self.session['cart'] = cart
+    
+    def clear(self):
+        self.session.pop('cart', None)
+
+
+class DatabaseCartStorage:
+    """Cart entries as CartItem rows, for signed-in users (kept across devices)"""
     
     def __init__(self, request):
+        self.user = request.user
         self.session = request.session
-        cart = self.session.get('cart')
-        if not cart:
-            cart = self.session['cart'] = {}
-        self.cart = cart
+    
+    def load(self):
+        rows = CartItem.objects.filter(cart__user=self.user).values_list(
+            'key', 'product_id', 'variant_id', 'quantity', 'product__price'
+        )
+        cart = {
+            key: {
+                'product_id': str(product_id),
+                'variant_id': str(variant_id) if variant_id else None,
+                'quantity': quantity,
+                'price': str(price),
+            }
+            for key, product_id, variant_id, quantity, price in rows
+        }
+        # Also picks up changes made on other devices
+        self.session[COUNT_SESSION_KEY] = sum(item['quantity'] for item in cart.values())
+        return cart
+    
+    def count(self, load):
+        count = self.session.get(COUNT_SESSION_KEY)
+        if count is None:
+            count = CartItem.objects.filter(cart__user=self.user).aggregate(count=Sum('quantity'))['count'] or 0
+            self.session[COUNT_SESSION_KEY] = count
+        return count
+    
+    def write(self, cart, keys):
+        """Upsert the given entries in one statement"""
+        record, _ = CartRecord.objects.get_or_create(user=self.user)
+        upsert_items(record, {key: cart[key] for key in keys})
+        self.session.pop(COUNT_SESSION_KEY, None)
+    
+    def delete(self, cart, keys):
+        CartItem.objects.filter(cart__user=self.user, key__in=keys).delete()
+        self.session.pop(COUNT_SESSION_KEY, None)
+    
+    def clear(self):
+        CartItem.objects.filter(cart__user=self.user).delete()
+        self.session.pop(COUNT_SESSION_KEY, None)
+
+
+def upsert_items(record, entries):
+    """Insert or update ``{key: entry}`` in a database cart with a single bulk_create"""
+    CartItem.objects.bulk_create(
+        [
+            CartItem(
+                cart=record,
+                key=key,
+                product_id=int(entry['product_id']),
+                variant_id=int(entry['variant_id']) if entry.get('variant_id') else None,
+                quantity=entry['quantity'],
+            )
+            for key, entry in entries.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['cart', 'key'],
+        update_fields=['quantity'],
+    )
+
+
+def merge_session_cart(request, user):
+    """Add a visitor's session cart to their database cart when they sign in"""
+    session_cart = request.session.pop('cart', None)
+    if not session_cart:
+        return
+    
+    # Skip entries for products or variants deleted since they were added
+    product_ids = set(Product.objects.filter(
+        pk__in={int(item['product_id']) for item in session_cart.values()}
+    ).values_list('pk', flat=True))
+    variant_ids = set(ProductVariant.objects.filter(
+        pk__in={int(item['variant_id']) for item in session_cart.values() if item.get('variant_id')}
+    ).values_list('pk', flat=True))
+    entries = {
+        key: item for key, item in session_cart.items()
+        if int(item['product_id']) in product_ids
+        and (not item.get('variant_id') or int(item['variant_id']) in variant_ids)
+    }
+    if entries:
+        record, _ = CartRecord.objects.get_or_create(user=user)
+        existing = dict(CartItem.objects.filter(cart=record, key__in=entries).values_list('key', 'quantity'))
+        upsert_items(record, {
+            key: dict(item, quantity=existing.get(key, 0) + item['quantity']) for key, item in entries.items()
+        })
+    request.session.pop(COUNT_SESSION_KEY, None)
+
+
+class Cart:
+    """Shopping cart: session storage for visitors, database storage for signed-in users"""
+    
+    def __init__(self, request):
+        self.request = request
+        if request.user.is_authenticated:
+            self.storage = DatabaseCartStorage(request)
+        else:
+            self.storage = SessionCartStorage(request)
+    
+    @cached_property
+    def cart(self):
+        """Entries by cart key: product_id, variant_id, quantity and price"""
+        return self.storage.load()
     
     def add(self, product, variant=None, quantity=1, update_quantity=False):
         """Add product to cart or update quantity"""
@@ -17,12 +150,10 @@ class Cart:
         variant_id = str(variant.id) if variant else None
         
         # Create cart key
-        cart_key = f"{product_id}"
-        if variant_id:
-            cart_key += f"-{variant_id}"
+        key = cart_key(product_id, variant_id)
         
-        if cart_key not in self.cart:
-            self.cart[cart_key] = {
+        if key not in self.cart:
+            self.cart[key] = {
                 'product_id': product_id,
                 'variant_id': variant_id,
                 'quantity': 0,
@@ -30,66 +161,82 @@ class Cart:
             }
         
         if update_quantity:
-            self.cart[cart_key]['quantity'] = quantity
+            self.cart[key]['quantity'] = quantity
         else:
-            self.cart[cart_key]['quantity'] += quantity
+            self.cart[key]['quantity'] += quantity
         
-        self.save()
+        self.save([key])
+    
+    def save(self, keys):
+        """Write changed entries to storage"""
+        self.storage.write(self.cart, keys)
+        self._forget_lines()
     
-    def save(self):
-        """Save cart to session"""
-        self.session.modified = True
+    def _forget_lines(self):
+        # Lines resolved earlier in this request are stale now
+        self.request.__dict__.pop('_cart_lines', None)
     
     def remove(self, product_id, variant_id=None):
         """Remove product from cart"""
-        cart_key = str(product_id)
-        if variant_id:
-            cart_key += f"-{variant_id}"
-        
-        if cart_key in self.cart:
-            del self.cart[cart_key]
-            self.save()
+        key = cart_key(product_id, variant_id)
+        if key in self.cart:
+            del self.cart[key]
+            self.storage.delete(self.cart, [key])
+            self._forget_lines()
     
     def update_quantity(self, product_id, variant_id, quantity):
         """Update product quantity"""
-        cart_key = str(product_id)
-        if variant_id:
-            cart_key += f"-{variant_id}"
-        
-        if cart_key in self.cart:
-            self.cart[cart_key]['quantity'] = quantity
-            self.save()
+        key = cart_key(product_id, variant_id)
+        if key in self.cart:
+            self.cart[key]['quantity'] = quantity
+            self.save([key])
     
     def clear(self):
         """Clear cart"""
-        del self.session['cart']
-        self.save()
+        self.storage.clear()
+        self.cart = {}
+        self._forget_lines()
     
     def __iter__(self):
         """Iterate over cart items"""
-        product_ids = [int(item['product_id']) for item in self.cart.values()]
-        products = Product.objects.filter(id__in=product_ids)
+        return iter(self.lines())
+    
+    def lines(self):
+        """Cart entries with their products and variants, resolved once per request"""
+        lines = getattr(self.request, '_cart_lines', None)
+        if lines is None:
+            lines = self.request._cart_lines = self._resolve_lines()
+        return lines
+    
+    def _resolve_lines(self):
+        products = Product.objects.in_bulk({int(item['product_id']) for item in self.cart.values()})
+        variants = ProductVariant.objects.in_bulk(
+            {int(item['variant_id']) for item in self.cart.values() if item.get('variant_id')}
+        )
+        
+        lines, stale = [], []
+        for key, item in self.cart.items():
+            product = products.get(int(item['product_id']))
+            variant = variants.get(int(item['variant_id'])) if item.get('variant_id') else None
+            if product is None or (item.get('variant_id') and variant is None):
+                # Deleted since it was added
+                stale.append(key)
+                continue
+            # Copies, so model instances never end up in the session
+            line = dict(item, product=product, total_price=float(item['price']) * item['quantity'])
+            if variant:
+                line['variant'] = variant
+            lines.append(line)
         
-        cart = self.cart.copy()
-        for product in products:
-            for key, item in cart.items():
-                if item['product_id'] == str(product.id):
-                    item['product'] = product
-                    item['total_price'] = float(item['price']) * item['quantity']
-                    
-                    # Get variant if exists
-                    if item.get('variant_id'):
-                        try:
-                            variant = ProductVariant.objects.get(id=int(item['variant_id']))
-                            item['variant'] = variant
-                        except ProductVariant.DoesNotExist:
-                            pass
-                    
-                    yield item
+        if stale:
+            for key in stale:
+                del self.cart[key]
+            self.storage.delete(self.cart, stale)
+        return lines
     
     def __len__(self):
         """Count cart items"""
-        return sum(item['quantity'] for item in self.cart.values())
+        return self.storage.count(lambda: self.cart)
     
     def get_total_price(self):
         """Calculate total price"""
@@ -1,6 +1,7 @@
+from django.utils.functional import SimpleLazyObject
 from .cart import Cart
 
 
 def cart(request):
-    """Make cart available in all templates"""
-    return {'cart': Cart(request)}
+    """Make cart available in all templates (built only when a template reads it)"""
+    return {'cart': SimpleLazyObject(lambda: Cart(request))}
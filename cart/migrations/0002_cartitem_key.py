@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+def fill_keys(apps, schema_editor):
+    CartItem = apps.get_model('cart', 'CartItem')
+    items = list(CartItem.objects.only('product_id', 'variant_id'))
+    for item in items:
+        item.key = f'{item.product_id}-{item.variant_id}' if item.variant_id else str(item.product_id)
+    CartItem.objects.bulk_update(items, ['key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='cartitem',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='key',
+            field=models.CharField(default='', max_length=50),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_keys, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='cartitem',
+            unique_together={('cart', 'key')},
+        ),
+    ]
@@ -31,6 +31,9 @@ class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True)
+    # "<product id>" or "<product id>-<variant id>", as in session carts; unlike the
+    # nullable variant column it is a usable conflict target for upserts
+    key = models.CharField(max_length=50)
     quantity = models.IntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
     
@@ -49,4 +52,4 @@ class CartItem(models.Model):
         return self.unit_price * self.quantity
     
     class Meta:
-        unique_together = ['cart', 'product', 'variant']
+        unique_together = ['cart', 'key']
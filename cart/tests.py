@@ -1,3 +1,148 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
+from django.template import RequestContext, Template
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from products.models import Category, Product, ProductVariant
+from .cart import COUNT_SESSION_KEY
+from .models import Cart, CartItem
 
-# Create your tests here.
+
+class CartIterationTests(TestCase):
+    """Cart lines are resolved with one query per table, whatever the cart size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.products = [
+            Product.objects.create(
+                name=f'Runner {i}', slug=f'runner-{i}', sku=f'RUN-{i}',
+                description='', category=category, price=100 + i, stock=10,
+            )
+            for i in range(50)
+        ]
+        cls.variants = [
+            ProductVariant.objects.create(product=product, name='Size', value='42', sku=f'RUN-{i}-42')
+            for i, product in enumerate(cls.products[:25])
+        ]
+
+    def fill_cart(self, count):
+        """Session cart with ``count`` lines, half of them variants"""
+        cart = {}
+        for i, product in enumerate(self.products[:count]):
+            variant = self.variants[i] if i < len(self.variants) and i % 2 else None
+            key = f'{product.id}-{variant.id}' if variant else str(product.id)
+            cart[key] = {
+                'product_id': str(product.id),
+                'variant_id': str(variant.id) if variant else None,
+                'quantity': 2,
+                'price': str(product.price),
+            }
+        session = self.client.session
+        session['cart'] = cart
+        session.save()
+
+    def cart_page_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in captured]
+
+    def test_constant_queries(self):
+        self.fill_cart(2)
+        small = self.cart_page_queries()
+        self.fill_cart(50)
+        queries = self.cart_page_queries()
+        self.assertEqual(len(queries), len(small), queries)
+        self.assertEqual(sum('FROM "products_product"' in sql for sql in queries), 1)
+        self.assertEqual(sum('FROM "products_productvariant"' in sql for sql in queries), 1)
+
+    def test_deleted_products_are_dropped(self):
+        self.fill_cart(4)
+        self.products[0].delete()
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cart'].lines()), 3)
+        self.assertNotIn(str(self.products[0].id), self.client.session['cart'])
+
+
+class CartMergeTests(TestCase):
+    """A visitor's session cart is added to their database cart when they sign in"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.runner, cls.trainer, cls.boot = [
+            Product.objects.create(name=name, slug=name.lower(), sku=name.upper(), description='',
+                                   category=category, price=100, stock=10)
+            for name in ('Runner', 'Trainer', 'Boot')
+        ]
+        cls.size = ProductVariant.objects.create(product=cls.trainer, name='Size', value='42', sku='TRAINER-42',
+                                                 stock=5)
+        cls.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='x')
+        record = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=record, key=str(cls.runner.id), product=cls.runner, quantity=1)
+
+    def add(self, product, variant=None, quantity=1):
+        data = {'quantity': quantity}
+        if variant:
+            data['variant_id'] = variant.id
+        self.client.post(reverse('cart:cart_add', args=[product.id]), data)
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('key', 'quantity'))
+
+    def test_merge_on_login(self):
+        self.add(self.runner, quantity=2)
+        self.add(self.trainer, self.size)
+        self.add(self.boot)
+        self.boot.delete()
+        self.client.login(username='buyer', password='x')
+
+        # Quantities of products already in the account's cart are added up; deleted products are dropped
+        self.assertEqual(self.quantities(), {str(self.runner.id): 3, f'{self.trainer.id}-{self.size.id}': 1})
+        self.assertNotIn('cart', self.client.session)
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(len(response.context['cart']), 4)
+        self.assertEqual(self.client.session[COUNT_SESSION_KEY], 4)
+
+    def test_login_without_session_cart(self):
+        self.client.login(username='buyer', password='x')
+        self.assertEqual(self.quantities(), {str(self.runner.id): 1})
+
+    def test_signed_in_cart_is_kept_across_sessions(self):
+        self.client.login(username='buyer', password='x')
+        self.add(self.trainer, self.size, quantity=2)
+        self.client.logout()
+        self.assertEqual(len(self.client.get(reverse('cart:cart_detail')).context['cart']), 0)
+        self.client.login(username='buyer', password='x')
+        self.assertEqual(self.quantities(), {str(self.runner.id): 1, f'{self.trainer.id}-{self.size.id}': 2})
+
+
+class CartContextProcessorTests(TestCase):
+    """The header cart badge is only counted by templates that show it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        product = Product.objects.create(name='Runner', slug='runner', sku='RUN', description='',
+                                         category=category, price=100, stock=10)
+        cls.user = get_user_model().objects.create_user(username='buyer', password='x')
+        record = Cart.objects.create(user=cls.user)
+        CartItem.objects.create(cart=record, key=str(product.id), product=product, quantity=2)
+
+    def render(self, source, request):
+        return Template(source).render(RequestContext(request))
+
+    def test_lazy(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = SessionStore()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render('{{ request.path }}', request), '/')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.render('{{ cart|length }}', request), '2')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render('{{ cart|length }}', request), '2')
@@ -1,6 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.views.decorators.http import require_POST
+from orders.reservations import available_to_sell
+from products.images import prefetch_manifests
 from products.models import Product, ProductVariant
 from .cart import Cart
 
@@ -8,6 +10,7 @@ from .cart import Cart
 def cart_detail(request):
     """Cart detail page"""
     cart = Cart(request)
+    prefetch_manifests(item['product'].main_image for item in cart)
     return render(request, 'cart/cart_detail.html', {'cart': cart})
 
 
@@ -23,6 +26,22 @@ def cart_add(request, product_id):
         variant = get_object_or_404(ProductVariant, id=variant_id)
     
     quantity = int(request.POST.get('quantity', 1))
+    
+    # Stock other customers hold at checkout is not for sale (see orders.reservations)
+    holder = request.user if request.user.is_authenticated else None
+    available, available_variants = available_to_sell([product], [variant] if variant else [], exclude_user=holder)
+    in_cart = [item for item in cart.cart.values() if item['product_id'] == str(product.id)]
+    left = available[product.id] - sum(item['quantity'] for item in in_cart)
+    if variant:
+        in_cart = [item for item in in_cart if item['variant_id'] == str(variant.id)]
+        left = min(left, available_variants[variant.id] - sum(item['quantity'] for item in in_cart))
+    if quantity > left:
+        if left > 0:
+            messages.error(request, f'Only {left} more of {product.name} can be added to your cart.')
+        else:
+            messages.error(request, f'{product.name} is out of stock.')
+        return redirect('products:product_detail', slug=product.slug)
+    
     cart.add(product=product, variant=variant, quantity=quantity)
     
     messages.success(request, f'{product.name} added to cart!')
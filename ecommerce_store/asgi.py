@@ -14,3 +14,13 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_store.settings')
 
 application = get_asgi_application()
+
+# Write buffered product view counts before the worker exits
+from products.counters import register_shutdown_flush  # noqa: E402
+
+register_shutdown_flush()
+
+# Load the search autocomplete index in the background so the first keystroke is fast
+from products.autocomplete import autocomplete_index  # noqa: E402
+
+autocomplete_index.warm()
@@ -91,9 +91,56 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts and wait for it, so
+            # concurrent checkouts queue instead of failing with "database is locked".
+            # Django sets this per connection, not per atomic block. That is the
+            # scope needed: every atomic block here that reads and then writes
+            # (checkout, reservations, imports, rollups) would otherwise fail when
+            # its read lock cannot be upgraded, because SQLite reports that at once
+            # without honouring the timeout. Autocommit queries are unaffected; only
+            # atomic blocks wait on each other.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file rather than shared-cache memory, whose table locks ignore the timeout
+        # (the concurrent checkout test)
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+
+# Cache
+# Local memory by default; set CACHE_BACKEND/CACHE_LOCATION for a shared cache, e.g.
+# django.core.cache.backends.redis.RedisCache with redis://127.0.0.1:6379/1
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# Homepage and filter taxonomy fragments (seconds); invalidated on catalog changes
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# Anonymous product page cache and ETag lifetime (seconds); product, review and stock changes invalidate sooner
+PRODUCT_PAGE_CACHE_TIMEOUT = 60 * 10
+
+# Public site address for links in exported product feeds (export_product_feed)
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+
+# Pre-rendered sitemap files (build_sitemaps), served at /sitemap.xml and /sitemaps/
+SITEMAP_ROOT = BASE_DIR / 'sitemaps'
+
+# When set, /feeds/ requests must pass ?token=<value>
+PRODUCT_FEED_TOKEN = os.environ.get('PRODUCT_FEED_TOKEN', '')
+
+# Rebuild in-memory autocomplete and facet indexes in a background thread after catalog changes
+CATALOG_INDEX_BACKGROUND_REFRESH = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -137,6 +184,13 @@ STATIC_ROOT = BASE_DIR / 'staticfiles_build' / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Responsive image derivatives (products.images): widths in px, modern formats besides the JPEG/PNG fallback
+IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640, 1024)
+IMAGE_DERIVATIVE_FORMATS = ('avif', 'webp')
+# Uploads are resized after commit in a per-worker process pool; False resizes inline
+IMAGE_DERIVATIVES_ASYNC = True
+IMAGE_DERIVATIVE_WORKERS = 2
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -158,6 +212,14 @@ DEFAULT_FROM_EMAIL = 'ShopHub <noreply@shophub.com>'
 SESSION_COOKIE_AGE = 86400 * 30  # 30 days
 CART_SESSION_ID = 'cart'
 
+# Product view counter: 'memory' buffers per worker, 'cache' buffers in the default cache
+PRODUCT_VIEWS_BUFFER = os.environ.get('PRODUCT_VIEWS_BUFFER', 'memory')
+PRODUCT_VIEWS_FLUSH_THRESHOLD = 100  # pending views
+PRODUCT_VIEWS_FLUSH_INTERVAL = 30  # seconds
+
+# Checkout holds cart stock this long (orders.reservations)
+STOCK_RESERVATION_MINUTES = 15
+
 # Stripe settings (add your keys later)
 STRIPE_PUBLIC_KEY = 'your-stripe-public-key'
 STRIPE_SECRET_KEY = 'your-stripe-secret-key'
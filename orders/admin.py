@@ -1,9 +1,18 @@
-from django.contrib import admin
+from datetime import timedelta
+
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.utils.dateparse import parse_date
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
 from django.utils import timezone
-from .models import Order, OrderItem, OrderStatusHistory
-from .emails import send_order_shipped_email, send_order_delivered_email
+from .models import Order, OrderItem, OrderStatusHistory, OutgoingEmail, StockReservation, TransitionJob
+from .rollups import sales_report
+from .services import queue_transition, transition_orders
+
+# Admin actions on more orders than this are queued for the run_transition_jobs worker
+BACKGROUND_TRANSITION_THRESHOLD = 2000
 
 
 class OrderItemInline(admin.TabularInline):
@@ -94,50 +103,27 @@ class OrderAdmin(admin.ModelAdmin):
         return format_html('<strong>PKR {}</strong>', obj.total)
     total_display.short_description = 'Total'
     
-    def items_count(self, obj):
-        return obj.items.count()
-    items_count.short_description = 'Items'
+    def transition(self, request, queryset, status, note, done):
+        """Set-based status change; very large selections are queued as a job"""
+        count = queryset.count()
+        if count > BACKGROUND_TRANSITION_THRESHOLD:
+            job = queue_transition(queryset.values_list('pk', flat=True), status, request.user, note)
+            self.message_user(request, f'{count} orders queued to be {done} by the run_transition_jobs worker (job {job.pk}).')
+            return
+        updated = transition_orders(queryset, status, user=request.user, note=note)
+        skipped = f' ({count - updated} skipped: already {status} or not eligible)' if updated < count else ''
+        self.message_user(request, f'{updated} orders {done}.{skipped}')
     
     def mark_as_processing(self, request, queryset):
-        updated = queryset.update(status='processing')
-        for order in queryset:
-            OrderStatusHistory.objects.create(
-                order=order,
-                status='processing',
-                note='Status updated by admin',
-                created_by=request.user
-            )
-        self.message_user(request, f'{updated} orders marked as processing.')
+        self.transition(request, queryset, 'processing', 'Status updated by admin', 'marked as processing')
     mark_as_processing.short_description = 'Mark as Processing'
     
     def mark_as_shipped(self, request, queryset):
-        now = timezone.now()
-        updated = queryset.update(status='shipped', shipped_at=now)
-        for order in queryset:
-            OrderStatusHistory.objects.create(
-                order=order,
-                status='shipped',
-                note='Order shipped by admin',
-                created_by=request.user
-            )
-            # Send shipping notification email
-            send_order_shipped_email(order)
-        self.message_user(request, f'{updated} orders marked as shipped and emails sent.')
+        self.transition(request, queryset, 'shipped', 'Order shipped by admin', 'marked as shipped and emails queued')
     mark_as_shipped.short_description = 'Mark as Shipped (Sends Email)'
     
     def mark_as_delivered(self, request, queryset):
-        now = timezone.now()
-        updated = queryset.update(status='delivered', delivered_at=now)
-        for order in queryset:
-            OrderStatusHistory.objects.create(
-                order=order,
-                status='delivered',
-                note='Order delivered',
-                created_by=request.user
-            )
-            # Send delivery confirmation email
-            send_order_delivered_email(order)
-        self.message_user(request, f'{updated} orders marked as delivered and emails sent.')
+        self.transition(request, queryset, 'delivered', 'Order delivered', 'marked as delivered and emails queued')
     mark_as_delivered.short_description = 'Mark as Delivered (Sends Email)'
     
     def mark_as_paid(self, request, queryset):
@@ -145,3 +131,84 @@ class OrderAdmin(admin.ModelAdmin):
         updated = queryset.update(payment_status='completed', paid_at=now)
         self.message_user(request, f'{updated} orders marked as paid.')
     mark_as_paid.short_description = 'Mark as Paid'
+    
+    def changelist_view(self, request, extra_context=None):
+        if request.method == 'GET':
+            failed = TransitionJob.objects.filter(status='failed').count()
+            if failed:
+                self.message_user(request, format_html(
+                    '{} queued status changes failed. <a href="{}?status__exact=failed">See the transition jobs</a>.',
+                    failed, reverse('admin:orders_transitionjob_changelist'),
+                ), messages.WARNING)
+        return super().changelist_view(request, extra_context)
+    
+    def get_urls(self):
+        return [
+            path('sales-report/', self.admin_site.admin_view(self.sales_report_view), name='orders_sales_report'),
+        ] + super().get_urls()
+    
+    def sales_report_view(self, request):
+        """Sales for a date range (last 30 days by default), read from the daily rollups"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            end = parse_date(request.GET.get('end') or '') or timezone.localdate()
+            start = parse_date(request.GET.get('start') or '') or end - timedelta(days=29)
+        except ValueError:
+            # Well-formed but impossible dates, e.g. 2025-02-30
+            end = timezone.localdate()
+            start = end - timedelta(days=29)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Sales report',
+            'start': start,
+            'end': end,
+            **sales_report(start, end),
+        }
+        return TemplateResponse(request, 'admin/orders/sales_report.html', context)
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'to', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'to']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', next_attempt_at=timezone.now())
+        self.message_user(request, f'{updated} emails queued for the next worker run.')
+    retry_now.short_description = 'Retry now'
+
+
+@admin.register(TransitionJob)
+class TransitionJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'target_status', 'order_count', 'status', 'changed', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'target_status', 'created_at']
+    list_select_related = ['created_by']
+    exclude = ['order_ids']
+    readonly_fields = ['target_status', 'note', 'order_count', 'created_by', 'status', 'run_after', 'changed',
+                       'last_error', 'created_at', 'finished_at']
+    actions = ['retry_now']
+    
+    def order_count(self, obj):
+        return len(obj.order_ids)
+    order_count.short_description = 'Orders'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def retry_now(self, request, queryset):
+        updated = queryset.filter(status='failed').update(status='pending', run_after=timezone.now())
+        self.message_user(request, f'{updated} jobs queued for the next worker run.')
+    retry_now.short_description = 'Retry now'
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'variant', 'quantity', 'user', 'expires_at', 'created_at']
+    list_select_related = ['product', 'variant', 'user']
+    search_fields = ['product__name', 'product__sku', 'user__username']
+    raw_id_fields = ['user', 'product', 'variant']
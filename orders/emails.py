@@ -1,10 +1,13 @@
-from django.core.mail import send_mail
+"""
+Order emails. The send_* functions only queue mail in the outbox (see
+``outbox.py``); the send_queued_emails worker delivers it.
+"""
 from django.template.loader import render_to_string
-from django.conf import settings
+from .outbox import build, enqueue
 
 
 def send_order_confirmation_email(order):
-    """Send order confirmation email"""
+    """Queue order confirmation email"""
     try:
         subject = f'Order Confirmation - {order.order_number}'
         
@@ -26,27 +29,19 @@ Thank you for shopping with ShopHub!
         # HTML
         html_message = render_to_string('emails/order_confirmation.html', {'order': order})
         
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[order.user.email],
-            html_message=html_message,
-            fail_silently=True,
-        )
+        enqueue(subject, plain_message, [order.user.email], html_message)
         return True
     except Exception as e:
         print(f"❌ Order confirmation email failed: {e}")
         return False
 
 
-def send_order_shipped_email(order):
-    """Send order shipped notification email"""
-    try:
-        subject = f'Your Order Has Shipped - {order.order_number}'
-        
-        # Plain text
-        plain_message = f"""
+def order_shipped_email(order):
+    """Unsaved outbox row telling the customer their order shipped"""
+    subject = f'Your Order Has Shipped - {order.order_number}'
+    
+    # Plain text
+    plain_message = f"""
 Dear {order.shipping_full_name},
 
 Great news! Your order has been shipped.
@@ -61,32 +56,19 @@ Track your order: http://127.0.0.1:8000/accounts/orders/
 
 Thank you for shopping with ShopHub!
 """
-        
-        # HTML
-        html_message = render_to_string('emails/order_shipped.html', {'order': order})
-        
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[order.user.email],
-            html_message=html_message,
-            fail_silently=True,
-        )
-        print(f"✅ Shipping notification sent to {order.user.email}")
-        return True
-    except Exception as e:
-        print(f"❌ Shipping notification failed: {e}")
-        return False
-
-
-def send_order_delivered_email(order):
-    """Send order delivered notification email"""
-    try:
-        subject = f'Order Delivered - {order.order_number}'
-        
-        # Plain text
-        plain_message = f"""
+    
+    # HTML
+    html_message = render_to_string('emails/order_shipped.html', {'order': order})
+    
+    return build(subject, plain_message, [order.user.email], html_message)
+
+
+def order_delivered_email(order):
+    """Unsaved outbox row telling the customer their order arrived"""
+    subject = f'Order Delivered - {order.order_number}'
+    
+    # Plain text
+    plain_message = f"""
 Dear {order.shipping_full_name},
 
 Your order has been successfully delivered!
@@ -98,19 +80,29 @@ We hope you love your purchase! Please consider leaving a review.
 
 Thank you for shopping with ShopHub!
 """
-        
-        # HTML
-        html_message = render_to_string('emails/order_delivered.html', {'order': order})
-        
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[order.user.email],
-            html_message=html_message,
-            fail_silently=True,
-        )
-        print(f"✅ Delivery confirmation sent to {order.user.email}")
+    
+    # HTML
+    html_message = render_to_string('emails/order_delivered.html', {'order': order})
+    
+    return build(subject, plain_message, [order.user.email], html_message)
+
+
+def send_order_shipped_email(order):
+    """Queue order shipped notification email"""
+    try:
+        order_shipped_email(order).save()
+        print(f"✅ Shipping notification queued for {order.user.email}")
+        return True
+    except Exception as e:
+        print(f"❌ Shipping notification failed: {e}")
+        return False
+
+
+def send_order_delivered_email(order):
+    """Queue order delivered notification email"""
+    try:
+        order_delivered_email(order).save()
+        print(f"✅ Delivery confirmation queued for {order.user.email}")
         return True
     except Exception as e:
         print(f"❌ Delivery notification failed: {e}")
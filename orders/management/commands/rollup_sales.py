@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from orders.rollups import rollup_sales
+
+
+class Command(BaseCommand):
+    help = 'Update the daily sales rollups for orders changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every day with orders (backfill)')
+        parser.add_argument('--batch-days', type=int, default=31, help='Calendar days rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        days, rows = rollup_sales(full=options['full'], batch_days=options['batch_days'], log=log)
+        self.stdout.write(self.style.SUCCESS(f"✓ Rebuilt sales rollups for {days} day{'' if days == 1 else 's'} ({rows} rows)"))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.services import claim_transition_job, run_transition_job
+
+
+class Command(BaseCommand):
+    help = 'Run bulk order status changes queued from the admin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new jobs')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        while True:
+            job = claim_transition_job()
+            if job is None:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            if run_transition_job(job):
+                done += 1
+                self.stdout.write(f'Job {job.pk}: {job.changed} orders moved to {job.target_status}')
+            else:
+                failed += 1
+                self.stderr.write(f'Job {job.pk} failed: {job.last_error}')
+        self.stdout.write(self.style.SUCCESS(f'✓ Ran {done} transition jobs, {failed} failed'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.outbox import send_batch
+
+
+class Command(BaseCommand):
+    help = 'Send emails queued in the outbox, one connection per batch, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails sent per connection')
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new mail')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_batch(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'Sent {sent}, failed {failed}')
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['interval'])
+            if failed and not sent and not options['loop']:
+                # The mail server is likely down; retry on the next run
+                break
+        self.stdout.write(self.style.SUCCESS(f'✓ Sent {total_sent} emails, {total_failed} failed attempts'))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.reservations import sweep_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired checkout stock reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Holds deleted per statement')
+        parser.add_argument('--loop', action='store_true', help='Keep running, sweeping periodically')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            deleted = sweep_expired(options['batch_size'])
+            total += deleted
+            if deleted:
+                self.stdout.write(f'Deleted {deleted} expired reservations')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Deleted {total} expired reservations'))
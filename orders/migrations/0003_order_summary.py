@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_summaries(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    order_ids = list(Order.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(order_ids), 1000):
+        summaries = {}
+        items = OrderItem.objects.filter(order_id__in=order_ids[start:start + 1000]).select_related(
+            'product', 'variant'
+        ).order_by('order_id', 'id')
+        for item in items:
+            if item.order_id not in summaries:
+                image = (item.variant and item.variant.image) or item.product.main_image
+                summaries[item.order_id] = Order(
+                    pk=item.order_id, items_count=0, first_item_name=item.product_name, first_item_image=image.name or '',
+                )
+            summaries[item.order_id].items_count += 1
+        Order.objects.bulk_update(summaries.values(), ['items_count', 'first_item_name', 'first_item_image'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_outgoing_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='first_item_image',
+            field=models.ImageField(blank=True, upload_to='products/'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='first_item_name',
+            field=models.CharField(blank=True, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_history_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
-from products.models import Product, ProductVariant
+from django.utils import timezone
+from products.models import Brand, Category, Product, ProductVariant
 import uuid
 
 
@@ -61,6 +62,11 @@ class Order(models.Model):
     tracking_number = models.CharField(max_length=200, blank=True)
     carrier = models.CharField(max_length=100, blank=True)
     
+    # Summary for order lists, filled in when the order is placed
+    items_count = models.PositiveIntegerField(default=0)
+    first_item_name = models.CharField(max_length=300, blank=True)
+    first_item_image = models.ImageField(upload_to='products/', blank=True)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -91,6 +97,12 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a customer's order history
+            models.Index(fields=['user', '-created_at', '-id'], name='order_history_idx'),
+            # Orders changed since the sales rollup watermark
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -107,6 +119,8 @@ class OrderItem(models.Model):
     quantity = models.IntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Product.cost_price when ordered; sales rollups fall back to the current one when missing
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     
     @property
     def price(self):
@@ -138,3 +152,160 @@ class OrderStatusHistory(models.Model):
     class Meta:
         verbose_name_plural = 'Order status histories'
         ordering = ['-created_at']
+
+
+class StockReservationQuerySet(models.QuerySet):
+    def active(self):
+        """Holds that still count against stock"""
+        return self.filter(expires_at__gt=timezone.now())
+
+
+class StockReservation(models.Model):
+    """Stock held for a customer's cart line while they check out (see orders.reservations)"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = StockReservationQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.user_id} until {self.expires_at}"
+    
+    class Meta:
+        indexes = [
+            # Active holds per SKU: an index range scan on (sku, expires_at > now)
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_idx'),
+            models.Index(fields=['variant', 'expires_at'], name='reservation_variant_idx'),
+            # Expiry sweeper
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
+
+
+class OutgoingEmail(models.Model):
+    """Email waiting in the outbox for the send_queued_emails worker"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(help_text="List of recipient addresses")
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Due time while pending: now for new mail, later after a failure (backoff) or while a worker holds it
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+
+class TransitionJob(models.Model):
+    """Bulk status change queued by the admin for the run_transition_jobs worker"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    target_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    note = models.TextField(blank=True)
+    order_ids = models.JSONField(help_text="Orders selected when the job was queued")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Due time while pending; while running, when the worker's lease runs out (renewed every batch)
+    run_after = models.DateTimeField(default=timezone.now)
+    changed = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{len(self.order_ids)} orders -> {self.target_status} ({self.status})"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='transition_job_due_idx'),
+        ]
+
+
+# Sales rollups (see orders.rollups)
+
+class DailySales(models.Model):
+    """Sales of orders placed on one day, for one value of a dimension"""
+    date = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    @property
+    def margin(self):
+        return self.revenue - self.cost
+    
+    class Meta:
+        abstract = True
+        ordering = ['-date']
+
+
+class DailyProductSales(DailySales):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    
+    class Meta(DailySales.Meta):
+        unique_together = ['date', 'product']
+        verbose_name_plural = 'Daily product sales'
+
+
+class DailyCategorySales(DailySales):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    
+    class Meta(DailySales.Meta):
+        unique_together = ['date', 'category']
+        verbose_name_plural = 'Daily category sales'
+
+
+class DailyBrandSales(DailySales):
+    # Null for products without a brand
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_sales')
+    
+    class Meta(DailySales.Meta):
+        indexes = [models.Index(fields=['date', 'brand'], name='brand_sales_date_idx')]
+        verbose_name_plural = 'Daily brand sales'
+
+
+class DailyStatusSales(DailySales):
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    
+    class Meta(DailySales.Meta):
+        unique_together = ['date', 'status']
+        verbose_name_plural = 'Daily status sales'
+
+
+class RollupWatermark(models.Model):
+    """How far an incremental job has read (by Order.updated_at)"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
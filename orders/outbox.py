@@ -0,0 +1,108 @@
+"""
+Durable email outbox.
+
+Request code calls ``enqueue`` (one INSERT, no SMTP) and returns at once; the
+``send_queued_emails`` worker sends due mail in batches over one connection
+per batch and retries failures with exponential backoff until
+``MAX_ATTEMPTS``, after which a message is marked failed.
+
+A worker takes a batch by pushing its due time ``LEASE`` into the future, so
+concurrent workers skip it and a crashed worker's batch is retried later.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import OutgoingEmail
+
+MAX_ATTEMPTS = 8
+# Retry delays: 1, 2, 4, 8 ... minutes, at most 6 hours
+BACKOFF_BASE = timedelta(minutes=1)
+BACKOFF_MAX = timedelta(hours=6)
+LEASE = timedelta(minutes=10)
+
+
+def build(subject, body, to, html_body='', from_email=None):
+    """An unsaved outbox row, for ``enqueue_many``"""
+    return OutgoingEmail(
+        subject=subject,
+        body=body,
+        to=list(to),
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+    )
+
+
+def enqueue(subject, body, to, html_body='', from_email=None):
+    """Queue one email; returns the OutgoingEmail"""
+    email = build(subject, body, to, html_body, from_email)
+    email.save()
+    return email
+
+
+def enqueue_many(emails):
+    """Queue rows from ``build`` with one INSERT"""
+    return OutgoingEmail.objects.bulk_create(emails, batch_size=500)
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def claim_batch(batch_size):
+    """Due emails, leased to this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in batch]).update(next_attempt_at=now + LEASE)
+    return batch
+
+
+def to_message(email, connection):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email, email.to, connection=connection)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def send_batch(batch_size=100):
+    """Send one batch of due emails over a single connection; returns (sent, failed)"""
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent, failures = [], []
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        failures = [(email, e) for email in batch]
+    else:
+        try:
+            for email in batch:
+                try:
+                    connection.send_messages([to_message(email, connection)])
+                    sent.append(email.pk)
+                except Exception as e:
+                    failures.append((email, e))
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    OutgoingEmail.objects.filter(pk__in=sent).update(status='sent', sent_at=now, attempts=F('attempts') + 1)
+    for email, error in failures:
+        attempts = email.attempts + 1
+        OutgoingEmail.objects.filter(pk=email.pk).update(
+            attempts=attempts,
+            last_error=f'{type(error).__name__}: {error}'[:2000],
+            status='failed' if attempts >= MAX_ATTEMPTS else 'pending',
+            next_attempt_at=now + backoff(attempts),
+        )
+    return len(sent), len(failures)
@@ -0,0 +1,112 @@
+"""
+Checkout stock reservations.
+
+Entering checkout holds the cart's quantities for ``STOCK_RESERVATION_MINUTES``,
+so stock the customer saw at checkout is still there when they place the
+order. Available-to-sell is stock minus other customers' active holds; the
+holds for all of a cart's lines are summed in one query per table, each an
+index range scan on (product or variant, expires_at). Placing the order
+releases the customer's holds; expired holds stop counting at once and are
+deleted later by the ``sweep_reservations`` command.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from products.models import Product, ProductVariant
+from products.page_cache import invalidate_product_page
+from .models import StockReservation
+from .services import OutOfStock, line_quantities
+
+
+def reservation_ttl():
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 15))
+
+
+def held_quantities(product_ids=(), variant_ids=(), exclude_user=None):
+    """Active holds as ``({product_id: quantity}, {variant_id: quantity})``"""
+    holds = StockReservation.objects.active()
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    products, variants = {}, {}
+    if product_ids:
+        products = dict(
+            holds.filter(product_id__in=product_ids).values('product_id').annotate(total=Sum('quantity'))
+            .values_list('product_id', 'total')
+        )
+    if variant_ids:
+        variants = dict(
+            holds.filter(variant_id__in=variant_ids).values('variant_id').annotate(total=Sum('quantity'))
+            .values_list('variant_id', 'total')
+        )
+    return products, variants
+
+
+def available_to_sell(products=(), variants=(), exclude_user=None):
+    """Stock minus active holds for product and variant instances, as two dicts by id"""
+    held_products, held_variants = held_quantities(
+        [product.pk for product in products], [variant.pk for variant in variants], exclude_user
+    )
+    return (
+        {product.pk: max(product.stock - held_products.get(product.pk, 0), 0) for product in products},
+        {variant.pk: max(variant.stock - held_variants.get(variant.pk, 0), 0) for variant in variants},
+    )
+
+
+@transaction.atomic
+def reserve(user, lines):
+    """
+    Hold stock for ``user``'s cart ``lines``, replacing any holds they had.
+
+    Raises OutOfStock when a line needs more than other customers leave
+    available; returns when the holds expire.
+    """
+    lines = list(lines)
+    products, variants, names = line_quantities(lines)
+    # Locking the rows (in a fixed order) serializes reservations of the same SKUs
+    product_stock = dict(
+        Product.objects.select_for_update().filter(pk__in=products).order_by('pk').values_list('pk', 'stock')
+    )
+    variant_stock = dict(
+        ProductVariant.objects.select_for_update().filter(pk__in=variants).order_by('pk').values_list('pk', 'stock')
+    )
+    held_products, held_variants = held_quantities(products, variants, exclude_user=user)
+    
+    for variant_id, quantity in sorted(variants.items()):
+        if variant_stock.get(variant_id, 0) - held_variants.get(variant_id, 0) < quantity:
+            raise OutOfStock(names[('variant', variant_id)])
+    for product_id, quantity in sorted(products.items()):
+        if product_stock.get(product_id, 0) - held_products.get(product_id, 0) < quantity:
+            raise OutOfStock(names[product_id])
+    
+    expires_at = timezone.now() + reservation_ttl()
+    # Product pages show available stock, so pages of held and released products change
+    released = set(StockReservation.objects.filter(user=user).values_list('product__slug', flat=True))
+    StockReservation.objects.filter(user=user).delete()
+    StockReservation.objects.bulk_create([
+        StockReservation(
+            user=user,
+            product=line['product'],
+            variant=line.get('variant'),
+            quantity=line['quantity'],
+            expires_at=expires_at,
+        )
+        for line in lines
+    ])
+    invalidate_product_page(*released, *{line['product'].slug for line in lines})
+    return expires_at
+
+
+def sweep_expired(batch_size=1000):
+    """Delete expired holds in short batches (they no longer count either way); returns how many"""
+    now = timezone.now()
+    deleted = 0
+    while True:
+        rows = list(StockReservation.objects.filter(expires_at__lte=now).values_list('pk', 'product__slug')[:batch_size])
+        if not rows:
+            return deleted
+        deleted += StockReservation.objects.filter(pk__in=[pk for pk, _ in rows]).delete()[0]
+        # Pages cached while the holds counted showed less stock
+        invalidate_product_page(*{slug for _, slug in rows})
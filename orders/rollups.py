@@ -0,0 +1,179 @@
+"""
+Daily sales rollups.
+
+Reports read small per-day tables instead of scanning Order/OrderItem. The
+``rollup_sales`` command keeps them current: it finds the order dates touched
+by orders changed since its watermark (``Order.updated_at``) and rebuilds
+those days from scratch, so status changes move sales between rows and
+re-running is harmless. Days are rebuilt in batches, each in one transaction,
+with the grouping done by the database and rows streamed into bulk inserts.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import (
+    DailyBrandSales, DailyCategorySales, DailyProductSales, DailyStatusSales, Order, OrderItem, RollupWatermark,
+)
+
+WATERMARK = 'sales'
+# Changes committed a little after the previous run started are read again
+OVERLAP = timedelta(minutes=5)
+# Statuses left out of product, category and brand sales
+EXCLUDED_STATUSES = ['cancelled', 'refunded']
+INSERT_BATCH_SIZE = 1000
+
+# Rollup model -> OrderItem path of its dimension, rollup field, whether excluded statuses count
+ROLLUPS = [
+    (DailyProductSales, 'product', 'product_id', False),
+    (DailyCategorySales, 'product__category', 'category_id', False),
+    (DailyBrandSales, 'product__brand', 'brand_id', False),
+    (DailyStatusSales, 'order__status', 'status', True),
+]
+
+
+def changed_days(since):
+    """Order dates with orders changed after ``since`` (all dates when None)"""
+    orders = Order.objects.all()
+    if since is not None:
+        orders = orders.filter(updated_at__gt=since - OVERLAP)
+    return list(orders.dates('created_at', 'day'))
+
+
+def day_rows(days, dimension, include_excluded):
+    """``(day, dimension value, orders, units, revenue, cost)`` per group, computed by the database"""
+    # A range on created_at so the scan stays within the batch's days
+    start = timezone.make_aware(datetime.combine(days[0], time.min))
+    end = timezone.make_aware(datetime.combine(days[-1] + timedelta(days=1), time.min))
+    items = OrderItem.objects.filter(order__created_at__gte=start, order__created_at__lt=end)
+    if not include_excluded:
+        items = items.exclude(order__status__in=EXCLUDED_STATUSES)
+    money = DecimalField(max_digits=14, decimal_places=2)
+    return (
+        items.annotate(day=TruncDate('order__created_at'))
+        .filter(day__in=days)
+        .values_list('day', dimension)
+        .annotate(
+            orders=Count('order', distinct=True),
+            units=Sum('quantity'),
+            revenue=Sum('total_price'),
+            cost=Sum(
+                F('quantity') * Coalesce('unit_cost', 'product__cost_price', Value(Decimal('0'))),
+                output_field=money,
+            ),
+        )
+        .order_by()
+        .iterator(chunk_size=INSERT_BATCH_SIZE)
+    )
+
+
+@transaction.atomic
+def rebuild_days(days, clear=None):
+    """
+    Replace every rollup row for ``days`` (sorted dates); returns rows written.
+    ``clear`` is an inclusive ``(first, last)`` date range (None for open ends)
+    whose rows are all deleted first, including days without orders.
+    """
+    if clear is None:
+        stale = {'date__in': days}
+    else:
+        first, last = clear
+        stale = {key: value for key, value in (('date__gte', first), ('date__lte', last)) if value is not None}
+    written = 0
+    for model, dimension, field, include_excluded in ROLLUPS:
+        model.objects.filter(**stale).delete()
+        if not days:
+            continue
+        batch = []
+        for day, value, orders, units, revenue, cost in day_rows(days, dimension, include_excluded):
+            batch.append(model(date=day, orders=orders, units=units, revenue=revenue, cost=cost, **{field: value}))
+            if len(batch) >= INSERT_BATCH_SIZE:
+                written += len(model.objects.bulk_create(batch))
+                batch = []
+        written += len(model.objects.bulk_create(batch))
+    return written
+
+
+def day_batches(days, batch_days):
+    """Split sorted ``days`` into runs spanning at most ``batch_days`` calendar days"""
+    batch = []
+    for day in days:
+        if batch and (day - batch[0]).days >= batch_days:
+            yield batch
+            batch = []
+        batch.append(day)
+    if batch:
+        yield batch
+
+
+def rollup_sales(full=False, batch_days=31, log=None):
+    """
+    Bring the rollups up to date; ``full`` rebuilds every day with orders and
+    drops the others (needed after orders are deleted, which leaves no changed
+    row behind). Either way each batch is replaced in its own transaction, so
+    reports never see empty tables.
+
+    Returns ``(days, rows)`` rebuilt and written.
+    """
+    started = timezone.now()
+    watermark = RollupWatermark.objects.filter(name=WATERMARK).first()
+    days = changed_days(None if full or watermark is None else watermark.value)
+    batches = list(day_batches(days, batch_days))
+    rows = 0
+    if full and not batches:
+        rebuild_days([], clear=(None, None))
+    for index, batch in enumerate(batches):
+        clear = None
+        if full:
+            # Each batch also clears the days up to the next one (the first and last
+            # batches without bounds), dropping days whose orders have been deleted
+            # while reports keep reading the other days
+            last = batches[index + 1][0] - timedelta(days=1) if index + 1 < len(batches) else None
+            clear = (batch[0] if index else None, last)
+        rows += rebuild_days(batch, clear)
+        if log:
+            log(f'{batch[0]} to {batch[-1]}: {rows} rows written')
+    RollupWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': started})
+    return len(days), rows
+
+
+# Reports
+
+def _grouped(rows, key, label):
+    """Sum ``rows`` by ``key``; every group gets a ``label`` for display"""
+    return rows.values(key).annotate(
+        label=F(label),
+        total_orders=Sum('orders'),
+        total_units=Sum('units'),
+        total_revenue=Sum('revenue'),
+        total_cost=Sum('cost'),
+        total_margin=Sum('revenue') - Sum('cost'),
+    )
+
+
+def sales_report(start, end, limit=10):
+    """Totals, daily series and top sellers for ``start`` to ``end`` (inclusive), from the rollups only"""
+    in_range = {'date__gte': start, 'date__lte': end}
+    # Status rows count each order once; the other tables would count multi-item orders repeatedly
+    sales = DailyStatusSales.objects.filter(**in_range).exclude(status__in=EXCLUDED_STATUSES)
+    totals = sales.aggregate(
+        total_orders=Sum('orders'), total_units=Sum('units'), total_revenue=Sum('revenue'), total_cost=Sum('cost'),
+    )
+    totals['total_margin'] = (totals['total_revenue'] or 0) - (totals['total_cost'] or 0)
+    return {
+        'totals': totals,
+        'days': _grouped(sales, 'date', 'date').order_by('date'),
+        'statuses': _grouped(DailyStatusSales.objects.filter(**in_range), 'status', 'status').order_by('-total_revenue'),
+        'products': _grouped(
+            DailyProductSales.objects.filter(**in_range), 'product', 'product__name'
+        ).order_by('-total_revenue')[:limit],
+        'categories': _grouped(
+            DailyCategorySales.objects.filter(**in_range), 'category', 'category__name'
+        ).order_by('-total_revenue')[:limit],
+        'brands': _grouped(
+            DailyBrandSales.objects.filter(**in_range), 'brand', 'brand__name'
+        ).order_by('-total_revenue')[:limit],
+    }
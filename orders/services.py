@@ -0,0 +1,233 @@
+"""
+Order operations shared by views, admin and integrations.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from products.models import Product, ProductVariant
+from products.page_cache import invalidate_product_page
+from .emails import order_delivered_email, order_shipped_email
+from .models import Order, OrderItem, OrderStatusHistory, StockReservation, TransitionJob
+from .outbox import enqueue_many
+
+logger = logging.getLogger(__name__)
+
+
+class OutOfStock(Exception):
+    """Raised when a cart line asks for more than is left; the order is rolled back"""
+    
+    def __init__(self, name):
+        self.name = name
+        super().__init__(f'Not enough stock for {name}')
+
+
+def line_quantities(lines):
+    """Quantities per product and per variant in cart ``lines``, plus display names for errors"""
+    products, variants, names = Counter(), Counter(), {}
+    for line in lines:
+        product = line['product']
+        products[product.pk] += line['quantity']
+        names[product.pk] = product.name
+        if line.get('variant'):
+            variants[line['variant'].pk] += line['quantity']
+            names[('variant', line['variant'].pk)] = f"{product.name} ({line['variant'].value})"
+    return products, variants, names
+
+
+def held_by_others(user, field):
+    """Quantity held on the outer row (``field`` is product or variant) by customers other than ``user``"""
+    holds = StockReservation.objects.active().filter(**{field: OuterRef('pk')})
+    if user is not None:
+        holds = holds.exclude(user=user)
+    total = holds.values(field).annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total), 0)
+
+
+def take_stock(lines, user=None):
+    """
+    Decrement stock for cart ``lines`` with one conditional UPDATE per product
+    and per variant, so concurrent checkouts can never push stock below zero
+    or into stock other customers hold at checkout (``user``'s own holds are
+    what they are buying). Must run inside a transaction; raises OutOfStock on
+    the first shortfall.
+    """
+    products, variants, names = line_quantities(lines)
+    
+    now = timezone.now()
+    # A fixed order keeps concurrent checkouts from deadlocking on each other's rows
+    for variant_id, quantity in sorted(variants.items()):
+        taken = ProductVariant.objects.filter(
+            pk=variant_id, stock__gte=held_by_others(user, 'variant') + quantity
+        ).update(stock=F('stock') - quantity)
+        if not taken:
+            raise OutOfStock(names[('variant', variant_id)])
+    for product_id, quantity in sorted(products.items()):
+        taken = Product.objects.filter(pk=product_id, stock__gte=held_by_others(user, 'product') + quantity).update(
+            stock=F('stock') - quantity,
+            sales_count=F('sales_count') + quantity,
+            updated_at=now,
+        )
+        if not taken:
+            raise OutOfStock(names[product_id])
+
+
+def summarize(lines):
+    """Order list summary fields for cart ``lines``: item count, first item's name and image"""
+    if not lines:
+        return {}
+    first = lines[0]
+    image = (first.get('variant') and first['variant'].image) or first['product'].main_image
+    return {
+        'items_count': len(lines),
+        'first_item_name': first['product'].name,
+        # The stored file is shared, not copied
+        'first_item_image': image.name or '',
+    }
+
+
+@transaction.atomic
+def place_order(user, lines, **fields):
+    """
+    Create an order for cart ``lines`` and take their stock, all or nothing.
+
+    ``fields`` are Order fields (totals, shipping address). Raises OutOfStock
+    without leaving an order, items or stock changes behind.
+    """
+    lines = list(lines)
+    take_stock(lines, user)
+    
+    order = Order.objects.create(user=user, **summarize(lines), **fields)
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=line['product'],
+            variant=line.get('variant'),
+            product_name=line['product'].name,
+            product_sku=line['product'].sku,
+            variant_name=line['variant'].name if line.get('variant') else '',
+            quantity=line['quantity'],
+            unit_price=line['price'],
+            total_price=line['total_price'],
+            unit_cost=line['product'].cost_price,
+        )
+        for line in lines
+    ])
+    OrderStatusHistory.objects.create(
+        order=order,
+        status='pending',
+        note='Order created',
+        created_by=user
+    )
+    # The held stock has just been taken
+    StockReservation.objects.filter(user=user).delete()
+    
+    # The stock UPDATEs skip the product save signals that normally do this
+    slugs = {line['product'].slug for line in lines}
+    invalidate_product_page(*slugs)
+    return order
+
+
+# Status -> (statuses it can be reached from, timestamp field set, customer email, history note)
+TRANSITIONS = {
+    'processing': ({'pending'}, None, None, 'Order processing'),
+    'shipped': ({'pending', 'processing'}, 'shipped_at', order_shipped_email, 'Order shipped'),
+    'delivered': ({'pending', 'processing', 'shipped'}, 'delivered_at', order_delivered_email, 'Order delivered'),
+}
+# Orders updated per transaction
+TRANSITION_BATCH_SIZE = 1000
+# A running job whose worker died is claimed again this long after its last batch
+TRANSITION_JOB_LEASE = timedelta(minutes=30)
+
+
+def transition_orders(orders, status, user=None, note=None):
+    """
+    Move ``orders`` (a queryset, e.g. ``Order.objects.filter(order_number__in=...)``
+    from a carrier update) to ``status`` with set-based writes: per batch one
+    UPDATE, one bulk_create of history rows and a fixed number of queries for
+    the customer emails, which are queued in the outbox. Orders that cannot make the
+    transition (already there, cancelled, ...) are skipped.
+
+    Returns the number of orders changed.
+    """
+    allowed_from, _, _, default_note = TRANSITIONS[status]
+    order_ids = list(orders.filter(status__in=allowed_from).order_by('pk').values_list('pk', flat=True))
+    changed = 0
+    for start in range(0, len(order_ids), TRANSITION_BATCH_SIZE):
+        changed += _transition_batch(order_ids[start:start + TRANSITION_BATCH_SIZE], status, user, note or default_note)
+    return changed
+
+
+@transaction.atomic
+def _transition_batch(order_ids, status, user, note):
+    allowed_from, timestamp_field, email, _ = TRANSITIONS[status]
+    now = timezone.now()
+    changes = {'status': status, 'updated_at': now}
+    if timestamp_field:
+        changes[timestamp_field] = now
+    # Re-checked here: another request may have moved some of them meanwhile
+    order_ids = list(
+        Order.objects.select_for_update().filter(pk__in=order_ids, status__in=allowed_from).values_list('pk', flat=True)
+    )
+    Order.objects.filter(pk__in=order_ids).update(**changes)
+    
+    OrderStatusHistory.objects.bulk_create([
+        OrderStatusHistory(order_id=order_id, status=status, note=note, created_by=user)
+        for order_id in order_ids
+    ])
+    if email:
+        # Everything the email templates read, in three queries
+        orders = Order.objects.filter(pk__in=order_ids).select_related('user').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        )
+        enqueue_many([email(order) for order in orders])
+    return len(order_ids)
+
+
+def queue_transition(order_ids, status, user=None, note=None):
+    """Queue ``transition_orders`` for a large selection; the ``run_transition_jobs`` worker runs it"""
+    return TransitionJob.objects.create(target_status=status, order_ids=list(order_ids), note=note or '', created_by=user)
+
+
+def claim_transition_job():
+    """The oldest due job (or running one whose lease ran out), marked running for this worker, or None"""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            TransitionJob.objects.select_for_update(skip_locked=True)
+            .filter(status__in=['pending', 'running'], run_after__lte=now)
+            .order_by('run_after', 'id').first()
+        )
+        if job is not None:
+            job.status, job.run_after = 'running', now + TRANSITION_JOB_LEASE
+            job.save(update_fields=['status', 'run_after'])
+    return job
+
+
+def run_transition_job(job):
+    """
+    Run a claimed job and record the outcome on it for the admin. Running a
+    job again is harmless: orders already moved are skipped.
+
+    Returns True when the job succeeded.
+    """
+    try:
+        job.changed = 0
+        for start in range(0, len(job.order_ids), TRANSITION_BATCH_SIZE):
+            # Renewed before every batch, so only a worker that stopped loses the job
+            TransitionJob.objects.filter(pk=job.pk).update(run_after=timezone.now() + TRANSITION_JOB_LEASE)
+            job.changed += transition_orders(
+                Order.objects.filter(pk__in=job.order_ids[start:start + TRANSITION_BATCH_SIZE]),
+                job.target_status, job.created_by, job.note or None,
+            )
+        job.status, job.last_error = 'done', ''
+    except Exception as e:
+        logger.exception('Transition job %s failed', job.pk)
+        job.status, job.last_error = 'failed', f'{type(e).__name__}: {e}'[:2000]
+    job.finished_at = timezone.now()
+    job.save(update_fields=['changed', 'status', 'last_error', 'finished_at'])
+    return job.status == 'done'
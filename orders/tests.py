@@ -1,3 +1,424 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from smtplib import SMTPException
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from cart.models import CartItem
+from products.models import Category, Product, ProductVariant
+from .emails import send_order_confirmation_email
+from .models import (
+    DailyBrandSales, DailyCategorySales, DailyProductSales, DailyStatusSales, Order, OrderItem, OrderStatusHistory,
+    OutgoingEmail, StockReservation, TransitionJob,
+)
+from .outbox import enqueue
+from .reservations import available_to_sell, reserve
+from .services import (
+    OutOfStock, claim_transition_job, place_order, queue_transition, run_transition_job, transition_orders,
+)
+
+ORDER_FIELDS = {
+    'subtotal': Decimal('100.00'),
+    'total': Decimal('100.00'),
+    'shipping_full_name': 'Test Buyer',
+    'shipping_phone': '0300',
+    'shipping_address_line1': 'Street 1',
+    'shipping_city': 'Lahore',
+    'shipping_state': 'Punjab',
+    'shipping_country': 'Pakistan',
+    'shipping_postal_code': '54000',
+}
+
+
+def cart_line(product, quantity, variant=None):
+    line = {'product': product, 'quantity': quantity, 'price': str(product.price),
+            'total_price': float(product.price) * quantity}
+    if variant:
+        line['variant'] = variant
+    return line
+
+
+class PlaceOrderTests(TestCase):
+    """Checkout takes stock with conditional updates and is all or nothing"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='x')
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.shoe = Product.objects.create(name='Runner', slug='runner', sku='RUN', description='',
+                                          category=category, price=100, stock=5)
+        cls.sock = Product.objects.create(name='Sock', slug='sock', sku='SOCK', description='',
+                                          category=category, price=10, stock=1)
+        cls.size = ProductVariant.objects.create(product=cls.shoe, name='Size', value='42', sku='RUN-42', stock=2)
+
+    def test_takes_stock(self):
+        order = place_order(self.user, [cart_line(self.shoe, 2, self.size), cart_line(self.sock, 1)], **ORDER_FIELDS)
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual((order.items_count, order.first_item_name), (2, 'Runner'))
+        self.shoe.refresh_from_db()
+        self.size.refresh_from_db()
+        self.assertEqual((self.shoe.stock, self.shoe.sales_count, self.size.stock), (3, 2, 0))
+
+    def test_shortfall_rolls_back(self):
+        with self.assertRaises(OutOfStock):
+            place_order(self.user, [cart_line(self.shoe, 1), cart_line(self.sock, 2)], **ORDER_FIELDS)
+        self.shoe.refresh_from_db()
+        self.assertEqual(self.shoe.stock, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Simultaneous checkouts never sell more than is in stock"""
+
+    BUYERS = 50
+    STOCK = 20
+
+    def test_no_overselling(self):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        product = Product.objects.create(name='Runner', slug='runner', sku='RUN', description='',
+                                         category=category, price=100, stock=self.STOCK)
+        User = get_user_model()
+        users = User.objects.bulk_create([
+            User(username=f'buyer{i}', email=f'buyer{i}@example.com') for i in range(self.BUYERS)
+        ])
+        start = threading.Barrier(self.BUYERS)
+        results, errors = [], []
+
+        def checkout(user):
+            try:
+                start.wait()
+                place_order(user, [cart_line(product, 1)], **ORDER_FIELDS)
+                results.append('ordered')
+            except OutOfStock:
+                results.append('out of stock')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        product.refresh_from_db()
+        self.assertEqual(results.count('ordered'), self.STOCK)
+        self.assertEqual(results.count('out of stock'), self.BUYERS - self.STOCK)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+        self.assertEqual(OrderItem.objects.count(), self.STOCK)
+
+
+class CountingBackend(LocmemBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, messages):
+        raise SMTPException('Mail server unavailable')
+
+
+class OutboxTests(TestCase):
+    """Emails are queued by request code and delivered by the worker"""
+
+    @override_settings(EMAIL_BACKEND='orders.tests.CountingBackend')
+    def test_sends_batch_over_one_connection(self):
+        user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='x')
+        order = Order.objects.create(user=user, **ORDER_FIELDS)
+        self.assertTrue(send_order_confirmation_email(order))
+        for i in range(4):
+            enqueue(f'Notice {i}', 'Body', [f'customer{i}@example.com'])
+        self.assertEqual(len(mail.outbox), 0)
+
+        CountingBackend.opened = 0
+        call_command('send_queued_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+        self.assertEqual(mail.outbox[0].alternatives[0].mimetype, 'text/html')
+        self.assertFalse(OutgoingEmail.objects.exclude(status='sent').exists())
+
+    @override_settings(EMAIL_BACKEND='orders.tests.FailingBackend')
+    def test_failures_back_off(self):
+        enqueue('Notice', 'Body', ['customer@example.com'])
+        call_command('send_queued_emails', stdout=StringIO())
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertIn('Mail server unavailable', email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+
+class SalesRollupTests(TestCase):
+    """Rollups match the orders and follow status changes incrementally"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.shoe = Product.objects.create(name='Runner', slug='runner', sku='RUN', description='', category=category,
+                                          price=100, cost_price=60, stock=50)
+        cls.sock = Product.objects.create(name='Sock', slug='sock', sku='SOCK', description='', category=category,
+                                          price=10, stock=50)
+
+    def rollup(self, *args):
+        call_command('rollup_sales', *args, stdout=StringIO())
+
+    def test_rollups_follow_orders(self):
+        first = place_order(self.user, [cart_line(self.shoe, 2), cart_line(self.sock, 3)], **ORDER_FIELDS)
+        place_order(self.user, [cart_line(self.shoe, 1)], **ORDER_FIELDS)
+        self.rollup()
+
+        shoe = DailyProductSales.objects.get(product=self.shoe)
+        self.assertEqual((shoe.orders, shoe.units, shoe.revenue, shoe.cost, shoe.margin),
+                         (2, 3, Decimal('300'), Decimal('180'), Decimal('120')))
+        category = DailyCategorySales.objects.get()
+        self.assertEqual((category.orders, category.units, category.revenue), (2, 6, Decimal('330')))
+        self.assertEqual(DailyBrandSales.objects.get(brand=None).units, 6)
+
+        # Only the changed order's day is rebuilt, and cancelled orders drop out of product sales
+        Order.objects.filter(pk=first.pk).update(status='cancelled', updated_at=timezone.now())
+        self.rollup()
+        self.assertEqual(DailyProductSales.objects.get(product=self.shoe).units, 1)
+        self.assertFalse(DailyProductSales.objects.filter(product=self.sock).exists())
+        self.assertEqual(dict(DailyStatusSales.objects.values_list('status', 'orders')), {'pending': 1, 'cancelled': 1})
+
+    def test_full_rebuild_drops_deleted_days(self):
+        now = timezone.now()
+        orders = [place_order(self.user, [cart_line(self.shoe, 1)], **ORDER_FIELDS) for _ in range(4)]
+        for order, days_ago in zip(orders, [40, 20, 10, 0]):
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(days=days_ago))
+        self.rollup()
+        DailyStatusSales.objects.create(date=timezone.localdate(now) + timedelta(days=5), status='pending', orders=1)
+        self.assertEqual(DailyStatusSales.objects.count(), 5)
+
+        # Days before, between and after the remaining orders all lose their rows
+        Order.objects.filter(pk__in=[orders[0].pk, orders[2].pk]).delete()
+        with CaptureQueriesContext(connection) as captured:
+            self.rollup('--full', '--batch-days', '1')
+        self.assertEqual(list(DailyStatusSales.objects.order_by('date').values_list('date', flat=True)),
+                         [timezone.localdate(now - timedelta(days=20)), timezone.localdate(now)])
+        self.assertEqual(DailyProductSales.objects.aggregate(units=Sum('units'))['units'], 2)
+        # Each batch clears only its own date range, never the whole table
+        deletes = [query['sql'] for query in captured if query['sql'].startswith('DELETE')]
+        self.assertTrue(deletes)
+        self.assertTrue(all('WHERE' in sql for sql in deletes), deletes)
+
+    def test_report_reads_rollups(self):
+        place_order(self.user, [cart_line(self.shoe, 2)], **ORDER_FIELDS)
+        self.rollup('--full')
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('admin:orders_sales_report'))
+        self.assertContains(response, 'Runner')
+        self.assertFalse([query['sql'] for query in captured if '"orders_order' in query['sql']])
+
+
+class ReservationTests(TestCase):
+    """Checkout holds stock against other customers until the hold expires"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.alice = User.objects.create_user(username='alice', email='alice@example.com', password='x')
+        cls.bob = User.objects.create_user(username='bob', email='bob@example.com', password='x')
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.shoe = Product.objects.create(name='Runner', slug='runner', sku='RUN', description='',
+                                          category=category, price=100, stock=3)
+        cls.size = ProductVariant.objects.create(product=cls.shoe, name='Size', value='42', sku='RUN-42', stock=2)
+
+    def test_holds_count_against_others(self):
+        reserve(self.alice, [cart_line(self.shoe, 2, self.size)])
+        products, variants = available_to_sell([self.shoe], [self.size])
+        self.assertEqual((products[self.shoe.pk], variants[self.size.pk]), (1, 0))
+
+        with self.assertRaises(OutOfStock):
+            reserve(self.bob, [cart_line(self.shoe, 1, self.size)])
+        with self.assertRaises(OutOfStock):
+            place_order(self.bob, [cart_line(self.shoe, 2)], **ORDER_FIELDS)
+        place_order(self.bob, [cart_line(self.shoe, 1)], **ORDER_FIELDS)
+
+        # Alice's own hold does not block her, and placing the order releases it
+        place_order(self.alice, [cart_line(self.shoe, 2, self.size)], **ORDER_FIELDS)
+        self.assertFalse(StockReservation.objects.exists())
+        self.shoe.refresh_from_db()
+        self.assertEqual(self.shoe.stock, 0)
+
+    def test_reserving_again_replaces_holds(self):
+        reserve(self.alice, [cart_line(self.shoe, 3)])
+        reserve(self.alice, [cart_line(self.shoe, 1)])
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+        reserve(self.bob, [cart_line(self.shoe, 2)])
+
+    def test_cart_and_product_page_show_available_stock(self):
+        cache.clear()
+        page = reverse('products:product_detail', args=[self.shoe.slug])
+        self.assertContains(self.client.get(page), 'In Stock (3 available)')
+        # The cached page is replaced once the hold commits
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve(self.alice, [cart_line(self.shoe, 2, self.size)])
+        self.assertContains(self.client.get(page), 'In Stock (1 available)')
+        self.client.force_login(self.alice)
+        # Her own hold is hers to buy
+        self.assertContains(self.client.get(page), 'In Stock (3 available)')
+
+        self.client.force_login(self.bob)
+        add = reverse('cart:cart_add', args=[self.shoe.pk])
+        response = self.client.post(add, {'quantity': 2}, follow=True)
+        self.assertContains(response, 'Only 1 more of Runner can be added')
+        self.assertFalse(CartItem.objects.exists())
+        self.client.post(add, {'quantity': 1})
+        response = self.client.post(add, {'quantity': 1}, follow=True)
+        self.assertContains(response, 'Runner is out of stock')
+        response = self.client.post(add, {'quantity': 1, 'variant_id': self.size.pk}, follow=True)
+        self.assertContains(response, 'Runner is out of stock')
+        self.assertEqual(list(CartItem.objects.values_list('cart__user', 'quantity')), [(self.bob.pk, 1)])
+
+    def test_expired_holds_stop_counting_and_are_swept(self):
+        reserve(self.alice, [cart_line(self.shoe, 3)])
+        StockReservation.objects.update(expires_at=timezone.now())
+        reserve(self.bob, [cart_line(self.shoe, 3)])
+
+        call_command('sweep_reservations', stdout=StringIO())
+        self.assertEqual(list(StockReservation.objects.values_list('user', flat=True)), [self.bob.pk])
+
+    def test_checkout_reserves_cart(self):
+        self.client.force_login(self.alice)
+        self.client.post(reverse('cart:cart_add', args=[self.shoe.pk]), {'quantity': 2})
+        response = self.client.get(reverse('orders:checkout'))
+        self.assertContains(response, 'reserved until')
+        self.assertEqual(StockReservation.objects.get(user=self.alice).quantity, 2)
+
+
+class TransitionTests(TestCase):
+    """Bulk status changes write history and queue customer emails once per order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        cls.buyers = [
+            get_user_model().objects.create_user(username=f'buyer{i}', email=f'buyer{i}@example.com', password='x')
+            for i in range(3)
+        ]
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        shoe = Product.objects.create(name='Runner', slug='runner', sku='RUN', description='', category=category,
+                                      price=100, stock=50)
+        cls.orders = [place_order(buyer, [cart_line(shoe, 1)], **ORDER_FIELDS) for buyer in cls.buyers]
+
+    def history(self, status):
+        return OrderStatusHistory.objects.filter(status=status)
+
+    def test_transitions(self):
+        self.assertEqual(transition_orders(Order.objects.all(), 'processing', self.admin), 3)
+        self.assertEqual(self.history('processing').filter(created_by=self.admin).count(), 3)
+        # Processing sends no email
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+        Order.objects.filter(pk=self.orders[0].pk).update(status='cancelled')
+        self.assertEqual(transition_orders(Order.objects.all(), 'shipped', self.admin, 'Courier pickup'), 2)
+        shipped = Order.objects.filter(status='shipped')
+        self.assertEqual(shipped.count(), 2)
+        self.assertFalse(shipped.filter(shipped_at=None).exists())
+        self.assertEqual(set(self.history('shipped').values_list('order', 'note')),
+                         {(order.pk, 'Courier pickup') for order in self.orders[1:]})
+        self.assertEqual(sorted(to for email in OutgoingEmail.objects.all() for to in email.to),
+                         ['buyer1@example.com', 'buyer2@example.com'])
+        self.assertTrue(all('Has Shipped' in email.subject for email in OutgoingEmail.objects.all()))
+
+        # Orders already there, or moving backwards, are skipped without history or email
+        self.assertEqual(transition_orders(Order.objects.all(), 'shipped'), 0)
+        self.assertEqual(transition_orders(Order.objects.all(), 'processing'), 0)
+        self.assertEqual(self.history('shipped').count(), 2)
+        self.assertEqual(OutgoingEmail.objects.count(), 2)
+
+        self.assertEqual(transition_orders(Order.objects.all(), 'delivered'), 2)
+        self.assertEqual(self.history('delivered').get(order=self.orders[1]).note, 'Order delivered')
+        self.assertEqual(OutgoingEmail.objects.count(), 4)
+
+    @patch('orders.admin.BACKGROUND_TRANSITION_THRESHOLD', 2)
+    def test_large_admin_selection_is_queued(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse('admin:orders_order_changelist'), {
+            'action': 'mark_as_shipped', '_selected_action': [order.pk for order in self.orders],
+        })
+        job = TransitionJob.objects.get()
+        self.assertEqual((job.target_status, job.status, job.created_by), ('shipped', 'pending', self.admin))
+        self.assertFalse(Order.objects.filter(status='shipped').exists())
+
+        out = StringIO()
+        call_command('run_transition_jobs', stdout=out)
+        self.assertIn('3 orders moved to shipped', out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.changed), ('done', 3))
+        self.assertEqual(Order.objects.filter(status='shipped').count(), 3)
+        self.assertEqual(self.history('shipped').filter(created_by=self.admin).count(), 3)
+        self.assertEqual(OutgoingEmail.objects.count(), 3)
+
+    @patch('orders.services.TRANSITION_BATCH_SIZE', 2)
+    def test_claimed_job_is_leased(self):
+        queued = queue_transition([order.pk for order in self.orders], 'processing', self.admin)
+        job = claim_transition_job()
+        self.assertEqual((job.pk, job.status), (queued.pk, 'running'))
+        # A running job is not handed to a second worker while its lease lasts
+        self.assertIsNone(claim_transition_job())
+
+        # The lease is renewed before each batch
+        leases = []
+        def transition(orders, *args):
+            leases.append(TransitionJob.objects.values_list('status', 'run_after').get())
+            return transition_orders(orders, *args)
+        TransitionJob.objects.update(run_after=timezone.now() - timedelta(minutes=1))
+        with patch('orders.services.transition_orders', side_effect=transition):
+            self.assertTrue(run_transition_job(job))
+        self.assertEqual(len(leases), 2)
+        self.assertTrue(all(status == 'running' and run_after > timezone.now() for status, run_after in leases))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.changed), ('done', 3))
+        self.assertIsNone(claim_transition_job())
+
+    def test_stale_running_job_is_claimed_again(self):
+        queued = queue_transition([order.pk for order in self.orders], 'processing', self.admin)
+        claim_transition_job()
+        # The worker died; once its lease runs out another one takes over
+        TransitionJob.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        job = claim_transition_job()
+        self.assertEqual((job.pk, job.status), (queued.pk, 'running'))
+        self.assertTrue(run_transition_job(job))
+        self.assertEqual(Order.objects.filter(status='processing').count(), 3)
+
+    def test_failed_job_is_reported(self):
+        job = queue_transition([order.pk for order in self.orders], 'delivered', self.admin)
+        with patch('orders.services.transition_orders', side_effect=RuntimeError('database went away')):
+            call_command('run_transition_jobs', stdout=StringIO(), stderr=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('failed', 'RuntimeError: database went away'))
+        self.client.force_login(self.admin)
+        self.assertContains(self.client.get(reverse('admin:orders_order_changelist')), '1 queued status changes failed')
+
+        # Retried from the admin, the next run completes it
+        self.client.post(reverse('admin:orders_transitionjob_changelist'), {
+            'action': 'retry_now', '_selected_action': [job.pk],
+        })
+        call_command('run_transition_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.changed, job.last_error), ('done', 3, ''))
+        self.assertEqual(Order.objects.filter(status='delivered').count(), 3)
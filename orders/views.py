@@ -2,8 +2,10 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from .models import Order, OrderItem, OrderStatusHistory
+from .models import Order
 from .emails import send_order_confirmation_email
+from .reservations import reserve
+from .services import OutOfStock, place_order
 from cart.cart import Cart
 from accounts.forms import AddressForm
 
@@ -16,11 +18,19 @@ def checkout(request):
         messages.warning(request, 'Your cart is empty!')
         return redirect('products:product_list')
     
+    # Hold the cart's stock while the customer fills in the form
+    try:
+        reserved_until = reserve(request.user, cart)
+    except OutOfStock as e:
+        messages.error(request, f'Sorry, {e.name} is out of stock in the quantity you asked for. Please update your cart.')
+        return redirect('cart:cart_detail')
+    
     addresses = request.user.addresses.all()
     
     context = {
         'cart': cart,
         'addresses': addresses,
+        'reserved_until': reserved_until,
     }
     return render(request, 'orders/checkout.html', context)
 
@@ -54,49 +64,27 @@ def create_order(request):
     shipping_cost = 500.00  # PKR 500 flat rate
     total = subtotal + tax + shipping_cost
     
-    # Create order
-    order = Order.objects.create(
-        user=request.user,
-        subtotal=subtotal,
-        tax=tax,
-        shipping_cost=shipping_cost,
-        total=total,
-        shipping_full_name=shipping_name,
-        shipping_phone=shipping_phone,
-        shipping_address_line1=shipping_address1,
-        shipping_address_line2=shipping_address2,
-        shipping_city=shipping_city,
-        shipping_state=shipping_state,
-        shipping_country=shipping_country,
-        shipping_postal_code=shipping_postal,
-    )
-    
-    # Create order items
-    for item in cart:
-        OrderItem.objects.create(
-            order=order,
-            product=item['product'],
-            variant=item.get('variant'),
-            product_name=item['product'].name,
-            product_sku=item['product'].sku,
-            variant_name=item.get('variant').name if item.get('variant') else '',
-            quantity=item['quantity'],
-            unit_price=item['price'],
-            total_price=item['total_price'],
+    # Create the order and take stock in one transaction
+    try:
+        order = place_order(
+            request.user,
+            cart,
+            subtotal=subtotal,
+            tax=tax,
+            shipping_cost=shipping_cost,
+            total=total,
+            shipping_full_name=shipping_name,
+            shipping_phone=shipping_phone,
+            shipping_address_line1=shipping_address1,
+            shipping_address_line2=shipping_address2,
+            shipping_city=shipping_city,
+            shipping_state=shipping_state,
+            shipping_country=shipping_country,
+            shipping_postal_code=shipping_postal,
         )
-        
-        # Update product stock
-        item['product'].stock -= item['quantity']
-        item['product'].sales_count += item['quantity']
-        item['product'].save()
-    
-    # Create status history
-    OrderStatusHistory.objects.create(
-        order=order,
-        status='pending',
-        note='Order created',
-        created_by=request.user
-    )
+    except OutOfStock as e:
+        messages.error(request, f'Sorry, {e.name} is out of stock in the quantity you asked for. Please update your cart.')
+        return redirect('cart:cart_detail')
     
     # Clear cart
     cart.clear()
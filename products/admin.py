@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Category, Brand, Product, ProductImage, ProductVariant, ProductSpecification
+from .models import Category, Brand, Product, ProductImage, ProductVariant, ProductSpecification, ProductRecommendation
+from .caching import invalidate_catalog_cache
+from .page_cache import invalidate_product_pages
 
 
 class ProductImageInline(admin.TabularInline):
@@ -28,6 +31,7 @@ class ProductSpecificationInline(admin.TabularInline):
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'parent', 'product_count', 'is_active', 'created_at']
+    ordering = ['path']
     list_filter = ['is_active', 'parent', 'created_at']
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
@@ -41,11 +45,13 @@ class CategoryAdmin(admin.ModelAdmin):
     
     def mark_as_active(self, request, queryset):
         updated = queryset.update(is_active=True)
+        invalidate_catalog_cache()
         self.message_user(request, f'{updated} categories marked as active.')
     mark_as_active.short_description = 'Mark selected as Active'
     
     def mark_as_inactive(self, request, queryset):
         updated = queryset.update(is_active=False)
+        invalidate_catalog_cache()
         self.message_user(request, f'{updated} categories marked as inactive.')
     mark_as_inactive.short_description = 'Mark selected as Inactive'
 
@@ -66,11 +72,13 @@ class BrandAdmin(admin.ModelAdmin):
     
     def mark_as_active(self, request, queryset):
         updated = queryset.update(is_active=True)
+        invalidate_catalog_cache()
         self.message_user(request, f'{updated} brands marked as active.')
     mark_as_active.short_description = 'Mark selected as Active'
     
     def mark_as_inactive(self, request, queryset):
         updated = queryset.update(is_active=False)
+        invalidate_catalog_cache()
         self.message_user(request, f'{updated} brands marked as inactive.')
     mark_as_inactive.short_description = 'Mark selected as Inactive'
 
@@ -83,7 +91,7 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     list_editable = ['is_featured', 'is_active']
     inlines = [ProductImageInline, ProductVariantInline, ProductSpecificationInline]
-    readonly_fields = ['image_preview', 'views', 'sales_count', 'created_at', 'updated_at']
+    readonly_fields = ['image_preview', 'views', 'sales_count', 'rating_average', 'rating_count', 'created_at', 'updated_at']
     date_hierarchy = 'created_at'
     actions = ['mark_as_featured', 'mark_as_active', 'mark_as_inactive', 'duplicate_products']
     
@@ -107,7 +115,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('is_featured', 'is_new', 'is_active')
         }),
         ('Statistics', {
-            'fields': ('views', 'sales_count', 'created_at', 'updated_at'),
+            'fields': ('views', 'sales_count', 'rating_average', 'rating_count', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
         ('SEO', {
@@ -141,17 +149,22 @@ class ProductAdmin(admin.ModelAdmin):
     stock_status.short_description = 'Stock'
     
     def mark_as_featured(self, request, queryset):
-        updated = queryset.update(is_featured=True)
+        updated = queryset.update(is_featured=True, updated_at=timezone.now())
+        invalidate_catalog_cache()
         self.message_user(request, f'{updated} products marked as featured.')
     mark_as_featured.short_description = 'Mark selected as Featured'
     
     def mark_as_active(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = queryset.update(is_active=True, updated_at=timezone.now())
+        invalidate_catalog_cache()
+        invalidate_product_pages(queryset)
         self.message_user(request, f'{updated} products marked as active.')
     mark_as_active.short_description = 'Mark selected as Active'
     
     def mark_as_inactive(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = queryset.update(is_active=False, updated_at=timezone.now())
+        invalidate_catalog_cache()
+        invalidate_product_pages(queryset)
         self.message_user(request, f'{updated} products marked as inactive.')
     mark_as_inactive.short_description = 'Mark selected as Inactive'
     
@@ -161,6 +174,16 @@ class ProductAdmin(admin.ModelAdmin):
             product.name = f"{product.name} (Copy)"
             product.sku = f"{product.sku}-copy"
             product.slug = f"{product.slug}-copy"
+            product.rating_sum = product.rating_count = 0
+            product.rating_average = 0
             product.save()
         self.message_user(request, f'{queryset.count()} products duplicated.')
     duplicate_products.short_description = 'Duplicate selected products'
+
+
+@admin.register(ProductRecommendation)
+class ProductRecommendationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'rank', 'recommended', 'score']
+    search_fields = ['product__name', 'recommended__name']
+    list_select_related = ['product', 'recommended']
+    raw_id_fields = ['product', 'recommended']
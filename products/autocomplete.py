@@ -0,0 +1,121 @@
+"""
+In-memory prefix index for search-box autocomplete.
+
+Each worker keeps sorted arrays of normalised name keys for active products,
+brands and categories; a lookup is a binary search plus a short scan (or a
+dict hit for one to three letter prefixes, ranked at build time), so the
+autocomplete endpoint never queries the database. Every word of a name starts
+a key, so "run" finds "Trail Running Shoe".
+
+Refreshed on catalog changes like every ``indexes.CatalogIndex``.
+"""
+import bisect
+import heapq
+import re
+import unicodedata
+from collections import defaultdict
+
+from .indexes import CatalogIndex
+from .models import Product, Category, Brand
+from .utils import url_builder
+
+KEY_LENGTH = 40
+# Prefixes up to this length have their best matches ranked at build time;
+# longer ones are selective enough to rank at lookup, scanning at most SCAN_LIMIT keys
+SHORT_PREFIX = 3
+MAX_RESULTS = 20
+SCAN_LIMIT = 400
+WORD_START = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Casefold and strip accents, so "Café" matches "cafe" """
+    text = text.casefold()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+class PrefixArray:
+    """Sorted (key, entry) arrays searched with bisect"""
+
+    def __init__(self, entries):
+        """``entries`` is an iterable of (name, weight, payload) tuples"""
+        entries = list(entries)
+        pairs = []
+        for position, (name, weight, payload) in enumerate(entries):
+            text = normalize(name)
+            seen = set()
+            for word in WORD_START.finditer(text):
+                key = text[word.start():word.start() + KEY_LENGTH]
+                if key not in seen:
+                    seen.add(key)
+                    pairs.append((key, position))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.positions = [position for _, position in pairs]
+        self.entries = [(weight, name, payload) for name, weight, payload in entries]
+
+        by_prefix = defaultdict(set)
+        for key, position in pairs:
+            for length in range(1, min(len(key), SHORT_PREFIX) + 1):
+                by_prefix[key[:length]].add(position)
+        self.short = {prefix: self._rank(positions, MAX_RESULTS) for prefix, positions in by_prefix.items()}
+
+    def _rank(self, positions, limit):
+        return heapq.nsmallest(limit, positions, key=lambda position: (-self.entries[position][0], self.entries[position][1]))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, prefix, limit):
+        """Best ``limit`` payloads whose name has a word starting with ``prefix``"""
+        if len(prefix) <= SHORT_PREFIX:
+            return [self.entries[position][2] for position in self.short.get(prefix, [])[:limit]]
+        prefix = prefix[:KEY_LENGTH]
+        start = bisect.bisect_left(self.keys, prefix)
+        matched = set()
+        for index in range(start, min(start + SCAN_LIMIT, len(self.keys))):
+            if not self.keys[index].startswith(prefix):
+                break
+            matched.add(self.positions[index])
+        return [self.entries[position][2] for position in self._rank(matched, limit)]
+
+
+class AutocompleteIndex(CatalogIndex):
+    """Per-worker index over product, brand and category names"""
+
+    def load(self):
+        product_url = url_builder('products:product_detail')
+        brand_url = url_builder('products:brand_detail')
+        category_url = url_builder('products:category_detail')
+        products = PrefixArray(
+            (name, sales_count, {'type': 'product', 'label': name, 'url': product_url(slug)})
+            for name, slug, sales_count in Product.objects.filter(is_active=True)
+            .values_list('name', 'slug', 'sales_count').iterator(chunk_size=5000)
+        )
+        brands = PrefixArray(
+            (name, 0, {'type': 'brand', 'label': name, 'url': brand_url(slug)})
+            for name, slug in Brand.objects.filter(is_active=True).values_list('name', 'slug')
+        )
+        categories = PrefixArray(
+            (name, 0, {'type': 'category', 'label': name, 'url': category_url(slug)})
+            for name, slug in Category.objects.filter(is_active=True).values_list('name', 'slug')
+        )
+        return products, brands, categories
+
+    def suggest(self, query, limit=8):
+        """
+        At most ``limit`` suggestions: brand and category matches first, then
+        the best selling products, which always keep half of the slots.
+        """
+        prefix = normalize(query).strip()
+        if not prefix:
+            return []
+        products, brands, categories = self.current()
+        results = (brands.lookup(prefix, 3) + categories.lookup(prefix, 3))[:limit - limit // 2]
+        return results + products.lookup(prefix, limit - len(results))
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,49 @@
+"""
+Cache for read-mostly catalog fragments (homepage lists, filter taxonomy).
+
+Keys embed a catalog version number. Any change to products, categories or
+brands bumps the version, which orphans every old key at once; orphans expire
+on their own. Only get/add/incr/set are used, so this works the same on the
+local-memory, file-based and Redis cache backends.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate_catalog_cache():
+    """
+    Bump the catalog version so every cached fragment is rebuilt on next use.
+
+    Inside a transaction the bump waits for the commit: bumping earlier would
+    let a concurrent request cache the old rows under the new version.
+    """
+    transaction.on_commit(_bump_version)
+
+
+def _bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Version key missing (evicted or never set): start a fresh one
+        cache.set(VERSION_KEY, 2, timeout=None)
+
+
+def cached_fragment(name, builder, timeout=None):
+    """Return the cached value of ``name`` for the current catalog version, building it on a miss"""
+    key = f'catalog:v{get_catalog_version()}:{name}'
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, timeout if timeout is not None else getattr(settings, 'CATALOG_CACHE_TIMEOUT', 900))
+    return value
@@ -0,0 +1,193 @@
+"""
+Write-behind product view counter.
+
+``product_detail`` records a view in a buffer instead of issuing an UPDATE per
+request. Buffered counts are written with ``views = views + n`` bulk updates
+once ``PRODUCT_VIEWS_FLUSH_THRESHOLD`` views are pending or
+``PRODUCT_VIEWS_FLUSH_INTERVAL`` seconds have passed, and when a web worker
+exits (see ``register_shutdown_flush``).
+
+``PRODUCT_VIEWS_BUFFER = 'memory'`` keeps counts per worker process, so only
+that worker can write them; views pending in a worker that is killed rather
+than shut down are lost. ``'cache'`` keeps them in the default cache, where any
+process, e.g. ``manage.py flush_product_views``, can flush them.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'product_views:{}'
+UPDATE_BATCH_SIZE = 500
+
+
+class MemoryViewBuffer:
+    """Per-process buffer"""
+
+    # Other processes cannot reach these counts
+    shared = False
+
+    def __init__(self):
+        self._counts = Counter()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def add(self, product_id, count=1):
+        with self._lock:
+            self._counts[product_id] += count
+            self._pending += count
+            return self._pending
+
+    def drain(self, everything=False):
+        """Take pending counts (this process only holds its own, so ``everything`` changes nothing)"""
+        with self._lock:
+            counts, self._counts, self._pending = self._counts, Counter(), 0
+        return counts
+
+    def restore(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+            self._pending += sum(counts.values())
+
+
+class CacheViewBuffer:
+    """Buffer in the shared cache, so pending views survive worker restarts"""
+
+    shared = True
+
+    def __init__(self):
+        self._touched = set()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def add(self, product_id, count=1):
+        key = CACHE_KEY.format(product_id)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, timeout=None):
+                cache.incr(key, count)
+        with self._lock:
+            self._touched.add(product_id)
+            self._pending += count
+            return self._pending
+
+    def drain(self, everything=False):
+        """Take pending counts; ``everything`` scans all products, not just ones this process saw"""
+        if everything:
+            product_ids = Product.objects.values_list('id', flat=True).iterator(chunk_size=2000)
+        else:
+            with self._lock:
+                product_ids, self._touched = self._touched, set()
+        with self._lock:
+            self._pending = 0
+
+        counts = Counter()
+        batch = []
+        for product_id in product_ids:
+            batch.append(product_id)
+            if len(batch) == 1000:
+                counts.update(self._take(batch))
+                batch = []
+        counts.update(self._take(batch))
+        return counts
+
+    def _take(self, product_ids):
+        keys = {CACHE_KEY.format(product_id): product_id for product_id in product_ids}
+        taken = {}
+        for key, count in cache.get_many(keys).items():
+            if count:
+                # decr rather than delete so views recorded meanwhile are kept
+                cache.decr(key, count)
+                taken[keys[key]] = count
+        return taken
+
+    def restore(self, counts):
+        for product_id, count in counts.items():
+            self.add(product_id, count)
+
+
+class ProductViewCounter:
+    """Collects product views and writes them to the database in batches"""
+
+    def __init__(self, buffer, threshold=100, interval=30):
+        self.buffer = buffer
+        self.threshold = threshold
+        self.interval = interval
+        self._last_flush = time.monotonic()
+        self._flush_lock = threading.Lock()
+
+    def record(self, product_id):
+        """Count one view, flushing when the threshold or interval is reached"""
+        pending = self.buffer.add(product_id)
+        if pending >= self.threshold or time.monotonic() - self._last_flush >= self.interval:
+            # Another request already flushing is good enough
+            try:
+                self.flush(wait=False)
+            except Exception:
+                # The counts are back in the buffer; a busy database must not fail the page
+                logger.exception('Could not write product views, keeping them for the next flush')
+
+    def flush(self, everything=False, wait=True):
+        """Write buffered views to the database; returns the number of views written"""
+        if not self._flush_lock.acquire(blocking=wait):
+            return 0
+        try:
+            self._last_flush = time.monotonic()
+            counts = self.buffer.drain(everything=everything)
+            if not counts:
+                return 0
+            try:
+                write_views(counts)
+            except Exception:
+                self.buffer.restore(counts)
+                raise
+            return sum(counts.values())
+        finally:
+            self._flush_lock.release()
+
+
+def write_views(counts):
+    """Apply view counts with one UPDATE per distinct increment"""
+    ids_by_count = defaultdict(list)
+    for product_id, count in counts.items():
+        ids_by_count[count].append(product_id)
+
+    with transaction.atomic():
+        for count, product_ids in ids_by_count.items():
+            for start in range(0, len(product_ids), UPDATE_BATCH_SIZE):
+                Product.objects.filter(id__in=product_ids[start:start + UPDATE_BATCH_SIZE]).update(
+                    views=F('views') + count
+                )
+
+
+def _build_counter():
+    buffer_class = CacheViewBuffer if getattr(settings, 'PRODUCT_VIEWS_BUFFER', 'memory') == 'cache' else MemoryViewBuffer
+    counter = ProductViewCounter(
+        buffer_class(),
+        threshold=getattr(settings, 'PRODUCT_VIEWS_FLUSH_THRESHOLD', 100),
+        interval=getattr(settings, 'PRODUCT_VIEWS_FLUSH_INTERVAL', 30),
+    )
+    return counter
+
+
+view_counter = _build_counter()
+
+
+def register_shutdown_flush():
+    """
+    Flush buffered views when the process exits.
+
+    Called from the WSGI/ASGI entry points only, so test runs and management
+    commands never write leftover counts to a different database at exit.
+    """
+    atexit.register(view_counter.flush)
@@ -0,0 +1,134 @@
+"""
+In-memory facet counts for the product list sidebar.
+
+Active products are numbered in (price, id) order and every brand, category
+subtree and price bucket is held as a bitmap over those numbers (a Python int;
+bit n set means the nth product matches). Counting what a combination of
+filters leaves is then AND plus ``int.bit_count()`` instead of a SQL GROUP BY
+per facet, and because of the price ordering any price range is a contiguous
+run of bits found with bisect.
+
+Counts for a facet ignore that facet's own filter, so the sidebar shows how
+many products picking another brand (category, price band) would give.
+Refreshed on catalog changes like every ``indexes.CatalogIndex``.
+"""
+import bisect
+from collections import defaultdict
+from decimal import Decimal
+
+from .indexes import CatalogIndex
+from .models import Product, Category
+
+# (label, min_price, max_price); bounds are inclusive, None means open
+PRICE_BUCKETS = [
+    ('Under PKR 1,000', None, Decimal('999.99')),
+    ('PKR 1,000 - 5,000', Decimal('1000'), Decimal('4999.99')),
+    ('PKR 5,000 - 10,000', Decimal('5000'), Decimal('9999.99')),
+    ('PKR 10,000 - 25,000', Decimal('10000'), Decimal('24999.99')),
+    ('PKR 25,000 - 50,000', Decimal('25000'), Decimal('49999.99')),
+    ('PKR 50,000 and above', Decimal('50000'), None),
+]
+
+
+def _bitmap(positions, size):
+    """Int with the given bit positions set, built in linear time"""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class FacetSnapshot:
+    """Bitmaps for one version of the catalog"""
+
+    def __init__(self, rows, category_paths):
+        """``rows`` are (id, price, brand_id, category_id) ordered by price, id"""
+        self.prices = []
+        self.positions = {}
+        by_brand = defaultdict(list)
+        by_category = defaultdict(list)
+        for position, (product_id, price, brand_id, category_id) in enumerate(rows):
+            self.prices.append(price)
+            self.positions[product_id] = position
+            if brand_id is not None:
+                by_brand[brand_id].append(position)
+            by_category[category_id].append(position)
+
+        size = len(self.prices)
+        self.all = (1 << size) - 1
+
+        # A category's bitmap covers its whole subtree: credit every ancestor on the path
+        step = Category.PATH_STEP
+        by_subtree = defaultdict(list)
+        for category_id, positions in by_category.items():
+            path = category_paths.get(category_id, '')
+            for start in range(0, len(path), step):
+                by_subtree[int(path[start:start + step])].extend(positions)
+
+        self.brands = {brand_id: _bitmap(positions, size) for brand_id, positions in by_brand.items()}
+        self.categories = {category_id: _bitmap(positions, size) for category_id, positions in by_subtree.items()}
+
+    def price_range(self, min_price=None, max_price=None):
+        """Bitmap of products priced within [min_price, max_price]"""
+        low = bisect.bisect_left(self.prices, min_price) if min_price is not None else 0
+        high = bisect.bisect_right(self.prices, max_price) if max_price is not None else len(self.prices)
+        if high <= low:
+            return 0
+        return ((1 << high) - 1) ^ ((1 << low) - 1)
+
+    def products(self, ids):
+        """Bitmap of the given product ids (e.g. search hits)"""
+        positions = self.positions
+        return _bitmap((positions[product_id] for product_id in ids if product_id in positions), len(self.prices))
+
+    def counts(self, category_id=None, brand_id=None, min_price=None, max_price=None, product_ids=None):
+        """Facet counts under the given filters"""
+        filters = {}
+        if category_id is not None:
+            filters['category'] = self.categories.get(category_id, 0)
+        if brand_id is not None:
+            filters['brand'] = self.brands.get(brand_id, 0)
+        if min_price is not None or max_price is not None:
+            filters['price'] = self.price_range(min_price, max_price)
+        if product_ids is not None:
+            filters['search'] = self.products(product_ids)
+
+        def matching(ignore=None):
+            result = self.all
+            for name, bitmap in filters.items():
+                if name != ignore:
+                    result &= bitmap
+            return result
+
+        base = matching('brand')
+        brands = {brand_id: (bitmap & base).bit_count() for brand_id, bitmap in self.brands.items()}
+        base = matching('category')
+        categories = {category_id: (bitmap & base).bit_count() for category_id, bitmap in self.categories.items()}
+        base = matching('price')
+        prices = [(self.price_range(low, high) & base).bit_count() for label, low, high in PRICE_BUCKETS]
+        return {
+            'total': matching().bit_count(),
+            'brands': brands,
+            'categories': categories,
+            'prices': prices,
+        }
+
+
+class FacetIndex(CatalogIndex):
+    """Per-worker facet bitmaps over active products"""
+
+    def load(self):
+        rows = (
+            Product.objects.filter(is_active=True)
+            .order_by('price', 'id')
+            .values_list('id', 'price', 'brand_id', 'category_id')
+            .iterator(chunk_size=5000)
+        )
+        category_paths = dict(Category.objects.filter(is_active=True).values_list('id', 'path'))
+        return FacetSnapshot(rows, category_paths)
+
+    def counts(self, **filters):
+        return self.current().counts(**filters)
+
+
+facet_index = FacetIndex()
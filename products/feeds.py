@@ -0,0 +1,129 @@
+"""
+Product feeds for shopping marketplaces (CSV, JSONL or Google-style RSS XML).
+
+Everything here is a generator: products are read with ``.iterator()`` in
+chunks, turned into text and optionally gzipped a block at a time, so the
+``product_feed`` view and the ``export_product_feed`` command use constant
+memory whatever the catalog size.
+
+A full feed lists active products. A "changed since" feed lists every product
+whose ``updated_at`` is later than the given time, inactive ones included
+(as out of stock) so marketplaces can delist them.
+"""
+import csv
+import io
+import json
+import zlib
+from xml.sax.saxutils import escape
+
+from .models import Product
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'xml': 'application/rss+xml',
+}
+COLUMNS = [
+    'id', 'title', 'description', 'link', 'image_link', 'price', 'sale_price',
+    'availability', 'brand', 'product_type', 'condition', 'updated_at',
+]
+CHUNK_SIZE = 2000
+# Text is gzipped and yielded in blocks of roughly this many characters
+BLOCK_SIZE = 64 * 1024
+
+
+def feed_products(since=None):
+    """Products for a feed, streamed in primary key order"""
+    products = Product.objects.select_related('brand', 'category').only(
+        'sku', 'name', 'slug', 'short_description', 'description', 'main_image', 'price', 'compare_price',
+        'stock', 'is_active', 'updated_at', 'brand__name', 'category__name',
+    )
+    if since is None:
+        products = products.filter(is_active=True)
+    else:
+        products = products.filter(updated_at__gt=since)
+    return products.order_by('pk').iterator(chunk_size=CHUNK_SIZE)
+
+
+def feed_items(products, base_url):
+    """One dict per product, keyed by COLUMNS"""
+    base_url = base_url.rstrip('/')
+    for product in products:
+        on_sale = product.compare_price and product.compare_price > product.price
+        yield {
+            'id': product.sku,
+            'title': product.name,
+            'description': product.short_description or product.description,
+            'link': base_url + product.get_absolute_url(),
+            'image_link': base_url + product.main_image.url if product.main_image else '',
+            'price': f'{product.compare_price if on_sale else product.price} PKR',
+            'sale_price': f'{product.price} PKR' if on_sale else '',
+            'availability': 'in_stock' if product.is_active and product.stock > 0 else 'out_of_stock',
+            'brand': product.brand.name if product.brand else '',
+            'product_type': product.category.name,
+            'condition': 'new',
+            'updated_at': product.updated_at.isoformat(),
+        }
+
+
+def csv_lines(items):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for item in items:
+        writer.writerow(item)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_lines(items):
+    for item in items:
+        yield json.dumps(item, ensure_ascii=False) + '\n'
+
+
+def xml_lines(items, link=''):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+    yield f'<title>ShopHub products</title>\n<link>{escape(link)}</link>\n<description>Product feed</description>\n'
+    for item in items:
+        fields = ''.join(
+            f'<g:{name}>{escape(str(value))}</g:{name}>' for name, value in item.items() if value
+        )
+        yield f'<item>{fields}</item>\n'
+    yield '</channel>\n</rss>\n'
+
+
+WRITERS = {
+    'csv': csv_lines,
+    'jsonl': jsonl_lines,
+    'xml': xml_lines,
+}
+
+
+def blocks(lines, compress=False):
+    """Join text lines into blocks of about BLOCK_SIZE characters, as UTF-8 or gzip bytes"""
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            data = ''.join(pending).encode()
+            pending, size = [], 0
+            data = gzip.compress(data) if gzip else data
+            if data:
+                yield data
+    data = ''.join(pending).encode()
+    if gzip:
+        data = gzip.compress(data) + gzip.flush()
+    if data:
+        yield data
+
+
+def generate_feed(file_format, base_url, since=None, compress=False):
+    """Byte blocks of a complete feed"""
+    items = feed_items(feed_products(since), base_url)
+    lines = xml_lines(items, link=base_url) if file_format == 'xml' else WRITERS[file_format](items)
+    return blocks(lines, compress=compress)
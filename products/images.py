@@ -0,0 +1,233 @@
+"""
+Responsive derivatives of uploaded images.
+
+Originals (product, gallery, category, brand and review images) are resized
+to ``IMAGE_DERIVATIVE_WIDTHS`` and encoded as AVIF, WebP and JPEG/PNG by
+``imaging.render_derivatives`` in a process pool. Renditions are stored
+content-addressed next to the original::
+
+    products/shoe.jpg -> products/derived/<sha256[:16]>/320w.webp
+
+so re-uploading the same picture reuses them. An ``ImageDerivative`` row per
+original records what exists; templates read it through the cache with the
+``{% picture %}`` tag and fall back to the original until it is built. Views
+rendering many images look them up in one batch with ``prefetch_manifests``.
+
+Uploads are processed after the saving transaction commits, in a background
+thread feeding the pool (inline with ``IMAGE_DERIVATIVES_ASYNC = False``).
+``build_image_derivatives`` backfills existing media.
+"""
+import hashlib
+import logging
+import multiprocessing
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from . import imaging
+from .models import ImageDerivative
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_KEY = 'image_derivatives:{}'
+# Originals without derivatives are looked up again after this many seconds
+MISSING_TIMEOUT = 60
+CONTENT_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+
+def widths():
+    return tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (160, 320, 640, 1024)))
+
+
+def formats():
+    return tuple(getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', ('avif', 'webp')))
+
+
+def derivative_name(source, digest, width, file_format):
+    """Storage name of one rendition, in a folder named after the original's content"""
+    folder = posixpath.dirname(source)
+    return posixpath.join(folder, 'derived', digest[:16], f'{width}w.{file_format}')
+
+
+# Lookups
+
+def _manifest_key(source):
+    # Upload names may contain characters memcached rejects
+    return MANIFEST_KEY.format(hashlib.md5(source.encode()).hexdigest())
+
+
+def _manifest(derivative):
+    return {
+        'digest': derivative.digest,
+        'width': derivative.width,
+        'height': derivative.height,
+        'widths': derivative.widths,
+        'formats': derivative.formats,
+        'fallback': derivative.fallback,
+    }
+
+
+def get_manifest(source):
+    """What ``source`` has been rendered to, or None while it has no derivatives"""
+    key = _manifest_key(source)
+    manifest = cache.get(key)
+    if manifest is None:
+        derivative = ImageDerivative.objects.filter(source=source).first()
+        manifest = _manifest(derivative) if derivative else False
+        cache.set(key, manifest, None if derivative else MISSING_TIMEOUT)
+    return manifest or None
+
+
+def get_manifests(sources):
+    """``get_manifest`` for many originals: one cache round trip and at most one query"""
+    keys = {_manifest_key(source): source for source in set(sources) if source}
+    manifests = {keys[key]: manifest for key, manifest in cache.get_many(keys).items()}
+    missing = set(keys.values()) - manifests.keys()
+    if missing:
+        found = {
+            derivative.source: _manifest(derivative)
+            for derivative in ImageDerivative.objects.filter(source__in=missing)
+        }
+        cache.set_many({_manifest_key(source): manifest for source, manifest in found.items()}, None)
+        cache.set_many({_manifest_key(source): False for source in missing - found.keys()}, MISSING_TIMEOUT)
+        manifests.update({source: found.get(source, False) for source in missing})
+    return {source: manifest or None for source, manifest in manifests.items()}
+
+
+def prefetch_manifests(images):
+    """
+    Look up the manifests of many image field files at once (e.g. a page of
+    product cards) and keep them on the files for ``{% picture %}``.
+    """
+    images = [image for image in images if image]
+    manifests = get_manifests(image.name for image in images)
+    for image in images:
+        image._manifest = manifests[image.name]
+
+
+def manifest_for(image):
+    """Manifest of an image field file, prefetched when possible"""
+    try:
+        return image._manifest
+    except AttributeError:
+        return get_manifest(image.name)
+
+
+def srcsets(source, manifest=None):
+    """``{format: srcset}`` for an original (fallback format last), or {} without derivatives"""
+    manifest = manifest or get_manifest(source)
+    if not manifest:
+        return {}
+    result = {}
+    for file_format in (*manifest['formats'], manifest['fallback']):
+        result[file_format] = ', '.join(
+            f"{default_storage.url(derivative_name(source, manifest['digest'], width, file_format))} {width}w"
+            for width in manifest['widths']
+        )
+    return result
+
+
+# Generation
+
+def store_derivatives(source, data, rendered):
+    """Save renditions from ``imaging.render_derivatives`` and record them for ``source``"""
+    digest = imaging.digest(data)
+    for (file_format, width), content in rendered['renditions'].items():
+        name = derivative_name(source, digest, width, file_format)
+        # Content-addressed: an existing file already holds these bytes
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(content))
+    derivative, _ = ImageDerivative.objects.update_or_create(source=source, defaults={
+        'digest': digest,
+        'width': rendered['width'],
+        'height': rendered['height'],
+        'widths': sorted({width for _, width in rendered['renditions']}),
+        'formats': list(formats()),
+        'fallback': rendered['fallback'],
+    })
+    cache.set(_manifest_key(source), _manifest(derivative), None)
+    return derivative
+
+
+def read_source(source):
+    """Bytes of an original, or None when the file is gone"""
+    try:
+        with default_storage.open(source, 'rb') as original:
+            return original.read()
+    except FileNotFoundError:
+        return None
+
+
+def is_current(source, data):
+    """True when ``source`` already has derivatives of these bytes at the configured sizes"""
+    return ImageDerivative.objects.filter(
+        source=source, digest=imaging.digest(data), formats=list(formats()),
+    ).exists()
+
+
+def build_derivatives(source, force=False):
+    """Render and store derivatives of one original in this process"""
+    data = read_source(source)
+    if data is None or (not force and is_current(source, data)):
+        return None
+    return store_derivatives(source, data, imaging.render_derivatives(data, widths(), formats()))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(max_workers=None):
+    """Process pool shared by a web worker's uploads"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers or getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                # Forking a threaded server process is unsafe; imaging needs no Django setup
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _build_in_pool(source):
+    try:
+        data = read_source(source)
+        if data is None or is_current(source, data):
+            return
+        rendered = get_pool().submit(imaging.render_derivatives, data, widths(), formats()).result()
+        store_derivatives(source, data, rendered)
+    except Exception:
+        logger.exception('Could not build image derivatives for %s', source)
+    finally:
+        connection.close()
+
+
+def queue_derivatives(*sources):
+    """Build derivatives of newly saved originals once the current transaction commits"""
+    # Uploads never overwrite, so a name with derivatives is an unchanged image
+    sources = [source for source in sources if source and not get_manifest(source)]
+    if not sources:
+        return
+
+    def start():
+        for source in sources:
+            if not getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+                try:
+                    build_derivatives(source)
+                except Exception:
+                    logger.exception('Could not build image derivatives for %s', source)
+                continue
+            threading.Thread(target=_build_in_pool, args=(source,), name='image-derivatives', daemon=True).start()
+
+    transaction.on_commit(start)
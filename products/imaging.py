@@ -0,0 +1,56 @@
+"""
+Pillow-only image resizing, safe to run in worker processes.
+
+Nothing here imports Django: ``render_derivatives`` takes the bytes of an
+original upload and returns encoded renditions, so it can be shipped to a
+``ProcessPoolExecutor`` without setting Django up in the children.
+"""
+import hashlib
+import io
+
+from PIL import Image, ImageOps
+
+ENCODE_OPTIONS = {
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+    'png': {'format': 'PNG', 'optimize': True},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 55, 'speed': 8},
+}
+
+
+def digest(data):
+    """Content address of an original upload"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def render_derivatives(data, widths, formats=('avif', 'webp')):
+    """
+    Resize ``data`` to each width up to the original's and encode it.
+
+    Returns the original's size, the fallback format and
+    ``{(format, width): bytes}`` under ``renditions``.
+    Besides ``formats``, every width gets a JPEG (PNG for images with
+    transparency) for browsers without WebP/AVIF support. Originals narrower
+    than the largest width also get a rendition at their own width.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'png' if has_alpha else 'jpeg'
+
+    targets = {width for width in widths if width <= image.width}
+    if image.width < max(widths):
+        # The original's own width is the sharpest rendition available
+        targets.add(image.width)
+    renditions = {}
+    for width in sorted(targets):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        for file_format in (*formats, fallback):
+            buffer = io.BytesIO()
+            resized.save(buffer, **ENCODE_OPTIONS[file_format])
+            renditions[(file_format, width)] = buffer.getvalue()
+    return {'width': image.width, 'height': image.height, 'renditions': renditions, 'fallback': fallback}
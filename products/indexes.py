@@ -0,0 +1,68 @@
+"""
+Per-worker in-memory catalog structures (autocomplete, facets).
+
+Each index is tagged with the catalog cache version it was built from (see
+``caching.py``). The first use builds it synchronously; after that, a version
+change starts a rebuild in a background thread and callers keep reading the
+previous snapshot until the new one is swapped in. With
+``CATALOG_INDEX_BACKGROUND_REFRESH = False`` the rebuild happens inline
+instead (tests, single-threaded scripts).
+"""
+import logging
+import threading
+
+from django.conf import settings
+from .caching import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogIndex:
+    """Base class: subclasses implement ``load()`` returning an immutable snapshot"""
+
+    def __init__(self):
+        self.version = None
+        self.snapshot = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+
+    def load(self):
+        raise NotImplementedError
+
+    def build(self):
+        """Load a fresh snapshot from the database and swap it in"""
+        version = get_catalog_version()
+        snapshot = self.load()
+        with self._lock:
+            self.snapshot, self.version = snapshot, version
+
+    def warm(self):
+        """Build in the background, e.g. when a web worker starts"""
+        self._start_rebuild()
+
+    def _start_rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name=type(self).__name__, daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Could not rebuild %s', type(self).__name__)
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def current(self):
+        """The latest snapshot, building it on first use"""
+        if self.snapshot is None:
+            self.build()
+        elif self.version != get_catalog_version():
+            if getattr(settings, 'CATALOG_INDEX_BACKGROUND_REFRESH', True):
+                self._start_rebuild()
+            else:
+                self.build()
+        return self.snapshot
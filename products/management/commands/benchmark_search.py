@@ -0,0 +1,96 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from products.models import Category, Brand, Product
+from products import search
+
+
+WORDS = [
+    'air', 'max', 'ultra', 'boost', 'pro', 'lite', 'classic', 'runner', 'trail', 'street',
+    'wireless', 'smart', 'watch', 'phone', 'hoodie', 'fleece', 'cotton', 'leather', 'denim', 'jacket',
+    'sneaker', 'sandal', 'backpack', 'wallet', 'charger', 'speaker', 'earbuds', 'camera', 'tablet', 'laptop',
+]
+
+QUERIES = ['air max', 'wireless', 'leather jacket', 'pro', 'trail runner', 'cam', 'brand7', 'sku-0042']
+
+
+class Command(BaseCommand):
+    help = 'Compare full-text search latency with the icontains path on a synthetic catalog (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Number of synthetic products')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query and strategy')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.build_catalog(options['products'])
+            self.stdout.write('Building search index...')
+            search.rebuild_index()
+
+            for query in QUERIES:
+                keyword = self.measure(options['repeat'], lambda: self.keyword_page(query))
+                fulltext = self.measure(options['repeat'], lambda: self.fulltext_page(query))
+                self.stdout.write(
+                    f'{query!r:18} icontains median {keyword[0]:8.2f} ms  p95 {keyword[1]:8.2f} ms  |  '
+                    f'full-text median {fulltext[0]:8.2f} ms  p95 {fulltext[1]:8.2f} ms'
+                )
+
+            # Never keep the synthetic catalog
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('✓ Benchmark finished, synthetic data rolled back'))
+
+    def build_catalog(self, count):
+        """Bulk insert a synthetic catalog"""
+        self.stdout.write(f'Creating {count} synthetic products...')
+        rng = random.Random(42)
+        # Descriptions draw from a wide vocabulary so term selectivity resembles real copy
+        vocabulary = WORDS + [f'term{i}' for i in range(5000)]
+        categories = Category.objects.bulk_create(
+            [Category(name=f'Category {i}', slug=f'bench-category-{i}') for i in range(50)]
+        )
+        brands = Brand.objects.bulk_create(
+            [Brand(name=f'Brand{i}', slug=f'bench-brand-{i}') for i in range(200)]
+        )
+
+        batch = []
+        for i in range(count):
+            name = ' '.join(rng.sample(WORDS, 3)).title()
+            batch.append(Product(
+                name=name,
+                slug=f'bench-product-{i}',
+                description=' '.join(rng.choices(vocabulary, k=40)),
+                category=rng.choice(categories),
+                brand=rng.choice(brands),
+                price=Decimal(rng.randint(100, 100000)) / 100,
+                sku=f'SKU-{i:06d}',
+                stock=rng.randint(0, 100),
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+    def keyword_page(self, query):
+        """First results page and total the way the views did before the index existed"""
+        products = Product.objects.filter(is_active=True).filter(search.keyword_filter(query))
+        return list(products[:12]), products.count()
+
+    def fulltext_page(self, query):
+        """First results page and total through the full-text index"""
+        products = search.search_products(Product.objects.filter(is_active=True), query)
+        return list(products.order_by('-search_rank')[:12]), products.count()
+
+    def measure(self, repeat, func):
+        """Median and 95th percentile wall time in milliseconds"""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from products import images, imaging
+from products.models import Category, Brand, Product, ProductImage, ProductVariant, ImageDerivative
+from reviews.models import ReviewImage
+
+# Every upload field that gets derivatives
+IMAGE_FIELDS = [
+    (Product, 'main_image'),
+    (ProductImage, 'image'),
+    (ProductVariant, 'image'),
+    (Category, 'image'),
+    (Brand, 'logo'),
+    (ReviewImage, 'image'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Build resized AVIF/WebP/JPEG derivatives for existing product, category, brand and review images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Resizing processes')
+        parser.add_argument('--force', action='store_true', help='Rebuild images that already have derivatives')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        sources = self.sources()
+        current = dict(ImageDerivative.objects.filter(formats=list(images.formats())).values_list('source', 'digest'))
+        self.stdout.write(f'{len(sources)} images, {options["workers"]} workers')
+
+        done = skipped = missing = failed = 0
+        # Originals with the same bytes are rendered once: digest -> [(source, data)]
+        waiting = {}
+        pending = {}
+        max_pending = options['workers'] * 2
+        with ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('spawn')) as pool:
+            for source in sources:
+                data = images.read_source(source)
+                if data is None:
+                    missing += 1
+                    self.stderr.write(f'Missing: {source}')
+                    continue
+                digest = imaging.digest(data)
+                if not options['force'] and current.get(source) == digest:
+                    skipped += 1
+                    continue
+                if digest in waiting:
+                    waiting[digest].append((source, data))
+                    continue
+                waiting[digest] = [(source, data)]
+                pending[pool.submit(imaging.render_derivatives, data, images.widths(), images.formats())] = digest
+
+                # Bound the originals held in memory
+                if len(pending) >= max_pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        stored, errors = self.store(future, waiting.pop(pending.pop(future)))
+                        done, failed = done + stored, failed + errors
+            for future in list(pending):
+                stored, errors = self.store(future, waiting.pop(pending.pop(future)))
+                done, failed = done + stored, failed + errors
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Built derivatives for {done} images in {elapsed:.1f}s '
+            f'({skipped} up to date, {missing} missing, {failed} failed)'
+        ))
+
+    def sources(self):
+        """Distinct storage names of every uploaded image"""
+        names = set()
+        for model, field in IMAGE_FIELDS:
+            names.update(model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).values_list(field, flat=True))
+        return sorted(names)
+
+    def store(self, future, originals):
+        """Save one rendered result for every original with those bytes; returns (stored, failed)"""
+        try:
+            rendered = future.result()
+        except Exception as e:
+            for source, _ in originals:
+                self.stderr.write(f'Failed: {source} ({e})')
+            return 0, len(originals)
+        for source, data in originals:
+            images.store_derivatives(source, data, rendered)
+        return len(originals), 0
@@ -0,0 +1,118 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from orders.models import OrderItem
+from products.models import ProductRecommendation
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # Offline job only; the web app does not need these
+    np = sparse = None
+
+
+class Command(BaseCommand):
+    help = 'Build "frequently bought together" recommendations from order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metric', choices=['cosine', 'lift'], default='cosine')
+        parser.add_argument('--top', type=int, default=8, help='Neighbours stored per product')
+        parser.add_argument('--min-support', type=int, default=2, help='Minimum number of shared orders')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Order lines fetched per round trip')
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('build_recommendations needs numpy and scipy: pip install numpy scipy')
+
+        started = time.monotonic()
+        baskets, product_ids = self.load_baskets(options['chunk_size'])
+        if baskets.nnz == 0:
+            self.stdout.write(self.style.WARNING('No orders to learn from'))
+            return
+        self.stdout.write(f'Loaded {baskets.nnz} order lines over {baskets.shape[0]} orders and {baskets.shape[1]} products')
+
+        scores = self.score(baskets, options['metric'], options['min_support'])
+        rows = self.top_neighbours(scores, product_ids, options['top'])
+
+        with transaction.atomic():
+            ProductRecommendation.objects.all().delete()
+            ProductRecommendation.objects.bulk_create(rows, batch_size=5000)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'✓ Stored {len(rows)} recommendations in {elapsed:.1f}s'))
+
+    def load_baskets(self, chunk_size):
+        """Binary orders x products CSR matrix, streamed from order lines"""
+        lines = (
+            OrderItem.objects
+            .exclude(order__status__in=['cancelled', 'refunded'])
+            .values_list('order_id', 'product_id')
+            .iterator(chunk_size=chunk_size)
+        )
+
+        order_index, product_index = {}, {}
+        row_chunks, col_chunks = [], []
+        rows, cols = [], []
+        for order_id, product_id in lines:
+            rows.append(order_index.setdefault(order_id, len(order_index)))
+            cols.append(product_index.setdefault(product_id, len(product_index)))
+            if len(rows) >= chunk_size:
+                row_chunks.append(np.array(rows, dtype=np.int32))
+                col_chunks.append(np.array(cols, dtype=np.int32))
+                rows, cols = [], []
+        row_chunks.append(np.array(rows, dtype=np.int32))
+        col_chunks.append(np.array(cols, dtype=np.int32))
+
+        row = np.concatenate(row_chunks)
+        col = np.concatenate(col_chunks)
+        baskets = sparse.csr_matrix(
+            (np.ones(len(row), dtype=np.float32), (row, col)),
+            shape=(len(order_index), len(product_index)),
+        )
+        # The same product twice in one order still counts once
+        baskets.data[:] = 1
+
+        product_ids = np.empty(len(product_index), dtype=np.int64)
+        for product_id, index in product_index.items():
+            product_ids[index] = product_id
+        return baskets, product_ids
+
+    def score(self, baskets, metric, min_support):
+        """Sparse products x products similarity from co-occurrence counts"""
+        co_occurrence = (baskets.T @ baskets).tocsr()
+        support = co_occurrence.diagonal().astype(np.float64)
+        co_occurrence.setdiag(0)
+        co_occurrence.data[co_occurrence.data < min_support] = 0
+        co_occurrence.eliminate_zeros()
+
+        coo = co_occurrence.tocoo()
+        counts = coo.data.astype(np.float64)
+        if metric == 'lift':
+            values = counts * baskets.shape[0] / (support[coo.row] * support[coo.col])
+        else:
+            values = counts / np.sqrt(support[coo.row] * support[coo.col])
+        return sparse.csr_matrix((values, (coo.row, coo.col)), shape=co_occurrence.shape)
+
+    def top_neighbours(self, scores, product_ids, top):
+        """Highest scoring neighbours per product as unsaved ProductRecommendation rows"""
+        recommendations = []
+        for index in range(scores.shape[0]):
+            start, end = scores.indptr[index], scores.indptr[index + 1]
+            if start == end:
+                continue
+            values = scores.data[start:end]
+            neighbours = scores.indices[start:end]
+            if len(values) > top:
+                best = np.argpartition(-values, top)[:top]
+            else:
+                best = np.arange(len(values))
+            best = best[np.argsort(-values[best], kind='stable')]
+            for rank, position in enumerate(best, start=1):
+                recommendations.append(ProductRecommendation(
+                    product_id=int(product_ids[index]),
+                    recommended_id=int(product_ids[neighbours[position]]),
+                    rank=rank,
+                    score=float(values[position]),
+                ))
+        return recommendations
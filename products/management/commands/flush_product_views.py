@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.counters import view_counter
+
+
+class Command(BaseCommand):
+    help = 'Write product view counts buffered in the cache (PRODUCT_VIEWS_BUFFER = "cache") to the database'
+
+    def handle(self, *args, **kwargs):
+        if not view_counter.buffer.shared:
+            raise CommandError(
+                'PRODUCT_VIEWS_BUFFER is "memory": pending views live inside each web worker, which writes them '
+                'itself (threshold, interval and shutdown). Use PRODUCT_VIEWS_BUFFER = "cache" to flush them from here.'
+            )
+        written = view_counter.flush(everything=True)
+        self.stdout.write(self.style.SUCCESS(f'✓ Flushed {written} product views'))
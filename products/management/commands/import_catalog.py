@@ -0,0 +1,352 @@
+"""
+One product per CSV row or JSONL line, keyed by ``sku``. Columns: the names in
+PRODUCT_FIELDS, ``category`` as a name path ("Shoes > Running"; missing levels
+are created), ``brand`` by name, and optionally ``variants`` (list of objects
+with sku, name, value, price_adjustment, stock) and ``specifications`` (object
+or list of name/value objects) - JSON strings in CSV. Columns a record leaves
+out keep their current values on existing products (model defaults on new
+ones); ``slug`` defaults to one made from the name and SKU, for new products only.
+"""
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+from products import search
+from products.caching import invalidate_catalog_cache
+from products.models import Category, Brand, Product, ProductVariant, ProductSpecification
+from products.page_cache import invalidate_product_page
+
+# Product columns an import may set, with their parsers
+PRODUCT_FIELDS = {
+    'name': str,
+    'slug': str,
+    'description': str,
+    'short_description': str,
+    'price': Decimal,
+    'compare_price': Decimal,
+    'cost_price': Decimal,
+    'stock': int,
+    'low_stock_threshold': int,
+    'weight': Decimal,
+    'dimensions': str,
+    'main_image': str,
+    'is_featured': 'bool',
+    'is_new': 'bool',
+    'is_active': 'bool',
+    'meta_title': str,
+    'meta_description': str,
+}
+NULLABLE_FIELDS = {'compare_price', 'cost_price', 'weight'}
+VARIANT_FIELDS = ['product', 'name', 'value', 'price_adjustment', 'stock', 'is_active']
+CATEGORY_SEPARATOR = '>'
+
+
+class RowError(ValueError):
+    pass
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def parse_json_column(value):
+    """Variants/specifications: native JSON in JSONL, a JSON string in CSV"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError as e:
+            raise RowError(f'invalid JSON ({e})')
+    return value
+
+
+class Command(BaseCommand):
+    help = 'Stream products (with categories, brands, variants and specifications) from CSV or JSONL and upsert them by SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file, optionally gzipped; "-" reads stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per transaction')
+        parser.add_argument('--skip-search-index', action='store_true',
+                            help='Leave the search index alone (run rebuild_search_index afterwards)')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.index_search = not options['skip_search_index']
+        self.load_taxonomy()
+
+        started = time.monotonic()
+        imported = skipped = 0
+        with self.open(options['path']) as stream:
+            rows = self.read_rows(stream, options['format'] or self.guess_format(options['path']))
+            line = 0
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                records = []
+                for raw in batch:
+                    line += 1
+                    try:
+                        records.append(self.parse_row(raw))
+                    except RowError as e:
+                        skipped += 1
+                        self.stderr.write(f'Row {line}: {e}')
+                try:
+                    with transaction.atomic():
+                        imported += self.import_batch(records)
+                except IntegrityError:
+                    # One conflicting row (e.g. a slug or variant SKU owned by another
+                    # product) fails the whole statement; keep the rest of the batch
+                    written, failed = self.import_rows(records)
+                    imported += written
+                    skipped += failed
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{imported} products ({imported / elapsed:.0f} rows/s)')
+
+        invalidate_catalog_cache()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Imported {imported} products in {elapsed:.1f}s ({imported / max(elapsed, 0.001):.0f} rows/s), skipped {skipped}'
+        ))
+
+    # Input
+
+    def guess_format(self, path):
+        name = path[:-3] if path.endswith('.gz') else path
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith(('.jsonl', '.ndjson')):
+            return 'jsonl'
+        raise CommandError('Cannot tell the format from the file name; pass --format')
+
+    def open(self, path):
+        if path == '-':
+            return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        try:
+            if path.endswith('.gz'):
+                return gzip.open(path, 'rt', encoding='utf-8', newline='')
+            return open(path, encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(e)
+
+    def read_rows(self, stream, file_format):
+        """Yield one dict per product without loading the file"""
+        if file_format == 'csv':
+            yield from csv.DictReader(stream)
+            return
+        for number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise CommandError(f'Line {number}: invalid JSON ({e})')
+
+    def parse_row(self, raw):
+        """Validated product values plus category/brand keys and child rows"""
+        sku = (raw.get('sku') or '').strip()
+        if not sku:
+            raise RowError('missing sku')
+        values = {}
+        for field, parser in PRODUCT_FIELDS.items():
+            if field not in raw:
+                continue
+            value = raw[field]
+            if value in (None, '') and field in NULLABLE_FIELDS:
+                values[field] = None
+                continue
+            if value is None:
+                continue
+            try:
+                values[field] = parse_bool(value) if parser == 'bool' else parser(value)
+            except (InvalidOperation, ValueError, TypeError):
+                raise RowError(f'invalid {field}: {value!r}')
+        if not values.get('name') or 'price' not in values:
+            raise RowError(f'{sku}: name and price are required')
+        if not values.get('slug'):
+            # Only used when the product is created; existing URLs stay as they are
+            values.pop('slug', None)
+
+        category = raw.get('category') or ''
+        if isinstance(category, str):
+            category = [part.strip() for part in category.split(CATEGORY_SEPARATOR)]
+        category = tuple(part for part in category if part)
+        if not category:
+            raise RowError(f'{sku}: category is required')
+
+        return {
+            'sku': sku,
+            'values': values,
+            'category': category,
+            # None leaves the brand alone; an empty value clears it
+            'brand': (raw.get('brand') or '').strip() if 'brand' in raw else None,
+            'variants': self.parse_variants(sku, parse_json_column(raw.get('variants'))),
+            'specifications': self.parse_specifications(sku, parse_json_column(raw.get('specifications'))),
+        }
+
+    def parse_variants(self, sku, variants):
+        if variants is None:
+            return []
+        try:
+            return [{
+                'sku': variant['sku'],
+                'name': variant['name'],
+                'value': variant['value'],
+                'price_adjustment': Decimal(str(variant.get('price_adjustment', 0))),
+                'stock': int(variant.get('stock', 0)),
+                'is_active': parse_bool(variant.get('is_active', True)),
+            } for variant in variants]
+        except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+            raise RowError(f'{sku}: invalid variants ({e!r})')
+
+    def parse_specifications(self, sku, specifications):
+        """None leaves existing specifications alone; a list (even empty) replaces them"""
+        if specifications is None:
+            return None
+        if isinstance(specifications, dict):
+            specifications = [{'name': name, 'value': value} for name, value in specifications.items()]
+        try:
+            return [{
+                'name': spec['name'],
+                'value': str(spec['value']),
+                'order': int(spec.get('order', order)),
+            } for order, spec in enumerate(specifications)]
+        except (KeyError, TypeError, ValueError) as e:
+            raise RowError(f'{sku}: invalid specifications ({e!r})')
+
+    # Foreign keys
+
+    def load_taxonomy(self):
+        """Name -> id maps for existing categories (by name path) and brands (by slug)"""
+        rows = {pk: (name, parent_id) for pk, name, parent_id in Category.objects.values_list('id', 'name', 'parent_id')}
+        self.category_slugs = set(Category.objects.values_list('slug', flat=True))
+        self.categories = {}
+        for pk in rows:
+            names, current = [], pk
+            while current is not None:
+                name, current = rows[current]
+                names.append(name)
+            self.categories[tuple(reversed(names))] = pk
+        self.brands = dict(Brand.objects.values_list('slug', 'id'))
+
+    def category_id(self, names):
+        """Id of a category by its name path, creating missing levels"""
+        if names in self.categories:
+            return self.categories[names]
+        parent_id = self.category_id(names[:-1]) if len(names) > 1 else None
+        slug = base = slugify(names[-1]) or 'category'
+        suffix = 2
+        while slug in self.category_slugs:
+            slug = f'{base}-{suffix}'
+            suffix += 1
+        # save() maintains the materialized path, so categories (few) are not bulk created
+        category = Category.objects.create(name=names[-1], slug=slug, parent_id=parent_id)
+        self.category_slugs.add(slug)
+        self.categories[names] = category.id
+        return category.id
+
+    def brand_ids(self, names):
+        """Resolve brand names to ids, upserting unknown brands in one statement"""
+        missing = {}
+        for name in names:
+            slug = slugify(name)
+            if slug and slug not in self.brands:
+                missing[slug] = Brand(name=name, slug=slug)
+        if missing:
+            Brand.objects.bulk_create(
+                missing.values(), update_conflicts=True, unique_fields=['slug'], update_fields=['name']
+            )
+            self.brands.update(Brand.objects.filter(slug__in=missing).values_list('slug', 'id'))
+
+    # Output
+
+    def import_batch(self, records):
+        """Upsert one batch; returns the number of products written"""
+        if not records:
+            return 0
+        # Last row wins when a SKU repeats within a batch
+        records = list({record['sku']: record for record in records}.values())
+        skus = [record['sku'] for record in records]
+        self.brand_ids({record['brand'] for record in records if record['brand']})
+        old_slugs = set(Product.objects.filter(sku__in=skus).values_list('slug', flat=True))
+
+        # One upsert per set of columns, so a column missing from a row is never written
+        groups = {}
+        for record in records:
+            groups.setdefault((frozenset(record['values']), record['brand'] is not None), []).append(record)
+        for (columns, has_brand), group in groups.items():
+            products = []
+            for record in group:
+                fields = {'slug': slugify(f"{record['values']['name']} {record['sku']}")[:300], **record['values']}
+                if has_brand:
+                    fields['brand_id'] = self.brands.get(slugify(record['brand'])) if record['brand'] else None
+                products.append(Product(sku=record['sku'], category_id=self.category_id(record['category']), **fields))
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=sorted(columns | {'category', 'updated_at'} | ({'brand'} if has_brand else set())),
+            )
+        rows = list(Product.objects.filter(sku__in=skus).values_list('sku', 'id', 'slug'))
+        product_ids = {sku: product_id for sku, product_id, _ in rows}
+
+        self.import_variants(records, product_ids)
+        self.import_specifications(records, product_ids)
+
+        # bulk_create skips the post_save handlers that keep these in sync
+        if self.index_search:
+            search.index_product_ids(product_ids.values())
+        invalidate_product_page(*old_slugs.union(slug for _, _, slug in rows))
+        return len(records)
+
+    def import_rows(self, records):
+        """Import a failed batch one row per savepoint; returns (written, skipped)"""
+        # Categories and brands created by the rolled back batch are gone
+        self.load_taxonomy()
+        written = skipped = 0
+        with transaction.atomic():
+            for record in records:
+                try:
+                    with transaction.atomic():
+                        written += self.import_batch([record])
+                except IntegrityError as e:
+                    skipped += 1
+                    self.stderr.write(f"{record['sku']}: {e}")
+                    self.load_taxonomy()
+        return written, skipped
+
+    def import_variants(self, records, product_ids):
+        variants = []
+        for record in records:
+            for variant in record['variants']:
+                variants.append(ProductVariant(product_id=product_ids[record['sku']], **variant))
+        if variants:
+            ProductVariant.objects.bulk_create(
+                variants, update_conflicts=True, unique_fields=['sku'], update_fields=VARIANT_FIELDS
+            )
+
+    def import_specifications(self, records, product_ids):
+        """Specifications have no natural key, so a product's listed specifications replace its old ones"""
+        replaced, specifications = [], []
+        for record in records:
+            if record['specifications'] is None:
+                continue
+            product_id = product_ids[record['sku']]
+            replaced.append(product_id)
+            specifications.extend(
+                ProductSpecification(product_id=product_id, **spec) for spec in record['specifications']
+            )
+        if replaced:
+            ProductSpecification.objects.filter(product_id__in=replaced).delete()
+            ProductSpecification.objects.bulk_create(specifications)
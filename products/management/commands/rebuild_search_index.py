@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from products import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index'
+
+    def handle(self, *args, **kwargs):
+        if not search.search_enabled():
+            self.stdout.write(self.style.WARNING(
+                f'No full-text index for the {connection.vendor} backend; search uses substring matching.'
+            ))
+            return
+        
+        with transaction.atomic():
+            indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'✓ Indexed {indexed} products'))
@@ -0,0 +1,66 @@
+from django.db import migrations
+
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_search USING fts5(
+        name, brand, category, sku, description,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO products_search (rowid, name, brand, category, sku, description)
+    SELECT p.id, p.name, coalesce(b.name, ''), c.name, p.sku, p.description
+    FROM products_product p
+    INNER JOIN products_category c ON c.id = p.category_id
+    LEFT OUTER JOIN products_brand b ON b.id = p.brand_id
+    """,
+]
+
+POSTGRESQL_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS products_search (
+        product_id bigint PRIMARY KEY REFERENCES products_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS products_search_document_gin ON products_search USING gin (document)",
+    """
+    INSERT INTO products_search (product_id, document)
+    SELECT p.id,
+        setweight(to_tsvector('simple', p.name), 'A') ||
+        setweight(to_tsvector('simple', p.sku), 'A') ||
+        setweight(to_tsvector('simple', coalesce(b.name, '')), 'B') ||
+        setweight(to_tsvector('simple', c.name), 'B') ||
+        setweight(to_tsvector('simple', p.description), 'C')
+    FROM products_product p
+    INNER JOIN products_category c ON c.id = p.category_id
+    LEFT OUTER JOIN products_brand b ON b.id = p.brand_id
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {
+        'sqlite': SQLITE_CREATE,
+        'postgresql': POSTGRESQL_CREATE,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS products_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+PATH_STEP = 8
+
+
+def build_category_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    children = {}
+    for category in Category.objects.only('id', 'parent_id'):
+        children.setdefault(category.parent_id, []).append(category)
+    
+    # Walk the tree from the roots so every parent path is known first
+    stack = [(category, '') for category in children.get(None, [])]
+    while stack:
+        category, parent_path = stack.pop()
+        category.path = parent_path + str(category.pk).zfill(PATH_STEP)
+        category.depth = len(category.path) // PATH_STEP - 1
+        category.save(update_fields=['path', 'depth'])
+        stack.extend((child, category.path) for child in children.get(category.pk, []))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_category_paths, migrations.RunPython.noop),
+    ]
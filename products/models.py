@@ -1,4 +1,7 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
 from django.utils.text import slugify
 from django.urls import reverse
 from django.conf import settings
@@ -6,6 +9,9 @@ from django.conf import settings
 
 class Category(models.Model):
     """Product categories with hierarchy support"""
+    # Each level of the materialized path is the category id, zero-padded to this width
+    PATH_STEP = 8
+    
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     description = models.TextField(blank=True)
@@ -14,10 +20,74 @@ class Category(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Materialized path: ancestor ids from the root down, ending with this category's id
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    
+    def clean(self):
+        if self.pk and self.parent_id and self._is_descendant_path(self._parent_path()):
+            raise ValidationError({'parent': 'A category cannot be placed under itself or one of its subcategories.'})
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        
+        old_path = self.path
+        parent_path = self._parent_path()
+        if old_path and self._is_descendant_path(parent_path):
+            raise ValueError('A category cannot be placed under itself or one of its subcategories.')
         super().save(*args, **kwargs)
+        
+        new_path = parent_path + str(self.pk).zfill(self.PATH_STEP)
+        if new_path != old_path:
+            new_depth = len(new_path) // self.PATH_STEP - 1
+            if old_path:
+                # Moved: rewrite the prefix of the whole subtree in one UPDATE
+                Category.objects.filter(Category.subtree_q(old_path)).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (new_depth - self.depth),
+                )
+            else:
+                Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+            self.path, self.depth = new_path, new_depth
+    
+    def _parent_path(self):
+        if not self.parent_id:
+            return ''
+        return Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+    
+    def _is_descendant_path(self, path):
+        return bool(self.path) and path.startswith(self.path)
+    
+    @classmethod
+    def subtree_q(cls, path, prefix=''):
+        """Q for a category subtree as a range on the indexed path column"""
+        if not path:
+            raise ValueError('Category path is not set')
+        upper = str(int(path) + 1).zfill(len(path))
+        return Q(**{f'{prefix}path__gte': path, f'{prefix}path__lt': upper})
+    
+    def _subtree_q(self):
+        # Rows saved without a path (raw or fixture loads) only match themselves
+        return Category.subtree_q(self.path) if self.path else Q(pk=self.pk)
+    
+    def get_descendants(self, include_self=True):
+        """This category and everything below it, in tree order"""
+        categories = Category.objects.filter(self._subtree_q()).order_by('path')
+        if not include_self:
+            categories = categories.exclude(pk=self.pk)
+        return categories
+    
+    def get_descendant_ids(self):
+        """Ids of this category and its subcategories, for index-friendly product filters"""
+        return list(Category.objects.filter(self._subtree_q()).values_list('id', flat=True))
+    
+    def get_ancestors(self, include_self=False):
+        """Categories from the root down to this one (breadcrumbs)"""
+        ids = [int(self.path[i:i + self.PATH_STEP]) for i in range(0, len(self.path), self.PATH_STEP)]
+        if not include_self:
+            ids = ids[:-1]
+        return Category.objects.filter(pk__in=ids).order_by('depth')
     
     def __str__(self):
         return self.name
@@ -48,6 +118,21 @@ class Brand(models.Model):
         ordering = ['name']
 
 
+class ProductQuerySet(models.QuerySet):
+    # Columns a product card needs: name, link, price, image, rating, brand/category
+    # labels, plus the keys used by listing sort orders and keyset pagination
+    CARD_FIELDS = [
+        'id', 'name', 'slug', 'price', 'compare_price', 'main_image',
+        'rating_average', 'rating_count', 'created_at', 'sales_count',
+        'category__id', 'category__name', 'category__slug',
+        'brand__id', 'brand__name', 'brand__slug',
+    ]
+    
+    def for_cards(self):
+        """Lightweight rows for listing cards (no description/SEO text, brand and category joined)"""
+        return self.select_related('category', 'brand').only(*self.CARD_FIELDS)
+
+
 class Product(models.Model):
     """Main product model with all features"""
     # Basic info
@@ -90,10 +175,17 @@ class Product(models.Model):
     views = models.IntegerField(default=0)
     sales_count = models.IntegerField(default=0)
     
+    # Rating aggregates (maintained from approved reviews, see reviews.ratings)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_average = models.FloatField(default=0)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProductQuerySet.as_manager()
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -121,21 +213,27 @@ class Product(models.Model):
     
     @property
     def average_rating(self):
-        reviews = self.reviews.filter(is_approved=True)
-        if reviews.exists():
-            return round(sum(r.rating for r in reviews) / reviews.count(), 1)
-        return 0
+        return self.rating_average
     
     @property
     def reviews_count(self):
-        return self.reviews.filter(is_approved=True).count()
+        return self.rating_count
     
     class Meta:
         ordering = ['-created_at']
+        # Per sort mode in products.sorting: full catalog, per category, plus newest per brand.
+        # Partial on is_active (a bare boolean WHERE term, which SQLite cannot seek on in a composite key)
         indexes = [
             models.Index(fields=['slug']),
-            models.Index(fields=['category', 'is_active']),
-            models.Index(fields=['-created_at']),
+            models.Index(fields=['created_at', 'id'], condition=Q(is_active=True), name='product_active_newest_idx'),
+            models.Index(fields=['price', 'id'], condition=Q(is_active=True), name='product_active_price_idx'),
+            models.Index(fields=['name', 'id'], condition=Q(is_active=True), name='product_active_name_idx'),
+            models.Index(fields=['sales_count', 'id'], condition=Q(is_active=True), name='product_active_popular_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], condition=Q(is_active=True), name='product_cat_newest_idx'),
+            models.Index(fields=['category', 'price', 'id'], condition=Q(is_active=True), name='product_cat_price_idx'),
+            models.Index(fields=['category', 'name', 'id'], condition=Q(is_active=True), name='product_cat_name_idx'),
+            models.Index(fields=['category', 'sales_count', 'id'], condition=Q(is_active=True), name='product_cat_popular_idx'),
+            models.Index(fields=['brand', 'created_at', 'id'], condition=Q(is_active=True), name='product_brand_newest_idx'),
         ]
 
 
@@ -183,3 +281,35 @@ class ProductSpecification(models.Model):
     
     class Meta:
         ordering = ['order']
+
+
+class ProductRecommendation(models.Model):
+    """Precomputed "frequently bought together" neighbours (see build_recommendations)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    def __str__(self):
+        return f"{self.product.name} -> {self.recommended.name} ({self.score:.3f})"
+    
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_recommendation_rank'),
+        ]
+
+
+class ImageDerivative(models.Model):
+    """Resized renditions built for one uploaded image (see products.images)"""
+    source = models.CharField(max_length=255, unique=True, help_text="Storage name of the original")
+    digest = models.CharField(max_length=64, db_index=True, help_text="SHA-256 of the original's bytes")
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    widths = models.JSONField(default=list)
+    formats = models.JSONField(default=list)
+    fallback = models.CharField(max_length=10, default='jpeg')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return self.source
@@ -0,0 +1,131 @@
+"""
+Conditional GET and full-response cache for product detail pages.
+
+Every product slug has a page version in the cache: the time of the last
+change to the product, its variants, images, stock, holds or reviews (see
+``invalidate_product_page``). Anonymous visitors with no pending messages all
+see the same page, so for them the version becomes an ETag/Last-Modified pair,
+revalidations get a 304 straight away, and the rendered page is cached per
+slug and version. The CSRF token is swapped per visitor on every cache hit.
+
+Signed-in users always get a freshly rendered page without validators. Parts
+of the page owned by other objects (breadcrumb names, related products) can be
+up to ``PRODUCT_PAGE_CACHE_TIMEOUT`` seconds old, after which versions expire
+and pages are rebuilt.
+"""
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from .counters import view_counter
+from .models import Product
+
+VERSION_KEY = 'product_page:version:{}'
+ID_KEY = 'product_page:id:{}'
+PAGE_KEY = 'product_page:{}:{}'
+
+CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = b'__csrf_token__'
+
+
+def _timeout():
+    return getattr(settings, 'PRODUCT_PAGE_CACHE_TIMEOUT', 600)
+
+
+def invalidate_product_page(*slugs):
+    """Start a new page version for the given product slugs once the current transaction commits"""
+    transaction.on_commit(lambda: _new_page_versions(slugs))
+
+
+def _new_page_versions(slugs):
+    now = time.time()
+    cache.set_many({VERSION_KEY.format(slug): now for slug in slugs}, _timeout())
+    cache.delete_many([ID_KEY.format(slug) for slug in slugs])
+
+
+def invalidate_product_pages(queryset):
+    """New page versions for every product in ``queryset``"""
+    slugs = list(queryset.values_list('slug', flat=True))
+    if slugs:
+        invalidate_product_page(*slugs)
+
+
+def page_version(slug):
+    """Timestamp of the current page version, starting one if none is cached"""
+    key = VERSION_KEY.format(slug)
+    version = cache.get(key)
+    if version is None:
+        version = time.time()
+        if not cache.add(key, version, _timeout()):
+            # Another request started one first
+            version = cache.get(key, version)
+    return version
+
+
+def is_public_request(request):
+    """True when the page would render the same for everyone"""
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Browsers may keep the page but must revalidate; the body holds a per-visitor CSRF token
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def cached_product_page(view):
+    """Serve ``view(request, slug)`` with validators and a per-slug response cache for anonymous visitors"""
+
+    @wraps(view)
+    def wrapper(request, slug):
+        if not is_public_request(request):
+            return view(request, slug)
+
+        version = page_version(slug)
+        etag = f'W/"{slug}-{int(version * 1000)}"'
+        last_modified = int(version)
+        product_id = cache.get(ID_KEY.format(slug))
+
+        if product_id is not None:
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                view_counter.record(product_id)
+                return _set_validators(not_modified, etag, last_modified)
+
+            page_key = PAGE_KEY.format(slug, int(version * 1000))
+            page = cache.get(page_key)
+            if page is not None:
+                view_counter.record(product_id)
+                content = page.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+                response = HttpResponse(content, content_type='text/html; charset=utf-8')
+                return _set_validators(response, etag, last_modified)
+
+        response = view(request, slug)
+        if response.status_code != 200:
+            return response
+
+        if product_id is None:
+            product_id = Product.objects.filter(slug=slug).values_list('id', flat=True).first()
+            cache.set(ID_KEY.format(slug), product_id, _timeout())
+        cache.set(
+            PAGE_KEY.format(slug, int(version * 1000)),
+            CSRF_INPUT.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content),
+            _timeout(),
+        )
+        return _set_validators(response, etag, last_modified)
+
+    return wrapper
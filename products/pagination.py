@@ -0,0 +1,165 @@
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+
+class KeysetPage:
+    """A page of results plus opaque cursors for its neighbours"""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def approximate_count(self):
+        return self.paginator.approximate_count
+
+    @property
+    def count_is_capped(self):
+        return self.paginator.count_is_capped
+
+
+class KeysetPaginator:
+    """
+    Cursor-based paginator.
+
+    ``ordering`` is a sequence of field names (``-`` for descending) that must
+    end in a unique column, e.g. ``('-price', '-id')``. Each page is fetched
+    with a range condition on those columns instead of OFFSET, so page 400
+    costs the same as page 1, and no COUNT(*) is run unless asked for.
+    """
+
+    def __init__(self, queryset, ordering, per_page=12, max_count=1000):
+        self.queryset = queryset
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.per_page = per_page
+        self.max_count = max_count
+        self._count = None
+        self._capped = False
+
+    def get_page(self, cursor=None):
+        """Return the page addressed by ``cursor`` (the first page if it is missing or invalid)"""
+        position = self._decode(cursor)
+        try:
+            rows, has_next, has_previous = self._fetch(position)
+        except (ValidationError, ValueError, TypeError):
+            # Tampered cursor values that do not fit the key columns
+            rows, has_next, has_previous = self._fetch(None)
+
+        next_cursor = self._encode(rows[-1], 'n') if rows and has_next else None
+        previous_cursor = self._encode(rows[0], 'p') if rows and has_previous else None
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+    def _fetch(self, position):
+        """Rows for a decoded position, plus whether neighbouring pages exist"""
+        if position is None:
+            rows = list(self._ordered(reverse=False)[:self.per_page + 1])
+            return rows[:self.per_page], len(rows) > self.per_page, False
+        if position['d'] == 'n':
+            rows = list(self._ordered(reverse=False).filter(self._after(position['v'], reverse=False))[:self.per_page + 1])
+            return rows[:self.per_page], len(rows) > self.per_page, True
+        rows = list(self._ordered(reverse=True).filter(self._after(position['v'], reverse=True))[:self.per_page + 1])
+        return rows[:self.per_page][::-1], True, len(rows) > self.per_page
+
+    @property
+    def approximate_count(self):
+        """
+        Total number of results, bounded in cost.
+
+        On PostgreSQL this is the planner's row estimate; elsewhere rows are
+        counted up to ``max_count`` and ``count_is_capped`` tells if there are more.
+        """
+        if self._count is None:
+            self._load_count()
+        return self._count
+
+    @property
+    def count_is_capped(self):
+        if self._count is None:
+            self._load_count()
+        return self._capped
+
+    def _load_count(self):
+        if connection.vendor == 'postgresql':
+            self._count, self._capped = self._estimated_count(), False
+        else:
+            counted = self.queryset.order_by()[:self.max_count + 1].count()
+            self._count, self._capped = min(counted, self.max_count), counted > self.max_count
+
+    def _estimated_count(self):
+        sql, params = self.queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def _ordered(self, reverse):
+        return self.queryset.order_by(*[
+            f"{'-' if descending != reverse else ''}{name}" for name, descending in self.ordering
+        ])
+
+    def _after(self, values, reverse):
+        """Rows strictly after ``values`` in (possibly reversed) ordering"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _encode(self, obj, direction):
+        values = [_to_json(getattr(obj, name)) for name, _ in self.ordering]
+        payload = json.dumps({'v': values, 'd': direction}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def _decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            position = json.loads(payload)
+        except (ValueError, binascii.Error):
+            return None
+        if (
+            not isinstance(position, dict)
+            or position.get('d') not in ('n', 'p')
+            or not isinstance(position.get('v'), list)
+            or len(position['v']) != len(self.ordering)
+        ):
+            return None
+        return position
+
+
+def _to_json(value):
+    """Serialize key values losslessly (datetimes keep their microseconds)"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
@@ -0,0 +1,155 @@
+"""
+Full-text search over the product catalog.
+
+Search documents live in a side table (``products_search``) that is an FTS5
+virtual table on SQLite and a tsvector column with a GIN index on PostgreSQL.
+Rows are kept in sync by the signal handlers in ``products.signals`` and can be
+rebuilt from scratch with ``manage.py rebuild_search_index``.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from .models import Product, Brand, Category
+
+SEARCH_TABLE = 'products_search'
+SUPPORTED_VENDORS = ('sqlite', 'postgresql')
+
+# bm25 column weights, in FTS5 column order: name, brand, category, sku, description
+FTS5_WEIGHTS = '10.0, 4.0, 4.0, 8.0, 1.0'
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def search_enabled():
+    """Whether the current database has a full-text index"""
+    return connection.vendor in SUPPORTED_VENDORS
+
+
+def keyword_filter(query):
+    """Plain substring match, used where no full-text index is available"""
+    return (
+        Q(name__icontains=query) |
+        Q(description__icontains=query) |
+        Q(brand__name__icontains=query) |
+        Q(category__name__icontains=query) |
+        Q(sku__icontains=query)
+    )
+
+
+def _document_select(where):
+    """SELECT producing (product id, search document) rows for matching products"""
+    product_table = Product._meta.db_table
+    brand_table = Brand._meta.db_table
+    category_table = Category._meta.db_table
+
+    if connection.vendor == 'postgresql':
+        columns = (
+            "setweight(to_tsvector('simple', p.name), 'A') || "
+            "setweight(to_tsvector('simple', p.sku), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(b.name, '')), 'B') || "
+            "setweight(to_tsvector('simple', c.name), 'B') || "
+            "setweight(to_tsvector('simple', p.description), 'C')"
+        )
+    else:
+        columns = "p.name, coalesce(b.name, ''), c.name, p.sku, p.description"
+
+    return (
+        f"SELECT p.id, {columns} FROM {product_table} p "
+        f"INNER JOIN {category_table} c ON c.id = p.category_id "
+        f"LEFT OUTER JOIN {brand_table} b ON b.id = p.brand_id "
+        f"WHERE {where}"
+    )
+
+
+def index_products(where, params=()):
+    """(Re)index every product matching a SQL condition on the ``p`` alias"""
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (product_id, document) {_document_select(where)} "
+                f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                params,
+            )
+        else:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN "
+                f"(SELECT p.id FROM {Product._meta.db_table} p WHERE {where})",
+                params,
+            )
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, brand, category, sku, description) "
+                f"{_document_select(where)}",
+                params,
+            )
+
+
+def index_product_ids(product_ids, batch_size=500):
+    """(Re)index products by id, a batch at a time"""
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        ids = product_ids[start:start + batch_size]
+        index_products(f"p.id IN ({', '.join(['%s'] * len(ids))})", ids)
+
+
+def remove_products(product_ids):
+    """Drop products from the index"""
+    if not search_enabled() or not product_ids:
+        return
+    key = 'product_id' if connection.vendor == 'postgresql' else 'rowid'
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN ({placeholders})", list(product_ids))
+
+
+def rebuild_index():
+    """Rebuild the whole index from the catalog tables"""
+    if not search_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    index_products('1 = 1')
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def search_products(queryset, query):
+    """
+    Restrict a product queryset to full-text matches for ``query``.
+
+    Every search term is treated as a prefix and all terms must match. The
+    result is annotated with ``search_rank`` (higher is more relevant).
+    """
+    terms = TOKEN_RE.findall(query)
+    if not terms:
+        return queryset.none()
+
+    if not search_enabled():
+        return queryset.filter(keyword_filter(query)).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+    product_id = f"{connection.ops.quote_name(Product._meta.db_table)}.{connection.ops.quote_name('id')}"
+    if connection.vendor == 'postgresql':
+        match = ' & '.join(f'{term}:*' for term in terms)
+        rank = f"ts_rank({SEARCH_TABLE}.document, to_tsquery('simple', %s))"
+        rank_params = (match,)
+        where = [f"{SEARCH_TABLE}.product_id = {product_id}", f"{SEARCH_TABLE}.document @@ to_tsquery('simple', %s)"]
+    else:
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rank = f"-bm25({SEARCH_TABLE}, {FTS5_WEIGHTS})"
+        rank_params = ()
+        where = [f"{SEARCH_TABLE}.rowid = {product_id}", f"{SEARCH_TABLE} MATCH %s"]
+
+    # Join the index table so the full-text query runs once and the rank
+    # comes from the same scan, instead of a correlated lookup per product.
+    # The rank is a real annotation so it can be filtered on (keyset paging).
+    return queryset.extra(tables=[SEARCH_TABLE], where=where, params=[match]).annotate(
+        search_rank=RawSQL(rank, rank_params, output_field=FloatField())
+    )
@@ -0,0 +1,117 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Product, Category, Brand, ProductImage, ProductVariant
+from .caching import invalidate_catalog_cache
+from .page_cache import invalidate_product_page
+from .images import queue_derivatives
+from . import search
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    """Refresh a product's search document"""
+    if not raw:
+        search.index_products('p.id = %s', [instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Drop a deleted product from the search index"""
+    search.remove_products([instance.pk])
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Brand)
+def remember_previous_name(sender, instance, **kwargs):
+    """Snapshot the stored name so post_save only reindexes on renames"""
+    instance._previous_name = None
+    if instance.pk:
+        instance._previous_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    """Category names are part of the search document"""
+    if not created and not raw and instance._previous_name != instance.name:
+        search.index_products('p.category_id = %s', [instance.pk])
+
+
+@receiver(post_save, sender=Brand)
+def reindex_brand_products(sender, instance, created=False, raw=False, **kwargs):
+    """Brand names are part of the search document"""
+    if not created and not raw and instance._previous_name != instance.name:
+        search.index_products('p.brand_id = %s', [instance.pk])
+
+
+@receiver(pre_delete, sender=Brand)
+def remember_brand_products(sender, instance, **kwargs):
+    """Products keep existing (brand set to NULL), so remember them for reindexing"""
+    instance._product_ids = list(instance.products.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Brand)
+def reindex_unbranded_products(sender, instance, **kwargs):
+    """Remove the deleted brand's name from its former products' documents"""
+    search.index_product_ids(instance._product_ids)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Brand)
+def invalidate_catalog(sender, raw=False, **kwargs):
+    """Any catalog write makes the cached homepage and taxonomy fragments stale"""
+    if not raw:
+        invalidate_catalog_cache()
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_slug(sender, instance, **kwargs):
+    """Snapshot the stored slug so a renamed product's old page is dropped too"""
+    instance._previous_slug = None
+    if instance.pk:
+        instance._previous_slug = Product.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_detail(sender, instance, raw=False, **kwargs):
+    """Product edits, stock changes and deletions make its cached detail page stale"""
+    if not raw:
+        slugs = {instance.slug, getattr(instance, '_previous_slug', None)} - {None}
+        invalidate_product_page(*slugs)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_parent_product_detail(sender, instance, raw=False, **kwargs):
+    """Variants and gallery images are rendered on the product page"""
+    if not raw:
+        slug = Product.objects.filter(pk=instance.product_id).values_list('slug', flat=True).first()
+        if slug:
+            invalidate_product_page(slug)
+
+
+# Upload fields that get responsive derivatives, per model
+IMAGE_FIELDS = {
+    Product: 'main_image',
+    ProductImage: 'image',
+    ProductVariant: 'image',
+    Category: 'image',
+    Brand: 'logo',
+}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def build_image_derivatives(sender, instance, raw=False, **kwargs):
+    """Resize new uploads in the background once saved"""
+    if not raw:
+        queue_derivatives(getattr(instance, IMAGE_FIELDS[sender]).name)
@@ -0,0 +1,121 @@
+"""
+Pre-rendered XML sitemaps for products, categories and brands.
+
+``build_sitemaps`` streams ``values_list`` rows into gzipped shards of at most
+``URLS_PER_SHARD`` URLs under ``SITEMAP_ROOT`` and writes ``sitemap.xml``, an
+index of every shard. Files are written under temporary names and renamed into
+place, so the ``sitemap`` view (which only reads files, never the
+database) always serves a complete set.
+"""
+import gzip
+import os
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.utils import timezone
+from .models import Category, Brand, Product
+from .utils import url_builder
+
+# Protocol limits: 50,000 URLs and 50 MB uncompressed per file
+URLS_PER_SHARD = 50000
+MAX_SHARD_BYTES = 50 * 1024 * 1024
+INDEX_NAME = 'sitemap.xml'
+SHARD_NAME = 'sitemap-{section}-{number}.xml.gz'
+CHUNK_SIZE = 5000
+
+URLSET_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_TAIL = '</urlset>\n'
+
+
+def sitemap_root():
+    return Path(getattr(settings, 'SITEMAP_ROOT', settings.BASE_DIR / 'sitemaps'))
+
+
+def section_rows():
+    """``(section, view name, rows of (slug, lastmod or None))``; only products track modification times"""
+    return [
+        ('products', 'products:product_detail',
+         Product.objects.filter(is_active=True).order_by('pk').values_list('slug', 'updated_at').iterator(chunk_size=CHUNK_SIZE)),
+        ('categories', 'products:category_detail',
+         ((slug, None) for slug in Category.objects.filter(is_active=True).order_by('pk').values_list('slug', flat=True).iterator(chunk_size=CHUNK_SIZE))),
+        ('brands', 'products:brand_detail',
+         ((slug, None) for slug in Brand.objects.filter(is_active=True).order_by('pk').values_list('slug', flat=True).iterator(chunk_size=CHUNK_SIZE))),
+    ]
+
+
+def url_entry(location, lastmod=None):
+    if lastmod is None:
+        return f'<url><loc>{escape(location)}</loc></url>\n'
+    return f'<url><loc>{escape(location)}</loc><lastmod>{lastmod.date().isoformat()}</lastmod></url>\n'
+
+
+class ShardWriter:
+    """Writes one section's URLs into numbered gzipped shards"""
+
+    def __init__(self, directory, section):
+        self.directory = directory
+        self.section = section
+        self.shards = []
+        self.file = None
+
+    def write(self, entry, lastmod):
+        data = entry.encode()
+        if self.file is None or self.count >= URLS_PER_SHARD or self.size + len(data) > MAX_SHARD_BYTES - len(URLSET_TAIL):
+            self._open()
+        self.file.write(data)
+        self.count += 1
+        self.size += len(data)
+        if lastmod is not None and (self.lastmod is None or lastmod > self.lastmod):
+            self.lastmod = lastmod
+
+    def _open(self):
+        self.close()
+        name = SHARD_NAME.format(section=self.section, number=len(self.shards) + 1)
+        self.file = gzip.open(self.directory / (name + '.tmp'), 'wb')
+        self.file.write(URLSET_HEAD.encode())
+        self.name, self.count, self.size, self.lastmod = name, 0, len(URLSET_HEAD), None
+
+    def close(self):
+        if self.file is not None:
+            self.file.write(URLSET_TAIL.encode())
+            self.file.close()
+            self.shards.append((self.name, self.lastmod))
+            self.file = None
+
+
+def build_sitemaps(base_url):
+    """Write every shard and the index; returns ``{section: (urls, shards)}``"""
+    directory = sitemap_root()
+    directory.mkdir(parents=True, exist_ok=True)
+    base_url = base_url.rstrip('/')
+    now = timezone.now().replace(microsecond=0)
+
+    shards, stats = [], {}
+    for section, view_name, rows in section_rows():
+        url = url_builder(view_name)
+        writer = ShardWriter(directory, section)
+        urls = 0
+        for slug, lastmod in rows:
+            writer.write(url_entry(base_url + url(slug), lastmod), lastmod)
+            urls += 1
+        writer.close()
+        shards.extend((name, lastmod or now) for name, lastmod in writer.shards)
+        stats[section] = (urls, len(writer.shards))
+
+    index = directory / (INDEX_NAME + '.tmp')
+    with open(index, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for name, lastmod in shards:
+            f.write(f'<sitemap><loc>{escape(base_url)}/sitemaps/{name}</loc><lastmod>{lastmod.replace(microsecond=0).isoformat()}</lastmod></sitemap>\n')
+        f.write('</sitemapindex>\n')
+
+    # Shards first, index last, then drop shards a shrinking catalog no longer needs
+    for name, _ in shards:
+        os.replace(directory / (name + '.tmp'), directory / name)
+    os.replace(index, directory / INDEX_NAME)
+    current = {name for name, _ in shards}
+    for path in directory.glob('sitemap-*.xml.gz'):
+        if path.name not in current:
+            path.unlink()
+    return stats
@@ -0,0 +1,53 @@
+"""
+Sort modes accepted by the catalog listings.
+
+Every mode orders by one product column plus the ``id`` tiebreaker that keyset
+pagination needs, and each has matching partial indexes on
+``Product.Meta.indexes``: ``(column, id)`` for the full catalog and
+``(category, column, id)`` for category pages, both with
+``condition=Q(is_active=True)``, so pages are read in index order instead of
+being sorted. Anything else in ``?sort=`` is rejected.
+"""
+from django.core.exceptions import BadRequest
+
+DEFAULT_SORT = 'newest'
+
+# mode: (label, keyset ordering)
+SORT_MODES = {
+    'newest': ('Newest', ('-created_at', '-id')),
+    'price_low': ('Price: Low to High', ('price', 'id')),
+    'price_high': ('Price: High to Low', ('-price', '-id')),
+    'name': ('Name', ('name', 'id')),
+    'popular': ('Best Selling', ('-sales_count', '-id')),
+}
+
+# Older links used order_by() field names
+SORT_ALIASES = {
+    '-created_at': 'newest',
+    'price': 'price_low',
+    '-price': 'price_high',
+    '-sales_count': 'popular',
+}
+
+# Search results only: ordered by full-text rank, which no index can serve
+RELEVANCE = 'relevance'
+RELEVANCE_ORDERING = ('-search_rank', '-id')
+
+
+def resolve_sort(value, query=None):
+    """
+    Canonical sort mode and keyset ordering for a ``?sort=`` value.
+
+    An empty value picks relevance for searches and newest otherwise; unknown
+    values raise ``BadRequest`` (HTTP 400).
+    """
+    if not value:
+        value = RELEVANCE if query else DEFAULT_SORT
+    if value == RELEVANCE:
+        if query:
+            return RELEVANCE, RELEVANCE_ORDERING
+        value = DEFAULT_SORT
+    mode = SORT_ALIASES.get(value, value)
+    if mode not in SORT_MODES:
+        raise BadRequest(f'Unknown sort order: {value}')
+    return mode, SORT_MODES[mode][1]
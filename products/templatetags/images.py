@@ -0,0 +1,62 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from products.images import CONTENT_TYPES, derivative_name, manifest_for, srcsets
+
+register = template.Library()
+
+# `sizes` attribute per layout (Bootstrap container is at most 1320px wide)
+SIZES = {
+    'card': '(min-width: 768px) 25vw, 100vw',
+    'tile': '(min-width: 768px) 33vw, 100vw',
+    'detail': '(min-width: 768px) 50vw, 100vw',
+    'thumb': '(min-width: 768px) 16vw, 100vw',
+}
+
+
+@register.simple_tag
+def picture(image, alt='', sizes='card', loading='lazy', **attrs):
+    """
+    ``<picture>`` with AVIF/WebP sources and a resized fallback for an image
+    field, or a plain ``<img>`` of the original until derivatives exist.
+    Pass ``loading="eager"`` for images above the fold; views showing many
+    images look their manifests up first with ``images.prefetch_manifests``.
+
+    {% picture product.main_image alt=product.name sizes="card" class="product-image" %}
+    """
+    if not image:
+        return ''
+    attrs = {key.replace('_', '-'): value for key, value in attrs.items()}
+    manifest = manifest_for(image)
+    if not manifest:
+        return format_html(
+            '<img src="{}" alt="{}" loading="{}"{}>',
+            image.url, alt, loading, format_html_join('', ' {}="{}"', attrs.items()),
+        )
+
+    sizes = SIZES.get(sizes, sizes)
+    sets = srcsets(image.name, manifest)
+    fallback = sets.pop(manifest['fallback'])
+    largest = default_storage.url(
+        derivative_name(image.name, manifest['digest'], manifest['widths'][-1], manifest['fallback'])
+    )
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((CONTENT_TYPES[file_format], srcset, sizes) for file_format, srcset in sets.items()),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async"{}></picture>',
+        sources, largest, fallback, sizes, manifest['width'], manifest['height'], alt, loading,
+        format_html_join('', ' {}="{}"', attrs.items()),
+    )
+
+
+@register.filter
+def srcset(image, file_format=None):
+    """``srcset`` value for an image field in one format (default: the JPEG/PNG fallback)"""
+    if not image:
+        return ''
+    manifest = manifest_for(image)
+    if not manifest:
+        return ''
+    return srcsets(image.name, manifest).get(file_format or manifest['fallback'], '')
@@ -1,3 +1,834 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .autocomplete import autocomplete_index
+from .caching import get_catalog_version
+from .counters import CacheViewBuffer, MemoryViewBuffer, ProductViewCounter, view_counter
+from .facets import facet_index
+from .images import get_manifests
+from .models import (
+    Category, Brand, ImageDerivative, Product, ProductRecommendation, ProductSpecification, ProductVariant,
+)
+from .page_cache import invalidate_product_page
+from .pagination import KeysetPaginator
+from .search import SEARCH_TABLE, rebuild_index, search_products
+from .sitemaps import build_sitemaps
+from .sorting import SORT_MODES, SORT_ALIASES
+
+
+@override_settings(CATALOG_INDEX_BACKGROUND_REFRESH=False)
+class ProductCardQuerySetTests(TestCase):
+    """Listing pages load card projections with a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.brand = Brand.objects.create(name='Nike', slug='nike')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_products(self, count):
+        start = Product.objects.count()
+        for i in range(start, start + count):
+            Product.objects.create(
+                name=f'Runner {i}',
+                slug=f'runner-{i}',
+                sku=f'RUN-{i}',
+                description='Long marketing copy ' * 50,
+                meta_description='SEO text',
+                category=self.category,
+                brand=self.brand,
+                price=100 + i,
+                is_featured=True,
+                is_new=True,
+            )
+
+    def catalog_queries(self, url):
+        """Queries touching catalog tables while rendering ``url``"""
+        cache.clear()
+        # In-memory facets are rebuilt once per catalog change, not per request
+        facet_index.build()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in captured if '"products_' in query['sql']]
+
+    def test_card_columns(self):
+        compiler = Product.objects.for_cards().query.get_compiler(using='default')
+        select, _, _ = compiler.get_select()
+        columns = {(col.alias, col.target.column) for col, _, _ in select}
+        self.assertEqual(columns, {
+            ('products_product', 'id'),
+            ('products_product', 'name'),
+            ('products_product', 'slug'),
+            ('products_product', 'price'),
+            ('products_product', 'compare_price'),
+            ('products_product', 'main_image'),
+            ('products_product', 'rating_average'),
+            ('products_product', 'rating_count'),
+            ('products_product', 'created_at'),
+            ('products_product', 'sales_count'),
+            ('products_product', 'category_id'),
+            ('products_product', 'brand_id'),
+            ('products_category', 'id'),
+            ('products_category', 'name'),
+            ('products_category', 'slug'),
+            ('products_brand', 'id'),
+            ('products_brand', 'name'),
+            ('products_brand', 'slug'),
+        })
+
+    def test_listing_query_counts(self):
+        pages = {
+            reverse('products:home'): 3,
+            reverse('products:product_list'): 3,
+            reverse('products:product_list') + '?sort=price_low': 3,
+            reverse('products:category_detail', args=['shoes']): 4,
+            reverse('products:brand_detail', args=['nike']): 2,
+            reverse('products:search') + '?q=runner': 2,
+        }
+        self.create_products(2)
+        small = {url: self.catalog_queries(url) for url in pages}
+        self.create_products(20)
+        for url, expected in pages.items():
+            with self.subTest(url=url):
+                queries = self.catalog_queries(url)
+                self.assertEqual(len(queries), expected, queries)
+                self.assertEqual(len(queries), len(small[url]))
+                for sql in queries:
+                    self.assertNotIn('"products_product"."description"', sql)
+                    self.assertNotIn('"products_product"."meta_description"', sql)
+
+
+@override_settings(CATALOG_INDEX_BACKGROUND_REFRESH=False)
+class SortModeTests(TestCase):
+    """Every sort mode is read in index order and anything else is rejected"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(10)]
+        brands = [Brand.objects.create(name=f'Brand {i}', slug=f'brand-{i}') for i in range(10)]
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}',
+                slug=f'product-{i}',
+                sku=f'SKU-{i}',
+                description='',
+                category=categories[i % 10],
+                brand=brands[i % 10],
+                price=i % 97,
+                sales_count=i % 13,
+                is_active=i % 20 != 0,
+            )
+            for i in range(2000)
+        ])
+        cls.category = categories[3]
+        cls.brand = brands[3]
+
+    def assertIndexOrdered(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', plan)
+        else:
+            self.assertNotRegex(plan, r'(?m)^\W*Sort ')
+        self.assertIn('_idx', plan)
+
+    @skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'Plan format is backend specific')
+    def test_sort_modes_use_indexes(self):
+        listings = {
+            'catalog': Product.objects.for_cards().filter(is_active=True),
+            'category': Product.objects.for_cards().filter(category__in=[self.category.id], is_active=True),
+        }
+        for mode, (label, ordering) in SORT_MODES.items():
+            for listing, queryset in listings.items():
+                with self.subTest(mode=mode, listing=listing):
+                    self.assertIndexOrdered(queryset.order_by(*ordering)[:13])
+        brand_page = Product.objects.for_cards().filter(brand=self.brand, is_active=True)
+        self.assertIndexOrdered(brand_page.order_by(*SORT_MODES['newest'][1])[:13])
+
+    def test_sort_values(self):
+        url = reverse('products:product_list')
+        for value in list(SORT_MODES) + list(SORT_ALIASES):
+            with self.subTest(sort=value):
+                self.assertEqual(self.client.get(url, {'sort': value}).status_code, 200)
+        category_url = reverse('products:category_detail', args=[self.category.slug])
+        for value in ['price; DROP TABLE products_product', 'description', '-views', 'relevance x']:
+            with self.subTest(sort=value):
+                self.assertEqual(self.client.get(url, {'sort': value}).status_code, 400)
+                self.assertEqual(self.client.get(category_url, {'sort': value}).status_code, 400)
+
+    def test_price_filter(self):
+        url = reverse('products:product_list')
+        response = self.client.get(url, {'min_price': '90', 'max_price': '96'})
+        self.assertTrue(all(90 <= product.price <= 96 for product in response.context['page_obj']))
+        # Malformed and non-finite prices are ignored rather than reaching the database
+        unfiltered = [product.id for product in self.client.get(url).context['page_obj']]
+        for value in ['abc', 'NaN', 'sNaN', '-nan', 'Infinity', '-Inf']:
+            with self.subTest(price=value):
+                response = self.client.get(url, {'min_price': value, 'max_price': value})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([product.id for product in response.context['page_obj']], unfiltered)
+
+
+@override_settings(CATALOG_INDEX_BACKGROUND_REFRESH=False)
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'Needs a full-text index')
+class SearchTests(TestCase):
+    """Full-text search ranks by field weight and follows catalog edits"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.brand = Brand.objects.create(name='Nike', slug='nike')
+        cls.by_name = cls.create_product('Trail Runner', 'Sturdy shoe for rough ground')
+        cls.by_description = cls.create_product('Court Classic', 'Not a runner, but comfortable all day')
+        cls.unrelated = cls.create_product('Wool Socks', 'Warm socks')
+
+    @classmethod
+    def create_product(cls, name, description, brand=None):
+        return Product.objects.create(
+            name=name, slug=name.lower().replace(' ', '-'), sku=name.upper().replace(' ', '-'),
+            description=description, category=cls.category, brand=brand or cls.brand, price=100,
+        )
+
+    def search(self, query):
+        return list(search_products(Product.objects.all(), query).order_by('-search_rank').values_list('name', flat=True))
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.search('runner'), ['Trail Runner', 'Court Classic'])
+
+    def test_terms_are_prefixes_and_all_must_match(self):
+        self.assertEqual(self.search('run trail'), ['Trail Runner'])
+        self.assertEqual(self.search('runner socks'), [])
+        self.assertFalse(search_products(Product.objects.all(), '!!!').exists())
+
+    def test_index_follows_edits(self):
+        self.unrelated.name = 'Runner Socks'
+        self.unrelated.save()
+        self.assertIn('Runner Socks', self.search('runner'))
+
+        self.brand.name = 'Asics'
+        self.brand.save()
+        self.assertEqual(len(self.search('asics')), 3)
+        self.assertEqual(self.search('nike'), [])
+
+        self.by_name.delete()
+        self.assertNotIn('Trail Runner', self.search('runner'))
+
+    def test_rebuild_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        self.assertEqual(self.search('runner'), [])
+        self.assertEqual(rebuild_index(), 3)
+        self.assertEqual(self.search('runner'), ['Trail Runner', 'Court Classic'])
+
+
+class KeysetPaginatorTests(TestCase):
+    """Cursors walk every row once in both directions and survive tampering"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        Product.objects.bulk_create([
+            # Repeated prices so the id tiebreaker matters
+            Product(name=f'Runner {i}', slug=f'runner-{i}', sku=f'RUN-{i}', description='',
+                    category=category, price=100 + i % 7)
+            for i in range(30)
+        ])
+
+    def paginator(self):
+        return KeysetPaginator(Product.objects.all(), ('-price', '-id'), per_page=7)
+
+    def test_round_trip(self):
+        expected = list(Product.objects.order_by('-price', '-id').values_list('id', flat=True))
+        pages = [self.paginator().get_page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator().get_page(pages[-1].next_cursor))
+        self.assertEqual([product.id for page in pages for product in page], expected)
+        self.assertFalse(pages[0].has_previous())
+
+        # Walking back with previous cursors returns the same pages
+        page = pages[-1]
+        for expected_page in reversed(pages[:-1]):
+            page = self.paginator().get_page(page.previous_cursor)
+            self.assertEqual(list(page), list(expected_page))
+        self.assertFalse(page.has_previous())
+
+    def test_tampered_cursors_fall_back_to_first_page(self):
+        first = [product.id for product in self.paginator().get_page()]
+        for cursor in [
+            'not base64 !!',
+            base64.urlsafe_b64encode(b'not json').decode(),
+            base64.urlsafe_b64encode(b'{"v": [1], "d": "n"}').decode(),
+            base64.urlsafe_b64encode(b'{"v": ["abc", "def"], "d": "n"}').decode(),
+            base64.urlsafe_b64encode(b'{"v": [1, 2], "d": "x"}').decode(),
+        ]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual([product.id for product in self.paginator().get_page(cursor)], first)
+
+    def test_listing_accepts_any_cursor(self):
+        url = reverse('products:product_list')
+        for cursor in ['garbage', base64.urlsafe_b64encode(b'{"v": [null, null, null], "d": "p"}').decode()]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 200)
+
+
+class ViewCounterTests(TestCase):
+    """Buffered product views end up in Product.views"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.product = Product.objects.create(name='Runner', slug='runner', sku='RUN', description='',
+                                             category=category, price=100)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_threshold_flush(self):
+        counter = ProductViewCounter(MemoryViewBuffer(), threshold=3, interval=3600)
+        counter.record(self.product.id)
+        counter.record(self.product.id)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views, 0)
+        counter.record(self.product.id)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views, 3)
+
+    def test_failed_flush_keeps_page_and_counts(self):
+        counter = ProductViewCounter(MemoryViewBuffer(), threshold=1, interval=3600)
+        url = reverse('products:product_detail', args=[self.product.slug])
+        with patch('products.views.view_counter', counter), patch('products.page_cache.view_counter', counter), \
+                patch('products.counters.write_views', side_effect=DatabaseError('database is locked')), \
+                self.assertLogs('products.counters', 'ERROR'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        # Written by the next flush that succeeds
+        self.assertEqual(counter.flush(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views, 1)
+
+    def test_cache_buffer_flushed_by_command(self):
+        buffer = CacheViewBuffer()
+        for _ in range(5):
+            buffer.add(self.product.id)
+        with patch.object(view_counter, 'buffer', CacheViewBuffer()):
+            out = StringIO()
+            call_command('flush_product_views', stdout=out)
+        self.assertIn('Flushed 5', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views, 5)
+
+    def test_command_refuses_memory_buffer(self):
+        with patch.object(view_counter, 'buffer', MemoryViewBuffer()):
+            with self.assertRaises(CommandError):
+                call_command('flush_product_views', stdout=StringIO())
+
+    def test_failed_write_keeps_counts(self):
+        counter = ProductViewCounter(MemoryViewBuffer(), threshold=100, interval=3600)
+        counter.record(self.product.id)
+        with patch('products.counters.write_views', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                counter.flush()
+        self.assertEqual(counter.flush(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.views, 1)
+
+
+class CategoryTreeTests(TestCase):
+    """Materialized paths are kept on create and move and drive subtree lookups"""
+
+    def setUp(self):
+        self.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        self.running = Category.objects.create(name='Running', slug='running', parent=self.shoes)
+        self.trail = Category.objects.create(name='Trail', slug='trail', parent=self.running)
+        self.clothing = Category.objects.create(name='Clothing', slug='clothing')
+
+    def path_of(self, *categories):
+        return ''.join(str(category.pk).zfill(Category.PATH_STEP) for category in categories)
+
+    def test_paths_on_create(self):
+        self.trail.refresh_from_db()
+        self.assertEqual(self.trail.path, self.path_of(self.shoes, self.running, self.trail))
+        self.assertEqual(self.trail.depth, 2)
+        self.assertEqual(self.clothing.path, self.path_of(self.clothing))
+
+    def test_move_rewrites_subtree(self):
+        self.running.parent = self.clothing
+        self.running.save()
+        self.trail.refresh_from_db()
+        self.assertEqual(self.trail.path, self.path_of(self.clothing, self.running, self.trail))
+        self.assertEqual(self.trail.depth, 2)
+        self.assertEqual(list(self.shoes.get_descendants()), [self.shoes])
+
+        self.running.parent = None
+        self.running.save()
+        self.trail.refresh_from_db()
+        self.assertEqual((self.trail.path, self.trail.depth), (self.path_of(self.running, self.trail), 1))
+
+    def test_cannot_move_under_own_subtree(self):
+        self.shoes.parent = self.trail
+        with self.assertRaises(ValueError):
+            self.shoes.save()
+
+    def test_descendants_and_ancestors(self):
+        self.assertEqual(list(self.shoes.get_descendants()), [self.shoes, self.running, self.trail])
+        self.assertEqual(list(self.shoes.get_descendants(include_self=False)), [self.running, self.trail])
+        self.assertEqual(set(self.running.get_descendant_ids()), {self.running.pk, self.trail.pk})
+        self.assertEqual(list(self.trail.get_ancestors()), [self.shoes, self.running])
+
+    def test_missing_path_matches_only_itself(self):
+        Category.objects.filter(pk=self.shoes.pk).update(path='')
+        self.shoes.refresh_from_db()
+        self.assertEqual(list(self.shoes.get_descendants()), [self.shoes])
+        self.assertEqual(self.shoes.get_descendant_ids(), [self.shoes.pk])
+        with self.assertRaises(ValueError):
+            Category.subtree_q('')
+
+
+class CatalogCacheTests(TestCase):
+    """Catalog writes invalidate cached fragments only once they are committed"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidation_waits_for_commit(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Shoes', slug='shoes')
+            # A request served now would still cache under the old version
+            self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(get_catalog_version(), version + 1)
+
+
+@override_settings(CATALOG_INDEX_BACKGROUND_REFRESH=False)
+class RelatedProductsTests(TestCase):
+    """The detail page only labels co-purchases as frequently bought together"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.product, cls.other = [
+            Product.objects.create(name=name, slug=name.lower(), sku=name.upper(), description='',
+                                   category=category, price=100)
+            for name in ('Runner', 'Trainer')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_co_purchases(self):
+        ProductRecommendation.objects.create(product=self.product, recommended=self.other, rank=1, score=0.5)
+        response = self.client.get(reverse('products:product_detail', args=[self.product.slug]))
+        self.assertContains(response, 'Frequently Bought Together')
+        self.assertNotContains(response, 'You May Also Like')
+
+    def test_category_fallback(self):
+        response = self.client.get(reverse('products:product_detail', args=[self.product.slug]))
+        self.assertContains(response, 'You May Also Like')
+        self.assertNotContains(response, 'Frequently Bought Together')
+        self.assertEqual(list(response.context['related_products']), [self.other])
+
+
+@override_settings(CATALOG_INDEX_BACKGROUND_REFRESH=False)
+class AutocompleteTests(TestCase):
+    """Suggestions come from the prefix index and never exceed the limit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            Brand.objects.create(name=f'Run Brand {i}', slug=f'run-brand-{i}')
+            category = Category.objects.create(name=f'Running {i}', slug=f'running-{i}')
+        for i in range(10):
+            Product.objects.create(name=f'Trail Runner {i}', slug=f'trail-runner-{i}', sku=f'TR-{i}', description='',
+                                   category=category, price=100, sales_count=i)
+        Product.objects.create(name='Café Runner', slug='cafe-runner', sku='CAFE', description='', category=category,
+                               price=100)
+
+    def setUp(self):
+        cache.clear()
+        autocomplete_index.build()
+
+    def test_limit(self):
+        for limit in (1, 2, 5, 8, 20):
+            results = autocomplete_index.suggest('run', limit)
+            self.assertLessEqual(len(results), limit)
+            # Products always get half of the slots
+            self.assertGreaterEqual(sum(result['type'] == 'product' for result in results), limit // 2)
+        self.assertEqual(len(autocomplete_index.suggest('run', 8)), 8)
+
+    def test_word_prefix_and_ranking(self):
+        results = autocomplete_index.suggest('trail runner', 3)
+        self.assertEqual([result['label'] for result in results], ['Trail Runner 9', 'Trail Runner 8', 'Trail Runner 7'])
+        # Any word of the name starts a key, accents are ignored
+        self.assertIn('Café Runner', [result['label'] for result in autocomplete_index.suggest('RUNNER', 20)])
+        self.assertEqual(autocomplete_index.suggest('cafe', 5)[0]['url'], reverse('products:product_detail', args=['cafe-runner']))
+        self.assertEqual(autocomplete_index.suggest('   '), [])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('products:autocomplete'), {'q': 'run', 'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['query'], 'run')
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(set(data['results'][0]), {'type', 'label', 'url'})
+        self.assertEqual(data['results'][0]['type'], 'brand')
+        # Bad and oversized limits are clamped
+        self.assertEqual(len(self.client.get(reverse('products:autocomplete'), {'q': 'run', 'limit': 'x'}).json()['results']), 8)
+        self.assertLessEqual(len(self.client.get(reverse('products:autocomplete'), {'q': 'run', 'limit': 500}).json()['results']), 20)
+
+
+@override_settings(CATALOG_INDEX_BACKGROUND_REFRESH=False)
+class ImportCatalogTests(TestCase):
+    """import_catalog upserts by SKU and skips bad rows without losing the batch"""
+
+    @classmethod
+    def setUpTestData(cls):
+        shoes = Category.objects.create(name='Shoes', slug='shoes')
+        Product.objects.create(name='Old name', slug='runner', sku='RUN-1', description='', category=shoes, price=50)
+        Product.objects.create(name='Taken', slug='taken', sku='TAKEN', description='', category=shoes, price=10)
+
+    def import_rows(self, rows, *args):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w') as f:
+            f.writelines(json.dumps(row) + '\n' for row in rows)
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_upsert(self):
+        out, err = self.import_rows([
+            {'sku': 'RUN-1', 'name': 'Runner', 'price': '99.50', 'category': 'Shoes > Running', 'brand': 'Nike',
+             'variants': [{'sku': 'RUN-1-42', 'name': 'Size', 'value': '42', 'stock': 3}],
+             'specifications': {'Weight': '300g'}},
+            {'sku': 'NEW-1', 'name': 'Trainer', 'price': '20', 'category': ['Shoes'], 'stock': '7'},
+        ])
+        self.assertIn('Imported 2 products', out)
+        self.assertEqual(err, '')
+        runner = Product.objects.get(sku='RUN-1')
+        self.assertEqual((runner.name, runner.price), ('Runner', Decimal('99.50')))
+        self.assertEqual(runner.category.name, 'Running')
+        self.assertEqual(runner.category.parent.name, 'Shoes')
+        self.assertEqual(runner.brand.name, 'Nike')
+        self.assertEqual(ProductVariant.objects.get(sku='RUN-1-42').product, runner)
+        self.assertEqual(list(runner.specifications.values_list('name', 'value')), [('Weight', '300g')])
+        trainer = Product.objects.get(sku='NEW-1')
+        self.assertEqual((trainer.stock, trainer.slug), (7, 'trainer-new-1'))
+
+        # Re-importing updates in place and replaces listed specifications
+        self.import_rows([{'sku': 'RUN-1', 'name': 'Runner', 'price': '89', 'category': 'Shoes > Running',
+                           'specifications': []}])
+        self.assertEqual(Product.objects.get(sku='RUN-1').price, Decimal('89'))
+        self.assertFalse(ProductSpecification.objects.exists())
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(Category.objects.filter(name='Running').count(), 1)
+
+    def test_partial_rows_keep_other_columns(self):
+        nike = Brand.objects.create(name='Nike', slug='nike')
+        Product.objects.filter(sku='RUN-1').update(brand=nike, stock=40, description='Cushioned', is_featured=True)
+        with patch('products.management.commands.import_catalog.invalidate_product_page') as invalidate:
+            self.import_rows([
+                {'sku': 'RUN-1', 'name': 'Runner', 'price': '60', 'category': 'Shoes'},
+                {'sku': 'NEW-1', 'name': 'Trainer', 'price': '20', 'category': 'Shoes', 'stock': 7,
+                 'description': 'New', 'brand': 'Adidas'},
+            ])
+        runner = Product.objects.get(sku='RUN-1')
+        self.assertEqual((runner.name, runner.price, runner.slug), ('Runner', Decimal('60'), 'runner'))
+        self.assertEqual((runner.brand, runner.stock, runner.description, runner.is_featured),
+                         (nike, 40, 'Cushioned', True))
+        trainer = Product.objects.get(sku='NEW-1')
+        self.assertEqual((trainer.slug, trainer.stock, trainer.brand.name), ('trainer-new-1', 7, 'Adidas'))
+        self.assertCountEqual(invalidate.call_args.args, ['runner', 'trainer-new-1'])
+
+        # A supplied slug or brand column is written, and the old URL's page is dropped
+        with patch('products.management.commands.import_catalog.invalidate_product_page') as invalidate:
+            self.import_rows([{'sku': 'RUN-1', 'name': 'Runner', 'price': '60', 'category': 'Shoes',
+                               'slug': 'road-runner', 'brand': ''}])
+        runner.refresh_from_db()
+        self.assertEqual((runner.slug, runner.brand, runner.stock), ('road-runner', None, 40))
+        self.assertCountEqual(invalidate.call_args.args, ['runner', 'road-runner'])
+
+    def test_invalid_rows_are_skipped(self):
+        out, err = self.import_rows([
+            {'name': 'No SKU', 'price': '1', 'category': 'Shoes'},
+            {'sku': 'BAD-PRICE', 'name': 'Bad', 'price': 'cheap', 'category': 'Shoes'},
+            {'sku': 'NO-CATEGORY', 'name': 'Lost', 'price': '1'},
+            {'sku': 'OK', 'name': 'Fine', 'price': '1', 'category': 'Shoes'},
+        ])
+        self.assertIn('Imported 1 products', out)
+        self.assertIn('skipped 3', out)
+        self.assertIn('Row 1: missing sku', err)
+        self.assertIn("Row 2: invalid price: 'cheap'", err)
+        self.assertTrue(Product.objects.filter(sku='OK').exists())
+
+    def test_conflicting_row_does_not_abort_batch(self):
+        out, err = self.import_rows([
+            {'sku': 'A', 'name': 'First', 'price': '1', 'category': 'Boots'},
+            {'sku': 'CLASH', 'name': 'Clash', 'slug': 'taken', 'price': '1', 'category': 'Boots'},
+            {'sku': 'B', 'name': 'Second', 'price': '1', 'category': 'Boots > Hiking'},
+        ], '--batch-size', '10')
+        self.assertIn('Imported 2 products', out)
+        self.assertIn('skipped 1', out)
+        self.assertIn('CLASH', err)
+        self.assertEqual(set(Product.objects.filter(sku__in=['A', 'B', 'CLASH']).values_list('sku', flat=True)), {'A', 'B'})
+        # Categories created by the rolled back batch were created again
+        self.assertEqual(Product.objects.get(sku='B').category.parent.name, 'Boots')
+
+
+@override_settings(PRODUCT_FEED_TOKEN='')
+class ProductFeedTests(TestCase):
+    """The feed view and export command write every format and validate since"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        Product.objects.create(name='Runner', slug='runner', sku='RUN', description='', category=category, price=100)
+
+    def test_since(self):
+        url = reverse('products:product_feed', args=['jsonl'])
+        response = self.client.get(url, {'since': '2000-01-01T00:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'RUN', b''.join(response.streaming_content))
+        response = self.client.get(url, {'since': '2999-01-01T00:00+00:00'})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        for value in ['yesterday', '2025-02-30T00:00', '2025-13-01T00:00', '2025-01-01T25:00']:
+            with self.subTest(since=value):
+                self.assertEqual(self.client.get(url, {'since': value}).status_code, 400)
+
+
+    def export(self, suffix, *args):
+        """Run export_product_feed into a temporary file named with suffix and return its path"""
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command('export_product_feed', '--output', path, *args, stderr=StringIO())
+        return path
+
+    def test_export_formats(self):
+        Product.objects.create(name='Walker, "classic"', slug='walker', sku='WALK', description='Comfy & light',
+                               category=Category.objects.get(), price=80, compare_price=90, stock=3)
+        Product.objects.create(name='Hidden', slug='hidden', sku='HIDE', description='',
+                               category=Category.objects.get(), price=10, is_active=False)
+        for suffix in ['', '.gz']:
+            with self.subTest(gzip=bool(suffix)):
+                opener = gzip.open if suffix else open
+
+                with opener(self.export(suffix, '--format', 'csv'), 'rt', encoding='utf-8', newline='') as feed:
+                    rows = list(csv.DictReader(feed))
+                self.assertEqual([row['id'] for row in rows], ['RUN', 'WALK'])
+                self.assertEqual(rows[1]['title'], 'Walker, "classic"')
+                self.assertEqual((rows[1]['price'], rows[1]['sale_price']), ('90.00 PKR', '80.00 PKR'))
+                self.assertEqual((rows[0]['availability'], rows[1]['availability']), ('out_of_stock', 'in_stock'))
+                self.assertEqual(rows[0]['link'], 'http://localhost:8000' + reverse('products:product_detail', args=['runner']))
+
+                with opener(self.export(suffix, '--format', 'jsonl'), 'rt', encoding='utf-8') as feed:
+                    items = [json.loads(line) for line in feed]
+                self.assertEqual([item['id'] for item in items], ['RUN', 'WALK'])
+                self.assertEqual(items[1]['description'], 'Comfy & light')
+
+                with opener(self.export(suffix, '--format', 'xml'), 'rb') as feed:
+                    root = ElementTree.parse(feed).getroot()
+                ids = [item.findtext('{http://base.google.com/ns/1.0}id') for item in root.iter('item')]
+                self.assertEqual(ids, ['RUN', 'WALK'])
+                self.assertEqual(root.find('channel/item[2]/{http://base.google.com/ns/1.0}title').text,
+                                 'Walker, "classic"')
+
+    def test_export_since(self):
+        path = self.export('', '--format', 'jsonl', '--since', '2999-01-01T00:00')
+        with open(path, encoding='utf-8') as feed:
+            self.assertEqual(feed.read(), '')
+        for value in ['yesterday', '2025-02-30T00:00']:
+            with self.subTest(since=value):
+                with self.assertRaisesMessage(CommandError, '--since must be an ISO 8601 date and time'):
+                    call_command('export_product_feed', '--since', value, stderr=StringIO())
+
+class SitemapTests(TestCase):
+    """Sitemaps are split into gzipped shards listed by an index the view serves from disk"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        Brand.objects.create(name='Nike', slug='nike')
+        for number in range(5):
+            Product.objects.create(name=f'Shoe {number}', slug=f'shoe-{number}', sku=f'SHOE-{number}',
+                                   description='', category=category, price=10)
+        Product.objects.create(name='Hidden', slug='hidden', sku='HIDE', description='', category=category,
+                               price=10, is_active=False)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.root = Path(directory)
+        override = override_settings(SITEMAP_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def read_shard(self, name):
+        with gzip.open(self.root / name, 'rb') as f:
+            urlset = ElementTree.parse(f).getroot()
+        return [loc.text for loc in urlset.iter('{http://www.sitemaps.org/schemas/sitemap/0.9}loc')]
+
+    def test_shards_and_index(self):
+        with patch('products.sitemaps.URLS_PER_SHARD', 2):
+            stats = build_sitemaps('https://shop.example/')
+        self.assertEqual(stats, {'products': (5, 3), 'categories': (1, 1), 'brands': (1, 1)})
+
+        shards = ['sitemap-products-1.xml.gz', 'sitemap-products-2.xml.gz', 'sitemap-products-3.xml.gz',
+                  'sitemap-categories-1.xml.gz', 'sitemap-brands-1.xml.gz']
+        index = ElementTree.parse(self.root / 'sitemap.xml').getroot()
+        locations = [loc.text for loc in index.iter('{http://www.sitemaps.org/schemas/sitemap/0.9}loc')]
+        self.assertEqual(locations, [f'https://shop.example/sitemaps/{name}' for name in shards])
+
+        product_url = 'https://shop.example' + reverse('products:product_detail', args=['shoe-0'])
+        self.assertEqual(self.read_shard(shards[0]), [product_url, product_url.replace('shoe-0', 'shoe-1')])
+        self.assertEqual(len(self.read_shard(shards[2])), 1)
+        self.assertEqual(self.read_shard(shards[4]),
+                         ['https://shop.example' + reverse('products:brand_detail', args=['nike'])])
+
+        # A smaller catalog removes the shards it no longer needs
+        build_sitemaps('https://shop.example/')
+        self.assertEqual(sorted(path.name for path in self.root.iterdir()),
+                         sorted(['sitemap.xml', shards[0], shards[3], shards[4]]))
+        self.assertEqual(len(self.read_shard(shards[0])), 5)
+
+    def test_view_conditional_get(self):
+        self.assertEqual(self.client.get(reverse('products:sitemap')).status_code, 404)
+        build_sitemaps('https://shop.example')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('products:sitemap'))
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        last_modified = response['Last-Modified']
+        self.assertIn(b'sitemap-products-1.xml.gz', b''.join(response.streaming_content))
+        response = self.client.get(reverse('products:sitemap'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        url = reverse('products:sitemap_shard', args=['sitemap-products-1.xml.gz'])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn(b'shoe-4', gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(
+            self.client.get(reverse('products:sitemap_shard', args=['sitemap-products-9.xml.gz'])).status_code, 404)
+
+@override_settings(CATALOG_INDEX_BACKGROUND_REFRESH=False)
+class ImageManifestTests(TestCase):
+    """Pages look up the derivatives of all their images in one batch"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        for i in range(6):
+            Product.objects.create(name=f'Runner {i}', slug=f'runner-{i}', sku=f'RUN-{i}', description='',
+                                   category=category, price=100, main_image=f'products/runner-{i}.jpg')
+            if i % 2:
+                ImageDerivative.objects.create(source=f'products/runner-{i}.jpg', digest='ab' * 32, width=800,
+                                               height=600, widths=[320, 640], formats=['webp'], fallback='jpeg')
+
+    def setUp(self):
+        cache.clear()
+
+    def derivative_queries(self, captured):
+        return [query for query in captured if 'products_imagederivative' in query['sql']]
+
+    def test_get_manifests(self):
+        sources = [f'products/runner-{i}.jpg' for i in range(6)]
+        with CaptureQueriesContext(connection) as captured:
+            manifests = get_manifests(sources + [''])
+        self.assertEqual(len(captured), 1)
+        self.assertEqual(set(manifests), set(sources))
+        self.assertEqual({source for source, manifest in manifests.items() if manifest}, set(sources[1::2]))
+        # Found and missing originals are both cached
+        with self.assertNumQueries(0):
+            self.assertEqual(get_manifests(sources), manifests)
+
+    def test_listing_batches_lookups(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('products:product_list'))
+        self.assertEqual(len(self.derivative_queries(captured)), 1)
+        self.assertContains(response, '<picture>', count=3)
+        self.assertContains(response, 'runner-0.jpg" alt=')
+        self.assertContains(response, 'derived/abababababababab/640w.webp 640w')
+
+
+@override_settings(CATALOG_INDEX_BACKGROUND_REFRESH=False)
+class ProductPageCacheTests(TestCase):
+    """Anonymous product pages are revalidated with ETags and served from the cache"""
+
+    template = 'products/product_detail.html'
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.product = Product.objects.create(name='Runner', slug='runner', sku='RUN', description='',
+                                             category=category, price=100, stock=5)
+        cls.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='x')
+        cls.url = reverse('products:product_detail', args=['runner'])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_etag_and_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, self.template)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"runner-'))
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_cache_hit_skips_rendering(self):
+        first = self.client.get(self.url)
+        with self.assertTemplateNotUsed(self.template):
+            second = self.client.get(self.url)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertContains(second, 'Runner')
+        # The CSRF token is filled in per visitor, never the cached placeholder
+        self.assertNotContains(second, '__csrf_token__')
+        self.assertContains(second, 'name="csrfmiddlewaretoken" value="')
+
+    def test_signed_in_and_post_requests_bypass_cache(self):
+        self.client.get(self.url)
+        response = self.client.post(self.url)
+        self.assertTemplateUsed(response, self.template)
+        self.assertNotIn('ETag', response)
+
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, self.template)
+        self.assertNotIn('ETag', response)
+
+    def test_invalidation_renders_again(self):
+        etag = self.client.get(self.url)['ETag']
+        # Versions are millisecond timestamps
+        time.sleep(0.002)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_product_page('runner')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, self.template)
+        self.assertNotEqual(response['ETag'], etag)
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'products'
@@ -10,4 +10,8 @@ urlpatterns = [
     path('category/<slug:slug>/', views.category_detail, name='category_detail'),
     path('brand/<slug:slug>/', views.brand_detail, name='brand_detail'),
     path('search/', views.search, name='search'),
+    path('search/autocomplete/', views.autocomplete, name='autocomplete'),
+    re_path(r'^feeds/products\.(?P<file_format>csv|jsonl|xml)(?P<gz>\.gz)?$', views.product_feed, name='product_feed'),
+    path('sitemap.xml', views.sitemap, name='sitemap'),
+    re_path(r'^sitemaps/(?P<name>sitemap-[a-z]+-\d+\.xml\.gz)$', views.sitemap, name='sitemap_shard'),
 ]
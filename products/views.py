@@ -1,17 +1,49 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import BadRequest, PermissionDenied
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
-from django.db.models import Q, Avg, Count
+from django.db.models import Count
 from django.contrib import messages
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
 from .models import Product, Category, Brand
+from .autocomplete import autocomplete_index
+from .caching import cached_fragment
+from .counters import view_counter
+from .facets import facet_index, PRICE_BUCKETS
+from .feeds import FORMATS, generate_feed
+from .images import prefetch_manifests
+from .page_cache import cached_product_page
+from .pagination import KeysetPaginator
+from .search import search_products
+from .sitemaps import INDEX_NAME, sitemap_root
+from .sorting import SORT_MODES, DEFAULT_SORT, resolve_sort
+from orders.reservations import available_to_sell
 from reviews.models import Review
 from reviews.forms import ReviewForm
 
 
 def home(request):
     """Homepage with featured and new products"""
-    featured_products = Product.objects.filter(is_featured=True, is_active=True)[:8]
-    new_products = Product.objects.filter(is_new=True, is_active=True)[:8]
-    categories = Category.objects.filter(is_active=True, parent=None)[:6]
+    featured_products = cached_fragment(
+        'home:featured', lambda: list(Product.objects.for_cards().filter(is_featured=True, is_active=True)[:8])
+    )
+    new_products = cached_fragment(
+        'home:new', lambda: list(Product.objects.for_cards().filter(is_new=True, is_active=True)[:8])
+    )
+    categories = cached_fragment(
+        'home:categories',
+        lambda: list(Category.objects.filter(is_active=True, parent=None).annotate(product_count=Count('products'))[:6])
+    )
+    prefetch_manifests([
+        *(product.main_image for product in featured_products + new_products),
+        *(category.image for category in categories),
+    ])
     
     context = {
         'featured_products': featured_products,
@@ -21,85 +53,113 @@ def home(request):
     return render(request, 'products/home.html', context)
 
 
+def parse_price(value):
+    """Decimal price from a query parameter, or None if missing, malformed or not finite (NaN, Infinity)"""
+    try:
+        price = Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+    return price if price is not None and price.is_finite() else None
+
+
 def product_list(request):
-    """Product catalog with filters and search"""
-    products = Product.objects.filter(is_active=True)
+    """Product catalog with filters, facet counts and search"""
+    products = Product.objects.for_cards().filter(is_active=True)
+    facet_filters = {}
     
     # Search
     query = request.GET.get('q')
     if query:
-        products = products.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(brand__name__icontains=query) |
-            Q(category__name__icontains=query)
-        )
+        products = search_products(products, query)
+        facet_filters['product_ids'] = products.values_list('id', flat=True)
     
     # Category filter
     category_slug = request.GET.get('category')
     if category_slug:
         category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
+        products = products.filter(category__in=category.get_descendant_ids())
+        facet_filters['category_id'] = category.id
     
     # Brand filter
     brand_slug = request.GET.get('brand')
     if brand_slug:
         brand = get_object_or_404(Brand, slug=brand_slug)
         products = products.filter(brand=brand)
+        facet_filters['brand_id'] = brand.id
     
     # Price range filter
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
+    min_price = parse_price(request.GET.get('min_price'))
+    max_price = parse_price(request.GET.get('max_price'))
+    if min_price is not None:
         products = products.filter(price__gte=min_price)
-    if max_price:
+    if max_price is not None:
         products = products.filter(price__lte=max_price)
+    facet_filters.update(min_price=min_price, max_price=max_price)
     
-    # Sorting
-    sort = request.GET.get('sort', '-created_at')
-    if sort == 'price_low':
-        products = products.order_by('price')
-    elif sort == 'price_high':
-        products = products.order_by('-price')
-    elif sort == 'name':
-        products = products.order_by('name')
-    elif sort == 'popular':
-        products = products.order_by('-sales_count')
-    else:
-        products = products.order_by(sort)
+    # Sorting and pagination
+    sort, ordering = resolve_sort(request.GET.get('sort'), query)
+    paginator = KeysetPaginator(products, ordering, per_page=12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    prefetch_manifests(product.main_image for product in page_obj)
     
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Get all categories (in tree order, see Category.depth) and brands for filters
+    categories = cached_fragment(
+        'taxonomy:categories', lambda: list(Category.objects.filter(is_active=True).order_by('path'))
+    )
+    brands = cached_fragment('taxonomy:brands', lambda: list(Brand.objects.filter(is_active=True)))
     
-    # Get all categories and brands for filters
-    categories = Category.objects.filter(is_active=True)
-    brands = Brand.objects.filter(is_active=True)
+    # Facet counts under the current filters (in-memory, see facets.py)
+    counts = facet_index.counts(**facet_filters)
+    category_facets = [(category, counts['categories'].get(category.id, 0)) for category in categories]
+    brand_facets = [(brand, counts['brands'].get(brand.id, 0)) for brand in brands]
+    price_facets = [
+        {'label': label, 'min': low, 'max': high, 'count': count,
+         'selected': (low, high) == (min_price, max_price)}
+        for (label, low, high), count in zip(PRICE_BUCKETS, counts['prices'])
+    ]
     
     context = {
         'page_obj': page_obj,
         'categories': categories,
         'brands': brands,
+        'category_facets': category_facets,
+        'brand_facets': brand_facets,
+        'price_facets': price_facets,
+        'total_results': counts['total'],
         'query': query,
+        'current_category': category_slug,
+        'current_brand': brand_slug,
         'current_sort': sort,
+        'sort_modes': SORT_MODES,
     }
     return render(request, 'products/product_list.html', context)
 
 
+@cached_product_page
 def product_detail(request, slug):
     """Product detail page with reviews"""
     product = get_object_or_404(Product, slug=slug, is_active=True)
     
-    # Increment views
-    product.views += 1
-    product.save(update_fields=['views'])
+    # Count the view (written to the database in batches)
+    view_counter.record(product.id)
+    
+    # Stock minus what other customers hold at checkout (see orders.reservations)
+    holder = request.user if request.user.is_authenticated else None
+    available_stock = available_to_sell([product], exclude_user=holder)[0][product.id]
     
-    # Get related products
-    related_products = Product.objects.filter(
-        category=product.category,
-        is_active=True
-    ).exclude(id=product.id)[:4]
+    # Frequently bought together (precomputed by build_recommendations),
+    # falling back to the same category for products without order history
+    related_products = [
+        recommendation.recommended
+        for recommendation in product.recommendations.filter(recommended__is_active=True).select_related('recommended')[:4]
+    ]
+    bought_together = bool(related_products)
+    if not bought_together:
+        related_products = list(Product.objects.for_cards().filter(
+            category=product.category,
+            is_active=True
+        ).exclude(id=product.id)[:4])
+    prefetch_manifests([product.main_image, *(related.main_image for related in related_products)])
     
     # Get reviews
     reviews = Review.objects.filter(product=product, is_approved=True).select_related('user')
@@ -125,7 +185,9 @@ def product_detail(request, slug):
     
     context = {
         'product': product,
+        'available_stock': available_stock,
         'related_products': related_products,
+        'bought_together': bought_together,
         'reviews': reviews,
         'review_form': review_form,
         'user_review': user_review,
@@ -136,29 +198,24 @@ def product_detail(request, slug):
 def category_detail(request, slug):
     """Category page"""
     category = get_object_or_404(Category, slug=slug, is_active=True)
-    products = Product.objects.filter(category=category, is_active=True)
-    
-    # Sorting
-    sort = request.GET.get('sort', '-created_at')
-    if sort == 'price_low':
-        products = products.order_by('price')
-    elif sort == 'price_high':
-        products = products.order_by('-price')
-    elif sort == 'name':
-        products = products.order_by('name')
-    else:
-        products = products.order_by(sort)
     
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Products from this category and all of its subcategories
+    products = Product.objects.for_cards().filter(category__in=category.get_descendant_ids(), is_active=True)
+    
+    # Sorting and pagination
+    sort, ordering = resolve_sort(request.GET.get('sort'))
+    paginator = KeysetPaginator(products, ordering, per_page=12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    prefetch_manifests(product.main_image for product in page_obj)
     
     context = {
         'category': category,
+        'ancestors': category.get_ancestors(),
+        'subcategories': category.children.filter(is_active=True),
         'products': page_obj,
         'page_obj': page_obj,
         'current_sort': sort,
+        'sort_modes': SORT_MODES,
     }
     return render(request, 'products/category_detail.html', context)
 
@@ -166,12 +223,12 @@ def category_detail(request, slug):
 def brand_detail(request, slug):
     """Brand page"""
     brand = get_object_or_404(Brand, slug=slug, is_active=True)
-    products = Product.objects.filter(brand=brand, is_active=True)
+    products = Product.objects.for_cards().filter(brand=brand, is_active=True)
     
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(products, SORT_MODES[DEFAULT_SORT][1], per_page=12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    prefetch_manifests(product.main_image for product in page_obj)
     
     context = {
         'brand': brand,
@@ -184,26 +241,81 @@ def brand_detail(request, slug):
 def search(request):
     """Advanced search page"""
     query = request.GET.get('q', '')
-    products = Product.objects.filter(is_active=True)
+    products = Product.objects.for_cards().filter(is_active=True)
     
     if query:
-        products = products.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(brand__name__icontains=query) |
-            Q(category__name__icontains=query) |
-            Q(sku__icontains=query)
-        )
+        products = search_products(products, query)
     
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(products, resolve_sort(None, query)[1], per_page=12)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    prefetch_manifests(product.main_image for product in page_obj)
     
     context = {
         'query': query,
         'products': page_obj,
         'page_obj': page_obj,
-        'total_results': products.count(),
+        'total_results': page_obj.approximate_count,
+        'total_results_capped': page_obj.count_is_capped,
     }
-    return render(request, 'products/search.html', context)
+    return render(request, 'products/search_results.html', context)
+
+
+def autocomplete(request):
+    """Search-box suggestions answered from the in-memory prefix index"""
+    query = request.GET.get('q', '')[:100]
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 8)), 20))
+    except ValueError:
+        limit = 8
+    
+    return JsonResponse({'query': query, 'results': autocomplete_index.suggest(query, limit)})
+
+
+def product_feed(request, file_format, gz=None):
+    """Marketplace product feed, streamed; ?since=<ISO 8601> lists only products changed after that time"""
+    token = getattr(settings, 'PRODUCT_FEED_TOKEN', '')
+    if token and not constant_time_compare(request.GET.get('token', ''), token):
+        raise PermissionDenied
+    
+    since = None
+    if request.GET.get('since'):
+        try:
+            # None when malformed, ValueError when well formed but impossible (2025-02-30)
+            since = parse_datetime(request.GET['since'])
+        except ValueError:
+            since = None
+        if since is None:
+            raise BadRequest('since must be an ISO 8601 date and time')
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+    
+    # Taken before reading, so using it as the next since misses nothing
+    generated_at = timezone.now()
+    compress = gz is not None
+    response = StreamingHttpResponse(
+        generate_feed(file_format, request.build_absolute_uri('/'), since=since, compress=compress),
+        content_type='application/gzip' if compress else f'{FORMATS[file_format]}; charset=utf-8',
+    )
+    if compress:
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}.gz"'
+    response['X-Feed-Generated-At'] = generated_at.isoformat()
+    return response
+
+
+def sitemap(request, name=INDEX_NAME):
+    """Sitemap index or shard, pre-rendered by build_sitemaps (no database access)"""
+    path = sitemap_root() / name
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        raise Http404('Sitemaps have not been built')
+    
+    last_modified = int(stat.st_mtime)
+    not_modified = get_conditional_response(request, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    content_type = 'application/xml' if name == INDEX_NAME else 'application/gzip'
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Last-Modified'] = http_date(last_modified)
+    return response
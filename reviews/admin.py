@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 from .models import Review, ReviewImage, ReviewVote
+from .ratings import apply_queryset_delta
 
 
 class ReviewImageInline(admin.TabularInline):
@@ -43,11 +45,15 @@ class ReviewAdmin(admin.ModelAdmin):
     helpful_votes.short_description = 'Votes'
     
     def approve_reviews(self, request, queryset):
-        updated = queryset.update(is_approved=True)
+        with transaction.atomic():
+            apply_queryset_delta(queryset.filter(is_approved=False), 1)
+            updated = queryset.update(is_approved=True)
         self.message_user(request, f'{updated} reviews approved.')
     approve_reviews.short_description = 'Approve selected reviews'
     
     def unapprove_reviews(self, request, queryset):
-        updated = queryset.update(is_approved=False)
+        with transaction.atomic():
+            apply_queryset_delta(queryset.filter(is_approved=True), -1)
+            updated = queryset.update(is_approved=False)
         self.message_user(request, f'{updated} reviews unapproved.')
     unapprove_reviews.short_description = 'Unapprove selected reviews'
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from reviews.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored rating sum, count and average for every product'
+
+    def handle(self, *args, **kwargs):
+        updated = rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt rating aggregates for {updated} products'))
@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from products.caching import invalidate_catalog_cache
+from products.models import Product
+from products.page_cache import invalidate_product_pages
+
+
+def _average_expression():
+    """Average rating computed from the stored sum and count columns"""
+    return Case(
+        When(rating_count=0, then=Value(0.0)),
+        default=Round(Cast('rating_sum', FloatField()) / F('rating_count'), 1),
+        output_field=FloatField(),
+    )
+
+
+def apply_rating_delta(product_id, rating_delta, count_delta, invalidate=True):
+    """Atomically shift a product's rating aggregates by the given amounts"""
+    if not rating_delta and not count_delta:
+        return
+    with transaction.atomic():
+        Product.objects.filter(id=product_id).update(
+            rating_sum=F('rating_sum') + rating_delta,
+            rating_count=F('rating_count') + count_delta,
+        )
+        Product.objects.filter(id=product_id).update(rating_average=_average_expression())
+    if invalidate:
+        # Product cards show ratings
+        invalidate_catalog_cache()
+
+
+def apply_queryset_delta(queryset, sign):
+    """Add (sign=1) or remove (sign=-1) a set of reviews from their products' aggregates"""
+    totals = queryset.order_by().values('product_id').annotate(total=Sum('rating'), n=Count('id'))
+    product_ids = []
+    for row in totals:
+        apply_rating_delta(row['product_id'], sign * row['total'], sign * row['n'], invalidate=False)
+        product_ids.append(row['product_id'])
+    if product_ids:
+        invalidate_catalog_cache()
+        # Bulk approval bypasses the Review signals
+        invalidate_product_pages(Product.objects.filter(id__in=product_ids))
+
+
+def rebuild_rating_aggregates():
+    """Recompute every product's rating aggregates from approved reviews"""
+    from .models import Review
+
+    approved = Review.objects.filter(product=OuterRef('pk'), is_approved=True).order_by().values('product')
+    rating_sum = approved.annotate(total=Sum('rating')).values('total')
+    rating_count = approved.annotate(n=Count('id')).values('n')
+
+    with transaction.atomic():
+        updated = Product.objects.update(
+            rating_sum=Coalesce(Subquery(rating_sum, output_field=IntegerField()), 0),
+            rating_count=Coalesce(Subquery(rating_count, output_field=IntegerField()), 0),
+        )
+        Product.objects.update(rating_average=_average_expression())
+    invalidate_catalog_cache()
+    return updated
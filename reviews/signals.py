@@ -0,0 +1,54 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from products.images import queue_derivatives
+from products.page_cache import invalidate_product_page
+from .models import Review, ReviewImage
+from .ratings import apply_rating_delta
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    """Snapshot the stored rating state so post_save can apply a delta"""
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list(
+            'product_id', 'rating', 'is_approved'
+        ).first()
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, raw=False, **kwargs):
+    """Keep product rating aggregates in step with created and edited reviews"""
+    if raw:
+        return
+    deltas = {}
+    previous = getattr(instance, '_previous_rating', None)
+    if previous and previous[2]:
+        deltas[previous[0]] = (-previous[1], -1)
+    if instance.is_approved:
+        rating_delta, count_delta = deltas.get(instance.product_id, (0, 0))
+        deltas[instance.product_id] = (rating_delta + instance.rating, count_delta + 1)
+    for product_id, (rating_delta, count_delta) in deltas.items():
+        apply_rating_delta(product_id, rating_delta, count_delta)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    """Remove a deleted review from its product's rating aggregates"""
+    if instance.is_approved:
+        apply_rating_delta(instance.product_id, -instance.rating, -1)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_detail(sender, instance, raw=False, **kwargs):
+    """Approved reviews are listed on the product page"""
+    if not raw:
+        invalidate_product_page(instance.product.slug)
+
+
+@receiver(post_save, sender=ReviewImage)
+def build_image_derivatives(sender, instance, raw=False, **kwargs):
+    """Resize customer photos in the background once saved"""
+    if not raw:
+        queue_derivatives(instance.image.name)
@@ -1,3 +1,100 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from products.caching import get_catalog_version
+from products.models import Category, Product
+from .models import Review
+from .ratings import apply_queryset_delta
 
-# Create your tests here.
+
+class RatingInvalidationTests(TestCase):
+    """Rating changes invalidate the catalog cache once, after commit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        products = [
+            Product.objects.create(name=f'Runner {i}', slug=f'runner-{i}', sku=f'RUN-{i}', description='',
+                                   category=category, price=100)
+            for i in range(3)
+        ]
+        users = [get_user_model().objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='x') for i in range(2)]
+        Review.objects.bulk_create([
+            Review(product=product, user=user, rating=4, title='Good', comment='Fits well', is_approved=False)
+            for product in products for user in users
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bulk_approval_bumps_version_once_after_commit(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            reviews = Review.objects.filter(is_approved=False)
+            apply_queryset_delta(reviews, 1)
+            self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(get_catalog_version(), version + 1)
+        self.assertEqual(list(Product.objects.values_list('rating_count', flat=True)), [2, 2, 2])
+
+
+class RatingSignalTests(TestCase):
+    """Saving and deleting reviews shifts their products' rating aggregates"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.runner, cls.trainer = [
+            Product.objects.create(name=name, slug=name.lower(), sku=name.upper(), description='', category=category,
+                                   price=100)
+            for name in ('Runner', 'Trainer')
+        ]
+        cls.users = [
+            get_user_model().objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='x')
+            for i in range(2)
+        ]
+
+    def assertRating(self, product, average, count):
+        product.refresh_from_db()
+        self.assertEqual((product.average_rating, product.reviews_count), (average, count))
+
+    def review(self, user, rating, **fields):
+        return Review.objects.create(product=self.runner, user=user, rating=rating, title='Shoes',
+                                     comment='Fine', **fields)
+
+    def test_create_edit_and_delete(self):
+        first = self.review(self.users[0], 5)
+        self.assertRating(self.runner, 5.0, 1)
+        second = self.review(self.users[1], 2)
+        self.assertRating(self.runner, 3.5, 2)
+
+        first.rating = 4
+        first.save()
+        self.assertRating(self.runner, 3.0, 2)
+
+        second.delete()
+        self.assertRating(self.runner, 4.0, 1)
+        first.delete()
+        self.assertRating(self.runner, 0, 0)
+
+    def test_approval(self):
+        review = self.review(self.users[0], 4, is_approved=False)
+        self.assertRating(self.runner, 0, 0)
+        review.is_approved = True
+        review.save()
+        self.assertRating(self.runner, 4.0, 1)
+        review.is_approved = False
+        review.save()
+        self.assertRating(self.runner, 0, 0)
+        # Deleting an unapproved review changes nothing
+        self.review(self.users[1], 2)
+        review.delete()
+        self.assertRating(self.runner, 2.0, 1)
+
+    def test_move_to_another_product(self):
+        review = self.review(self.users[0], 5)
+        self.review(self.users[1], 3)
+        review.product = self.trainer
+        review.rating = 1
+        review.save()
+        self.assertRating(self.runner, 3.0, 1)
+        self.assertRating(self.trainer, 1.0, 1)
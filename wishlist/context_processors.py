@@ -1,14 +1,24 @@
-from .models import Wishlist
+from django.utils.functional import SimpleLazyObject
+from .models import WishlistItem
+
+# Header badge count, cached in the session; the wishlist views drop it on changes
+COUNT_SESSION_KEY = 'wishlist_count'
+
+
+def get_wishlist_count(request):
+    """Number of wishlist items, counted at most once per session until it changes"""
+    if not request.user.is_authenticated:
+        return 0
+    count = request.session.get(COUNT_SESSION_KEY)
+    if count is None:
+        count = request.session[COUNT_SESSION_KEY] = WishlistItem.objects.filter(wishlist__user=request.user).count()
+    return count
+
+
+def forget_wishlist_count(request):
+    request.session.pop(COUNT_SESSION_KEY, None)
 
 
 def wishlist(request):
-    """Make wishlist available in all templates"""
-    wishlist_count = 0
-    if request.user.is_authenticated:
-        try:
-            wishlist_obj = Wishlist.objects.get(user=request.user)
-            wishlist_count = wishlist_obj.total_items
-        except Wishlist.DoesNotExist:
-            pass
-    
-    return {'wishlist_count': wishlist_count}
+    """Make wishlist available in all templates (counted only when a template reads it)"""
+    return {'wishlist_count': SimpleLazyObject(lambda: get_wishlist_count(request))}
@@ -1,3 +1,51 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.template import RequestContext, Template
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from products.models import Category, Product
+from .context_processors import COUNT_SESSION_KEY
+from .models import Wishlist, WishlistItem
 
-# Create your tests here.
+
+class WishlistCountTests(TestCase):
+    """The header wishlist badge is counted lazily and recounted after changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        cls.runner, cls.trainer = [
+            Product.objects.create(name=name, slug=name.lower(), sku=name.upper(), description='',
+                                   category=category, price=100, stock=10)
+            for name in ('Runner', 'Trainer')
+        ]
+        cls.user = get_user_model().objects.create_user(username='shopper', password='x')
+        WishlistItem.objects.create(wishlist=Wishlist.objects.create(user=cls.user), product=cls.runner)
+
+    def render(self, source, request):
+        return Template(source).render(RequestContext(request))
+
+    def test_lazy(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = SessionStore()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render('{{ request.path }}', request), '/')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.render('{{ wishlist_count }}', request), '1')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render('{{ wishlist_count }}', request), '1')
+
+    def test_count_is_forgotten_after_add_and_remove(self):
+        self.client.login(username='shopper', password='x')
+        self.assertEqual(self.client.get(reverse('wishlist:wishlist_detail')).context['wishlist_count'], 1)
+        self.assertEqual(self.client.session[COUNT_SESSION_KEY], 1)
+
+        self.client.get(reverse('wishlist:add_to_wishlist', args=[self.trainer.id]))
+        self.assertNotIn(COUNT_SESSION_KEY, self.client.session)
+        self.assertEqual(self.client.get(reverse('wishlist:wishlist_detail')).context['wishlist_count'], 2)
+        self.assertEqual(self.client.session[COUNT_SESSION_KEY], 2)
+
+        self.client.get(reverse('wishlist:remove_from_wishlist', args=[self.runner.id]))
+        self.assertNotIn(COUNT_SESSION_KEY, self.client.session)
+        self.assertEqual(self.client.get(reverse('wishlist:wishlist_detail')).context['wishlist_count'], 1)
@@ -1,7 +1,9 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from .context_processors import forget_wishlist_count
 from .models import Wishlist, WishlistItem
+from products.images import prefetch_manifests
 from products.models import Product
 
 
@@ -9,7 +11,8 @@ from products.models import Product
 def wishlist_detail(request):
     """Wishlist page"""
     wishlist, created = Wishlist.objects.get_or_create(user=request.user)
-    items = wishlist.items.select_related('product')
+    items = list(wishlist.items.select_related('product'))
+    prefetch_manifests(item.product.main_image for item in items)
     
     return render(request, 'wishlist/wishlist_detail.html', {
         'wishlist': wishlist,
@@ -30,6 +33,7 @@ def add_to_wishlist(request, product_id):
     )
     
     if created:
+        forget_wishlist_count(request)
         messages.success(request, f'{product.name} added to wishlist!')
     else:
         messages.info(request, f'{product.name} is already in your wishlist.')
@@ -45,6 +49,7 @@ def remove_from_wishlist(request, product_id):
     
     product_name = item.product.name
     item.delete()
+    forget_wishlist_count(request)
     
     messages.success(request, f'{product_name} removed from wishlist!')
     return redirect('wishlist:wishlist_detail')